@@ -0,0 +1,222 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from BuildCache import BuildCache, builder_fingerprint
+from CarbBuilder import dihedral_rows, dot_angles, format_dihedrals, run_carbbuilder
+from CarbUtils import CarbUtils
+from ClashAnalysis import analyse_pdb
+from DatabaseManager import DatabaseManager
+from GlycanBuilder import build_structure
+from TemplateLibrary import TemplateLibrary
+
+
+def read_jobs(file_path):
+    """
+    Reads a batch file with one CASPER sequence per line, optionally followed by a saved configuration id.
+    Blank lines and lines starting with '#' are ignored.
+
+    :return: List of (sequence, config_id or None) tuples.
+    """
+    jobs = []
+    with open(file_path, 'r') as file:
+        for line in file:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            parts = line.split(None, 1)
+            jobs.append((parts[0], parts[1].strip() if len(parts) > 1 else None))
+    return jobs
+
+
+def sequence_dihedrals(sequence, dots=None):
+    """
+    Builds the dihedral file for a sequence the same way the Generate action does.
+
+    :param sequence: CASPER sequence.
+    :param dots: Saved configuration data mapping a connection to the [x, y] dot positions on its plot.
+    :return: Text of the dihedral file.
+    """
+    carb_builder = CarbUtils(sequence)
+    carb_builder.parse_sequence()
+    connections = list(dict.fromkeys(carb_builder.get_connections()))
+
+    angles = {}
+    for index, connection in enumerate(connections):
+        for x, y in (dots or {}).get(connection, []):
+            angles.setdefault(index, []).append(dot_angles(x, y))
+    return format_dihedrals(dihedral_rows(connections, angles))
+
+
+def build_batch(jobs, output_dir='batch_output', workers=None, repeats=None, timeout=None,
+                keep_scratch=False, db_name='carbFF3.db', progress=None, build_cache=None, dihedral_texts=None,
+                native=False, max_clash=None):
+    """
+    Builds many sequences concurrently, each in its own scratch directory.
+
+    :param jobs: List of (sequence, config_id or None) tuples.
+    :param output_dir: Directory the built PDBs and results.json are written to.
+    :param workers: Maximum number of CarbBuilder processes running at once, one per core if None.
+    :param repeats: Number of repeating units passed to CarbBuilder with -r.
+    :param timeout: Seconds after which a single build is killed.
+    :param keep_scratch: Keep each job's scratch directory instead of deleting it.
+    :param db_name: Database holding the saved configurations.
+    :param progress: Optional callable receiving each result as it finishes.
+    :param build_cache: BuildCache to reuse identical builds from, None to always run CarbBuilder.
+    :param dihedral_texts: Optional dihedral file contents, one per job, used instead of the job's configuration.
+    :param native: Build in process with GlycanBuilder where possible, falling back to CarbBuilder.
+    :param max_clash: Discard structures whose total clash overlap in Angstrom exceeds this, None to keep all.
+    :return: List of result dicts in job order, see run_carbbuilder. Results served from
+             the cache have 'cached' set, and built structures their 'clash_score'.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    db_manager = DatabaseManager(db_name)
+
+    prepared = []
+    results = [None] * len(jobs)
+    for index, (sequence, config_id) in enumerate(jobs):
+        try:
+            if dihedral_texts is not None:
+                prepared.append((index, sequence, dihedral_texts[index]))
+                continue
+            dots = None
+            if config_id is not None:
+                dots = db_manager.load_configuration(config_id)
+                if dots is None:
+                    raise KeyError(f"Configuration '{config_id}' not found")
+            prepared.append((index, sequence, sequence_dihedrals(sequence, dots)))
+        except Exception as e:
+            results[index] = {"sequence": sequence, "pdb_path": None, "final_linkages": [], "returncode": None,
+                              "stdout": "", "stderr": str(e), "wall_time": 0.0}
+            if progress:
+                progress(index, results[index])
+    db_manager.close()
+
+    fingerprint = builder_fingerprint() if build_cache is not None else None
+    if fingerprint and native:
+        # In process builds differ from CarbBuilder's, so they are cached separately
+        fingerprint += ":native"
+    builder = build_structure if native else run_carbbuilder
+    if native:
+        # Compile the template library once here rather than in every build thread
+        TemplateLibrary.load()
+
+    def screen(result):
+        """Scores the clashes of a built structure and discards it if they exceed max_clash."""
+        try:
+            result["clash_score"] = round(float(analyse_pdb(result["pdb_path"], result["sequence"])[1][0]), 3)
+        except (OSError, ValueError) as e:
+            result["clash_score"] = None
+            print(f"Error screening {result['pdb_path']} for clashes: {e}")
+            return result
+        if max_clash is not None and result["clash_score"] > max_clash:
+            os.remove(result["pdb_path"])
+            result["pdb_path"] = None
+            # On a line of its own, report() shows the last line of stderr as the reason
+            if result["stderr"]:
+                result["stderr"] += "\n"
+            result["stderr"] += f"Discarded, clash overlap {result['clash_score']:.2f} A exceeds {max_clash} A"
+        return result
+
+    def build(index, sequence, dihedral_text):
+        pdb_path = os.path.join(output_dir, f"job_{index:04d}.pdb")
+        if build_cache is not None:
+            key = BuildCache.make_key(sequence, repeats, dihedral_text, fingerprint)
+            cached = build_cache.get(key)
+            if cached:
+                try:
+                    shutil.copyfile(cached[0], pdb_path)
+                except OSError as e:
+                    # Evicted by another thread since the lookup, build it again instead
+                    print(f"Error copying cached build of {sequence}: {e}")
+                else:
+                    return screen({"sequence": sequence, "pdb_path": pdb_path, "final_linkages": cached[1],
+                                   "returncode": 0, "stdout": "", "stderr": "", "wall_time": 0.0, "cached": True})
+
+        work_dir = tempfile.mkdtemp(prefix=f"build_{index:04d}_")
+        try:
+            result = builder(sequence, work_dir, dihedral_text, repeats, timeout)
+            if result["pdb_path"]:
+                shutil.copyfile(result["pdb_path"], pdb_path)
+                result["pdb_path"] = pdb_path
+                if build_cache is not None:
+                    # A structure that built fine is not failed by a cache that cannot be written, e.g. on a full disk
+                    try:
+                        build_cache.put(key, pdb_path, result["final_linkages"])
+                    except OSError as e:
+                        print(f"Error caching build of {sequence}: {e}")
+            result["cached"] = False
+            return screen(result) if result["pdb_path"] else result
+        finally:
+            if not keep_scratch:
+                shutil.rmtree(work_dir, ignore_errors=True)
+
+    # Each job spends its time waiting on its own CarbBuilder process, so threads are enough to bound them
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        futures = {pool.submit(build, *job): job[0] for job in prepared}
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                results[index] = future.result()
+            except Exception as e:
+                results[index] = {"sequence": jobs[index][0], "pdb_path": None, "final_linkages": [],
+                                  "returncode": None, "stdout": "", "stderr": str(e), "wall_time": 0.0}
+            if progress:
+                progress(index, results[index])
+
+    for index, result in enumerate(results):
+        result["job"] = index
+        result["config_id"] = jobs[index][1]
+
+    with open(os.path.join(output_dir, "results.json"), 'w') as file:
+        json.dump([{key: value for key, value in result.items() if key != "stdout"} for result in results],
+                  file, indent=2)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build many CASPER sequences with CarbBuilder in parallel.")
+    parser.add_argument('jobs', help="file with one sequence per line, optionally followed by a configuration id")
+    parser.add_argument('-o', '--output-dir', default='batch_output', help="output directory (default: batch_output)")
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count(),
+                        help="number of builds to run at once (default: one per core)")
+    parser.add_argument('-r', '--repeats', type=int, help="number of repeating units to build")
+    parser.add_argument('--timeout', type=float, help="seconds before a single build is killed")
+    parser.add_argument('--keep-scratch', action='store_true', help="keep each job's scratch directory")
+    parser.add_argument('--db', default='carbFF3.db', help="database with saved configurations (default: carbFF3.db)")
+    parser.add_argument('--no-cache', action='store_true', help="always run CarbBuilder instead of reusing cached builds")
+    parser.add_argument('--native', action='store_true',
+                        help="build in process where possible instead of always running CarbBuilder")
+    parser.add_argument('--max-clash', type=float, help="discard structures whose clash overlap exceeds this (A)")
+    args = parser.parse_args()
+
+    jobs = read_jobs(args.jobs)
+    done = []
+
+    def report(index, result):
+        done.append(index)
+        reason = (result['stderr'].strip().splitlines() or ['no PDB built'])[-1]
+        status = "built" if result["pdb_path"] else f"failed ({reason})"
+        if result.get("cached") and result["pdb_path"]:
+            status = "cached"
+        if result.get("clash_score") is not None:
+            status += f", clash overlap {result['clash_score']:.2f} A"
+        print(f"[{len(done)}/{len(jobs)}] job {index} {result['sequence']}: {status} in {result['wall_time']:.2f} s")
+
+    start_time = time.perf_counter()
+    build_cache = None if args.no_cache else BuildCache()
+    results = build_batch(jobs, args.output_dir, args.workers, args.repeats, args.timeout, args.keep_scratch,
+                          args.db, report, build_cache, native=args.native,
+                          max_clash=args.max_clash)
+    failed = sum(1 for result in results if not result["pdb_path"])
+    print(f"Built {len(results) - failed} of {len(results)} structures in {time.perf_counter() - start_time:.2f} s")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
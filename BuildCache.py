@@ -0,0 +1,133 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from CarbBuilder import CARBBUILDER_DIR, CARBBUILDER_EXE
+
+# Files of structureFile that CarbBuilder builds from, as opposed to files written during a run
+TEMPLATE_EXTENSIONS = ('.pdb', '.rtf', '.psf')
+TEMPLATE_NAMES = ('mapping.txt', 'dihedral_defaults.txt', 'patches.txt')
+
+
+def builder_fingerprint(builder_dir=CARBBUILDER_DIR, builder_exe=CARBBUILDER_EXE):
+    """
+    Fingerprints the CarbBuilder binary and its residue templates from their names, sizes and
+    modification times, so cached builds are invalidated when either changes.
+
+    :return: Hex digest.
+    """
+    sha = hashlib.sha256()
+    structure_dir = os.path.join(builder_dir, 'structureFile')
+    paths = [builder_exe] + sorted(
+        os.path.join(structure_dir, name) for name in os.listdir(structure_dir)
+        if name.endswith(TEMPLATE_EXTENSIONS) or name in TEMPLATE_NAMES)
+    for path in paths:
+        stat = os.stat(path)
+        sha.update(f"{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns}\n".encode('utf-8'))
+    return sha.hexdigest()
+
+
+class BuildCache:
+    """
+    A persistent cache of CarbBuilder outputs. Each entry holds the built PDB and the
+    parsed 'FINAL linkage:' angles. Entries unused for longer than max_age are removed,
+    then the least recently used ones until the cache fits within max_bytes.
+    """
+
+    def __init__(self, cache_dir='build_cache', max_bytes=512 * 1024 * 1024, max_age=30 * 24 * 3600):
+        """
+        Initializes the cache and creates its directory if needed.
+
+        :param cache_dir: Directory holding one subdirectory per cached build.
+        :param max_bytes: Total size the cache may reach before old entries are removed.
+        :param max_age: Seconds an entry may go unused before it is removed.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(sequence, repeats, dihedral_text, fingerprint=None):
+        """
+        Builds the cache key of a build.
+
+        :param sequence: CASPER sequence.
+        :param repeats: Number of repeating units passed with -r, or None.
+        :param dihedral_text: Exact contents of the dihedral file used for the build.
+        :param fingerprint: builder_fingerprint() of the installation, computed if None.
+        :return: Hex digest identifying the build.
+        """
+        if fingerprint is None:
+            fingerprint = builder_fingerprint()
+        description = json.dumps([sequence, repeats, dihedral_text, fingerprint])
+        return hashlib.sha256(description.encode('utf-8')).hexdigest()
+
+    def _entry(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def get(self, key):
+        """
+        Looks up a build, marking it as recently used.
+
+        :return: Tuple of (cached PDB path, final linkages), or None if the build is not cached.
+        """
+        entry = self._entry(key)
+        try:
+            with open(os.path.join(entry, 'linkages.json'), 'r') as file:
+                final_linkages = json.load(file)
+            os.utime(entry)
+        except (OSError, ValueError):
+            return None
+        return os.path.join(entry, 'output.pdb'), final_linkages
+
+    def put(self, key, pdb_path, final_linkages):
+        """
+        Stores a built PDB and its final linkages, then evicts old entries.
+
+        :return: Path of the cached copy of the PDB.
+        :raises OSError: If the entry cannot be written, e.g. on a full disk.
+        """
+        temp_dir = tempfile.mkdtemp(prefix='.tmp_', dir=self.cache_dir)
+        try:
+            shutil.copyfile(pdb_path, os.path.join(temp_dir, 'output.pdb'))
+            with open(os.path.join(temp_dir, 'linkages.json'), 'w') as file:
+                json.dump(final_linkages, file)
+        except OSError:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            raise
+
+        try:
+            # Publish the complete entry in one step so readers never see half of it
+            os.rename(temp_dir, self._entry(key))
+        except OSError:
+            shutil.rmtree(temp_dir, ignore_errors=True)  # Stored concurrently by another build
+        self.evict()
+        return os.path.join(self._entry(key), 'output.pdb')
+
+    def evict(self):
+        """Removes expired entries, then least recently used ones while over max_bytes."""
+        now = time.time()
+        entries = []
+        total = 0
+        with os.scandir(self.cache_dir) as scan:
+            for entry in scan:
+                if not entry.is_dir() or entry.name.startswith('.'):
+                    continue
+                last_used = entry.stat().st_mtime
+                if now - last_used > self.max_age:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                    continue
+                size = sum(item.stat().st_size for item in os.scandir(entry.path))
+                entries.append((last_used, size, entry.path))
+                total += size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
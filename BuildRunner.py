@@ -0,0 +1,105 @@
+import os
+
+from PyQt6.QtCore import QObject, QProcess, QTimer, pyqtSignal
+
+from CarbBuilder import CARBBUILDER_DIR, carbbuilder_command, extract_final_linkages
+
+
+class BuildRunner(QObject):
+    """
+    Runs CarbBuilder in a QProcess so the window stays responsive during long builds.
+    Output lines are streamed as they arrive, and the build can be cancelled or time out.
+    """
+    output_line = pyqtSignal(str)
+    finished = pyqtSignal(str, list)
+    failed = pyqtSignal(str)
+
+    def __init__(self, sequence, output_name='output', dihedral_file=None, repeats=None, timeout=600, parent=None):
+        """
+        Initializes the runner for one build.
+
+        :param sequence: CASPER sequence to build.
+        :param output_name: Output name passed to CarbBuilder, relative to the CarbBuilder directory.
+        :param dihedral_file: Optional dihedral file passed with -d.
+        :param repeats: Optional number of repeating units passed with -r.
+        :param timeout: Seconds before the build is killed, None to wait forever.
+        :param parent: parent QObject.
+        """
+        super().__init__(parent)
+        self.command = carbbuilder_command(sequence, output_name, dihedral_file, repeats)
+        self.pdb_path = os.path.join(CARBBUILDER_DIR, output_name + '.pdb')
+        self.timeout = timeout
+        self.stdout = ''
+        self.stderr = ''
+        self._pending = ''
+        self._stop_reason = None
+
+        self.process = QProcess(self)
+        self.process.setWorkingDirectory(CARBBUILDER_DIR)
+        self.process.readyReadStandardOutput.connect(self._read_stdout)
+        self.process.readyReadStandardError.connect(self._read_stderr)
+        self.process.finished.connect(self._process_finished)
+        self.process.errorOccurred.connect(self._process_error)
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self._timed_out)
+
+    def start(self):
+        """Starts the build, removing any PDB left by a previous run."""
+        if os.path.exists(self.pdb_path):
+            os.remove(self.pdb_path)
+        self.process.start(self.command[0], self.command[1:])
+        if self.timeout:
+            self.timer.start(int(self.timeout * 1000))
+
+    def is_running(self):
+        return self.process.state() != QProcess.ProcessState.NotRunning
+
+    def cancel(self):
+        """Kills a running build. failed is emitted once the process has stopped."""
+        self._stop("Build cancelled")
+
+    def _timed_out(self):
+        self._stop(f"Build timed out after {self.timeout} s")
+
+    def _stop(self, reason):
+        if self.is_running():
+            self._stop_reason = reason
+            self.process.kill()
+
+    def _read_stdout(self):
+        text = self._pending + bytes(self.process.readAllStandardOutput()).decode(errors='replace')
+        self.stdout += text[len(self._pending):]
+        lines = text.split('\n')
+        # Keep an unfinished last line until the rest of it arrives
+        self._pending = lines.pop()
+        for line in lines:
+            if line.strip():
+                self.output_line.emit(line.strip())
+
+    def _read_stderr(self):
+        self.stderr += bytes(self.process.readAllStandardError()).decode(errors='replace')
+
+    def _process_finished(self, exit_code, exit_status):
+        self.timer.stop()
+        self._read_stdout()
+        self._read_stderr()
+        if self._pending.strip():
+            self.output_line.emit(self._pending.strip())
+        self._pending = ''
+
+        if self._stop_reason:
+            self.failed.emit(self._stop_reason)
+        elif self.stderr:
+            self.failed.emit(self.stderr)
+        elif "PDB file Built" in self.stdout and os.path.exists(self.pdb_path):
+            self.finished.emit(self.pdb_path, extract_final_linkages(self.stdout))
+        else:
+            self.failed.emit("The build was unsuccessful. Try different angles.\n\n" + self.stdout)
+
+    def _process_error(self, error):
+        # Crashes after a kill are reported through finished, only a failed start needs handling here
+        if error == QProcess.ProcessError.FailedToStart:
+            self.timer.stop()
+            self.failed.emit(f"Could not start CarbBuilder: {self.process.errorString()}")
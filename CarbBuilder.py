@@ -0,0 +1,172 @@
+import os
+import re
+import subprocess
+import sys
+import time
+
+from MakeDehidrils import make_dehidrals
+
+CARBBUILDER_DIR = "CBv2.1.45"
+CARBBUILDER_EXE = os.path.join(CARBBUILDER_DIR, "CarbBuilder2.exe")
+DIHEDRALS_PATH = os.path.join(CARBBUILDER_DIR, "structureFile", "dihedrals.txt")
+OUTPUT_PDB = os.path.join(CARBBUILDER_DIR, "output.pdb")
+
+_RESIDUE_NUMBER = re.compile(r"#\d+")
+# CarbBuilder prints 'FINAL linkage: #2 aDFuc (1->3) #1 bDMan: -70.5, 100.2', read back here without the numbers
+_FINAL_LINKAGE = re.compile(r"Linkage:\s*(\S+)\s*\(([^()\s-]+)->([^()\s]+)\)\s*(\S+),\s*Angles:\s*([-+\d.eE]+),?\s+([-+\d.eE]+)")
+
+
+def scale_coordinate(x):
+    """Converts a pixel position on a 300px plot tile to an angle in degrees."""
+    if 3 <= x <= 297:
+        return -60 / 49 * (x - 3) + 180
+    return None
+
+
+def dot_angles(x, y):
+    """
+    Converts the position of a dot placed on a plot tile to the dihedral angles it represents.
+
+    :return: Tuple of (phi, psi) in degrees.
+    """
+    return scale_coordinate(x) * -1, scale_coordinate(y)
+
+
+def angle_position(phi, psi):
+    """
+    Converts dihedral angles to the position of a dot on a plot tile, the inverse of dot_angles.
+
+    :return: Tuple of (x, y) in pixels.
+    """
+    return 3 + (180 + phi) * 49 / 60, 3 + (180 - psi) * 49 / 60
+
+
+def dihedral_rows(connections, angles):
+    """
+    Builds the rows of a CarbBuilder dihedral file.
+
+    :param connections: List of connections, e.g. ['aDFuc13bDMan'].
+    :param angles: Dict mapping a connection index to a list of (phi, psi) pairs to use.
+    :return: List of rows such as ['aDFuc 1 3 bDMan', '2', '-70.0 100.0'].
+    """
+    output = make_dehidrals(connections)
+    for index, pairs in angles.items():
+        for phi, psi in pairs:
+            output[index].append(f"{phi:.1f} {psi:.1f}")
+    return output
+
+
+def format_dihedrals(rows):
+    """Joins dihedral rows into the text of a dihedral file."""
+    return "".join(",".join(row) + "\n" for row in rows)
+
+
+def carbbuilder_command(sequence, output_name, dihedral_file=None, repeats=None):
+    """
+    Builds the command line for a CarbBuilder run, using mono outside Windows.
+
+    :param sequence: CASPER sequence to build.
+    :param output_name: Output name passed to -o, CarbBuilder appends .pdb.
+    :param dihedral_file: Optional dihedral file passed to -d.
+    :param repeats: Optional number of repeating units passed to -r.
+    """
+    exe = os.path.abspath(CARBBUILDER_EXE)
+    command = [exe] if sys.platform == "win32" else ["mono", exe]
+    command += ["-i", sequence]
+    if repeats:
+        command += ["-r", str(repeats)]
+    if dihedral_file:
+        command += ["-d", dihedral_file]
+    command += ["-o", output_name]
+    return command
+
+
+def extract_final_linkages(output):
+    """
+    Extracts the 'FINAL linkage:' lines reported by CarbBuilder.
+
+    :param output: Standard output of a CarbBuilder run.
+    :return: List of strings formatted as "Linkage: <linkage>, Angles: <angles>".
+    """
+    linkages = []
+
+    # Ensure output is a string
+    output = str(output)
+
+    for line in output.split('\n'):
+        # Look for lines that start with "FINAL linkage:"
+        if "FINAL linkage:" in line:
+            parts = line.strip().split("FINAL linkage:")[1].strip()
+
+            if ":" in parts:
+                linkage_info, angles_info = parts.split(":", 1)
+                linkage_info = linkage_info.strip()
+                angles_info = angles_info.strip()
+
+                # Format the output
+                linkage = f"Linkage: {linkage_info}, Angles: {angles_info}"
+                linkages.append(_RESIDUE_NUMBER.sub("", linkage))
+
+    return linkages
+
+
+def parse_final_linkage(linkage):
+    """
+    Reads the connection and angles back from a line returned by extract_final_linkages.
+
+    :param linkage: e.g. "Linkage:  aDFuc (1->3)  bDMan, Angles: -70.5, 100.2".
+    :return: Tuple of (connection, phi, psi), e.g. ('aDFuc13bDMan', -70.0, 100.0), or None if it cannot be read.
+    """
+    match = _FINAL_LINKAGE.match(linkage)
+    if not match:
+        return None
+    residue1, carbon1, carbon2, residue2, phi, psi = match.groups()
+    try:
+        return f"{residue1}{carbon1}{carbon2}{residue2}", float(phi), float(psi)
+    except ValueError:
+        return None
+
+
+def run_carbbuilder(sequence, work_dir, dihedral_text, repeats=None, timeout=None):
+    """
+    Runs one CarbBuilder build with its own dihedral file and output in work_dir.
+
+    :param sequence: CASPER sequence to build.
+    :param work_dir: Scratch directory for the dihedral file and the PDB.
+    :param dihedral_text: Contents of the dihedral file.
+    :param repeats: Optional number of repeating units.
+    :param timeout: Seconds to wait before the build is killed, None to wait forever.
+    :return: Dict with sequence, pdb_path (None if no PDB was built), final_linkages,
+             returncode, stdout, stderr and wall_time.
+    """
+    work_dir = os.path.abspath(work_dir)
+    dihedral_file = os.path.join(work_dir, "dihedrals.txt")
+    with open(dihedral_file, "w") as file:
+        file.write(dihedral_text)
+
+    output_name = os.path.join(work_dir, "output")
+    start_time = time.perf_counter()
+    try:
+        # Run from the CarbBuilder directory so it finds structureFile
+        process = subprocess.run(carbbuilder_command(sequence, output_name, dihedral_file, repeats),
+                                 cwd=CARBBUILDER_DIR, capture_output=True, text=True, timeout=timeout)
+        returncode, stdout, stderr = process.returncode, process.stdout, process.stderr
+    except subprocess.TimeoutExpired as e:
+        # Output captured before a timeout is always bytes
+        stdout = e.stdout.decode(errors="replace") if e.stdout else ""
+        returncode, stderr = None, f"Timed out after {timeout} s"
+    except OSError as e:
+        returncode, stdout, stderr = None, "", str(e)
+    wall_time = time.perf_counter() - start_time
+
+    pdb_path = output_name + ".pdb"
+    built = "PDB file Built" in str(stdout) and os.path.exists(pdb_path)
+    return {
+        "sequence": sequence,
+        "pdb_path": pdb_path if built else None,
+        "final_linkages": extract_final_linkages(stdout),
+        "returncode": returncode,
+        "stdout": stdout,
+        "stderr": stderr,
+        "wall_time": wall_time,
+    }
@@ -1,4 +1,123 @@
 import re
+from collections import namedtuple
+from functools import lru_cache
+
+# One alternative per token of a CASPER sequence, tried at each position in a single left to right pass
+_TOKEN = re.compile(r"""
+    (?P<branch_open>\[)
+  | (?P<branch_close>\])
+  | (?P<linkage>\((?P<c1>[\dO])-+>?(?P<c2>\d)\))
+                                        # linkage such as (1->4), (2->6) or (O->6)
+  | (?P<open_linkage>\((?:(?P<tail>[\dO])-+>?|-+>?(?P<tail_rev>[\dO]))$)
+                                        # open linkage ending a repeating unit, (1-> or (->1
+  | (?P<residue>[^\[\]()\s]+)
+  | (?P<space>\s+)
+""", re.VERBOSE)
+
+# Open linkage starting a repeating unit, e.g. ->6)
+_HEAD = re.compile(r"\s*-+>?(?P<head>\d)\)")
+
+CasperTree = namedtuple('CasperTree', ['residues', 'linkages', 'repeating'])
+CasperTree.__doc__ = """
+Parsed CASPER sequence.
+
+residues: Residue names in the order they appear in the sequence, substituents included.
+linkages: (child index, child carbon, parent carbon, parent index) tuples in the order the
+          child residues appear. A repeating unit adds the linkage from its last residue
+          back to its first one.
+repeating: The linkage closing the repeating unit, None if the sequence is not a repeating unit.
+"""
+
+
+@lru_cache(maxsize=256)
+def parse_casper(sequence):
+    """
+    Parses a CASPER sequence into a tree of residues and linkages.
+
+    A linkage joins the residue before it to the next residue on the same level. A branch
+    in square brackets ends with the linkage joining it to the residue after the bracket,
+    e.g. aDMan(1->6)[aDMan(1->2)]aDMan links both mannoses on the left to the last one.
+
+    :param sequence: CASPER sequence, e.g. 'aDMan(1->4)[aDGal(1->6)]aDGlc' or '->6)aDMan(1->4)aDGlc(1->'.
+    :return: CasperTree, shared between calls with the same sequence.
+    :raises ValueError: If the sequence is not valid CASPER.
+    """
+    residues = []
+    linkages = []
+    # Per nesting level, the (child, carbon) pairs waiting for the next residue on that level
+    levels = [[]]
+    last = None  # Index of the most recent residue on the current level
+    last_stack = []
+    first = None  # Index of the first residue on the top level
+    head = tail = None
+
+    position = 0
+    match = _HEAD.match(sequence)
+    if match:
+        head = match.group('head')
+        position = match.end()
+
+    while position < len(sequence):
+        match = _TOKEN.match(sequence, position)
+        if not match:
+            raise ValueError(f"Unexpected '{sequence[position]}' at position {position}")
+        position = match.end()
+        kind = match.lastgroup
+
+        if kind == 'residue':
+            if last is not None:
+                raise ValueError(f"Residue {residues[last]} is not linked to {match.group('residue')}")
+            index = len(residues)
+            residues.append(match.group('residue'))
+            for child, carbon in levels[-1]:
+                linkages.append((child, carbon[0], carbon[1], index))
+            levels[-1] = []
+            last = index
+            if first is None:
+                first = index
+        elif kind == 'linkage':
+            if last is None:
+                raise ValueError(f"Linkage at position {match.start()} does not follow a residue")
+            levels[-1].append((last, (match.group('c1'), match.group('c2'))))
+            last = None
+        elif kind == 'branch_open':
+            if last is not None:
+                raise ValueError(f"Residue {residues[last]} is not linked to the branch that follows it")
+            levels.append([])
+            last_stack.append(last)
+            last = None
+        elif kind == 'branch_close':
+            if len(levels) == 1:
+                raise ValueError(f"Unmatched ']' at position {match.start()}")
+            branch = levels.pop()
+            if last is not None or not branch:
+                raise ValueError(f"Branch closed at position {match.start()} does not end with a linkage")
+            levels[-1].extend(branch)
+            last = last_stack.pop()
+        elif kind == 'open_linkage':
+            if last is None or len(levels) > 1:
+                raise ValueError("Open linkage at the end does not follow a top level residue")
+            tail = match.group('tail') or match.group('tail_rev')
+
+    if len(levels) > 1:
+        raise ValueError("Unclosed '[' in sequence")
+    if levels[0]:
+        raise ValueError("Sequence ends with a linkage that is not attached to a residue")
+    if not residues:
+        raise ValueError("Sequence contains no residues")
+
+    if (head is None) != (tail is None):
+        raise ValueError("A repeating unit must start with '->n)' and end with '(n->'")
+    repeating = None
+    if head is not None:
+        # The residue at the reducing end links back to the first residue of the next unit
+        repeating = (last, tail, head, first)
+        linkages.append(repeating)
+
+    # Linkages are completed when their parent is read, list them in the order of their child residues instead
+    linkages.sort(key=lambda linkage: linkage[0])
+    return CasperTree(tuple(residues), tuple(linkages), repeating)
+
 
 class CarbUtils:
     """
@@ -14,18 +133,22 @@ class CarbUtils:
         self.casper_sequence = casper_sequence
         self.residues = []
         self.linkages = []
+        self.tree = None
 
     def parse_sequence(self):
         """
         Parses the carbohydrate sequence to extract residues and linkages.
-        If the sequence starts with "-", it denotes a repeating linkage.
+        If the sequence starts with "->", it denotes a repeating unit.
+
+        :raises ValueError: If the sequence is not valid CASPER.
         """
-        self.residues = self.extract_monosaccharides(self.casper_sequence)
-        self.linkages = re.findall(r'\d->\d', self.casper_sequence)
+        self.tree = parse_casper(self.casper_sequence.strip())
+        self.residues = list(self.tree.residues)
+        self.linkages = [f"{carbon1}->{carbon2}" for _, carbon1, carbon2, _ in self.tree.linkages]
 
-        if self.casper_sequence[0] == "-":
-            repeating_linkage = self.casper_sequence[-3] + "->" + self.casper_sequence[2]
-            self.linkages.append(repeating_linkage)
+        if self.tree.repeating:
+            _, carbon1, carbon2, _ = self.tree.repeating
+            self.repeating_linkage = f"{carbon1}->{carbon2}"
 
     def get_residues(self):
         return self.residues
@@ -33,16 +156,22 @@ class CarbUtils:
     def get_linkages(self):
         return self.linkages
 
+    def get_linkage_tuples(self):
+        """
+        Returns the linkages of the tree.
+
+        :return: List of (child index, child carbon, parent carbon, parent index) tuples, indexing get_residues().
+        """
+        return list(self.tree.linkages)
+
     def get_connections(self):
         """
-        Generates and returns unique connections between residues based on linkages.
+        Generates and returns connections between residues based on linkages.
 
-        :return: List of unique connections formatted as "residue1linkageresidue2".
+        :return: List of connections formatted as "residue1linkageresidue2", one per linkage.
         """
-        connections = []
-        for i, j, k in zip(self.residues, self.residues[1:], self.linkages):
-            connections.append(i + k.replace("->", "") + j)
-        return connections
+        return [f"{self.residues[child]}{carbon1}{carbon2}{self.residues[parent]}"
+                for child, carbon1, carbon2, parent in self.tree.linkages]
 
     def extract_monosaccharides(self, input_string):
         """
@@ -51,19 +180,4 @@ class CarbUtils:
         :param input_string: The carbohydrate sequence string.
         :return: List of monosaccharide substrings.
         """
-        substrings = []
-        if input_string[0] != "-":
-            input_string = ")" + input_string + "("
-        i = 0
-        while i < len(input_string):
-            if input_string[i] == ')' and '(' in input_string[i:]:
-                start_index = i + 1
-                end_index = input_string.find('(', start_index)
-                if end_index != -1:
-                    substrings.append(input_string[start_index:end_index])
-                    i = end_index + 1
-                else:
-                    i += 1
-            else:
-                i += 1
-        return substrings
\ No newline at end of file
+        return list(parse_casper(input_string.strip()).residues)
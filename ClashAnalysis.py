@@ -0,0 +1,305 @@
+import argparse
+import sys
+import time
+from collections import deque
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from CarbUtils import parse_casper
+from PDBReader import PDBReader
+
+# Van der Waals radii in Angstrom, hydrogen after Rowland and Taylor
+VDW_RADII = {'H': 1.10, 'C': 1.70, 'N': 1.55, 'O': 1.52, 'P': 1.80, 'S': 1.80}
+COVALENT_RADII = {'H': 0.31, 'C': 0.76, 'N': 0.71, 'O': 0.66, 'P': 1.07, 'S': 1.05}
+DEFAULT_VDW_RADIUS = 1.70
+DEFAULT_COVALENT_RADIUS = 0.76
+BOND_TOLERANCE = 0.45  # Added to the sum of covalent radii when bonds are inferred from distances
+VALENCES = {'H': 1, 'C': 4, 'N': 3, 'O': 2, 'P': 4, 'S': 2}
+
+# Overlap of the van der Waals spheres, in Angstrom, tolerated before a contact counts as a clash
+CLASH_TOLERANCE = 0.5
+# Hydroxyl hydrogens approach O and N acceptors much closer in hydrogen bonds
+HBOND_TOLERANCE = 1.0
+
+
+class ClashAnalysis:
+    """
+    Finds non-bonded contacts closer than the van der Waals radii allow between residues of
+    built structures, and attributes them to the glycosidic linkages that bring them together.
+
+    Bonds are inferred from the distances of the first frame. Residues are rigid templates, so
+    only contacts between different residues are checked, leaving out atoms bonded to each other
+    or to a common atom. A clash between two residues counts against every linkage on the path
+    between them, since changing any of those linkages moves them apart.
+    """
+
+    def __init__(self, names, elements, residues, coordinates, residue_labels=None):
+        """
+        Prepares the analysis of a molecule.
+
+        :param names: Atom names.
+        :param elements: Element symbols of the atoms.
+        :param residues: Residue number of each atom.
+        :param coordinates: (atoms, 3) array of a reference frame the bonds are inferred from.
+        :param residue_labels: Optional dict mapping a residue number to a label for linkage names.
+        """
+        self.names = list(names)
+        self.residues = np.asarray(residues)
+        elements = [element.capitalize() for element in elements]
+        atom_count = len(self.names)
+
+        vdw = np.array([VDW_RADII.get(element, DEFAULT_VDW_RADIUS) for element in elements])
+        covalent = np.array([COVALENT_RADII.get(element, DEFAULT_COVALENT_RADIUS) for element in elements])
+
+        valences = np.array([VALENCES.get(element, 4) for element in elements])
+        bonds = self._infer_bonds(np.asarray(coordinates, dtype=np.float64), covalent, valences)
+        neighbours = [set() for _ in range(atom_count)]
+        for i, j in bonds:
+            neighbours[i].add(j)
+            neighbours[j].add(i)
+
+        # 1-2 and 1-3 pairs across residues, encoded as i * atom_count + j with i < j
+        excluded = set()
+        for centre in range(atom_count):
+            group = neighbours[centre] | {centre}
+            for i in group:
+                for j in group:
+                    if i < j and self.residues[i] != self.residues[j]:
+                        excluded.add(i * atom_count + j)
+        self.excluded = np.array(sorted(excluded), dtype=np.int64)
+
+        polar_hydrogen = np.array([elements[i] == 'H' and any(elements[j] in ('O', 'N') for j in neighbours[i])
+                                   for i in range(atom_count)])
+        acceptor = np.array([element in ('O', 'N') for element in elements])
+        self.vdw = vdw
+        self.polar_hydrogen = polar_hydrogen
+        self.acceptor = acceptor
+        self.cutoff = 2 * vdw.max() - CLASH_TOLERANCE if atom_count else 0.0
+
+        self.linkages = []  # (child residue, child atom, parent residue, parent atom) per glycosidic bond
+        for i, j in bonds:
+            if self.residues[i] != self.residues[j]:
+                child, parent = (i, j) if self.names[i].startswith('C') else (j, i)
+                self.linkages.append((child, parent))
+        self.labels = [self._linkage_label(child, parent, residue_labels) for child, parent in self.linkages]
+        self._paths = self._linkage_paths()
+
+    def _infer_bonds(self, coordinates, covalent, valences):
+        """
+        Returns (i, j) bonds inferred from distances.
+
+        Within a residue every pair closer than its covalent radii is bonded. Between residues,
+        a clash can bring atoms as close as a bond, so only atoms with a free valence left by
+        the residue template, such as C1 and the Ox it is linked to, are paired, closest first.
+        """
+        if len(coordinates) < 2:
+            return []
+        tree = cKDTree(coordinates)
+        pairs = tree.query_pairs(2 * covalent.max() + BOND_TOLERANCE, output_type='ndarray')
+        distances = np.linalg.norm(coordinates[pairs[:, 0]] - coordinates[pairs[:, 1]], axis=1)
+        bonded = distances < covalent[pairs[:, 0]] + covalent[pairs[:, 1]] + BOND_TOLERANCE
+        pairs, distances = pairs[bonded], distances[bonded]
+
+        same_residue = self.residues[pairs[:, 0]] == self.residues[pairs[:, 1]]
+        bonds = [tuple(bond) for bond in pairs[same_residue].tolist()]
+        free = valences - np.bincount(pairs[same_residue].ravel(), minlength=len(coordinates))
+
+        inter_residue = pairs[~same_residue][np.argsort(distances[~same_residue], kind='stable')]
+        for i, j in inter_residue.tolist():
+            if free[i] > 0 and free[j] > 0:
+                bonds.append((i, j))
+                free[i] -= 1
+                free[j] -= 1
+        return bonds
+
+    def _linkage_label(self, child, parent, residue_labels):
+        """Names a linkage like the FINAL lines of CarbBuilder, e.g. 'aDFuc 1 3 bDMan'."""
+        child_residue, parent_residue = int(self.residues[child]), int(self.residues[parent])
+        carbon1, carbon2 = self.names[child].lstrip('CO'), self.names[parent].lstrip('CO')
+        if residue_labels and child_residue in residue_labels and parent_residue in residue_labels:
+            return f"{residue_labels[child_residue]} {carbon1} {carbon2} {residue_labels[parent_residue]}"
+        return f"#{child_residue} {carbon1} {carbon2} #{parent_residue}"
+
+    def _linkage_paths(self):
+        """
+        Builds a (residues, residues, linkages) array marking the linkages on the path between
+        each pair of residues.
+        """
+        residue_numbers = sorted(set(self.residues.tolist()))
+        self.residue_index = {number: index for index, number in enumerate(residue_numbers)}
+        count = len(residue_numbers)
+        adjacent = [[] for _ in range(count)]
+        for linkage, (child, parent) in enumerate(self.linkages):
+            a, b = self.residue_index[int(self.residues[child])], self.residue_index[int(self.residues[parent])]
+            adjacent[a].append((b, linkage))
+            adjacent[b].append((a, linkage))
+
+        paths = np.zeros((count, count, len(self.linkages)), dtype=bool)
+        for start in range(count):
+            seen = {start}
+            queue = deque([start])
+            while queue:
+                residue = queue.popleft()
+                for neighbour, linkage in adjacent[residue]:
+                    if neighbour not in seen:
+                        seen.add(neighbour)
+                        paths[start, neighbour] = paths[start, residue]
+                        paths[start, neighbour, linkage] = True
+                        queue.append(neighbour)
+        return paths
+
+    def contacts(self, coordinates):
+        """
+        Finds the clashes of one frame.
+
+        :param coordinates: (atoms, 3) array.
+        :return: Tuple of (pairs, overlaps): a (clashes, 2) array of atom indices and how far,
+                 in Angstrom, each pair is inside its clash distance.
+        """
+        atom_count = len(self.names)
+        pairs = cKDTree(coordinates).query_pairs(self.cutoff, output_type='ndarray')
+        if len(pairs) == 0:
+            return pairs.reshape(0, 2), np.zeros(0)
+        i, j = pairs[:, 0], pairs[:, 1]
+        keep = self.residues[i] != self.residues[j]
+        keep &= ~np.isin(np.minimum(i, j) * atom_count + np.maximum(i, j), self.excluded, assume_unique=False)
+        i, j = i[keep], j[keep]
+
+        hbond = (self.polar_hydrogen[i] & self.acceptor[j]) | (self.polar_hydrogen[j] & self.acceptor[i])
+        limit = self.vdw[i] + self.vdw[j] - np.where(hbond, HBOND_TOLERANCE, CLASH_TOLERANCE)
+        overlaps = limit - np.linalg.norm(coordinates[i] - coordinates[j], axis=1)
+        clashes = overlaps > 0
+        return np.column_stack([i[clashes], j[clashes]]), overlaps[clashes]
+
+    def score(self, coordinates):
+        """
+        Scores one frame.
+
+        :param coordinates: (atoms, 3) array.
+        :return: Tuple of (total overlap, per-linkage overlaps array in the order of self.labels, clash count).
+        """
+        pairs, overlaps = self.contacts(coordinates)
+        if len(overlaps) == 0:
+            return 0.0, np.zeros(len(self.linkages)), 0
+        index = np.vectorize(self.residue_index.get, otypes=[np.intp])
+        on_path = self._paths[index(self.residues[pairs[:, 0]]), index(self.residues[pairs[:, 1]])]
+        return float(overlaps.sum()), overlaps @ on_path, len(overlaps)
+
+    def screen(self, frames):
+        """
+        Scores every frame of a trajectory.
+
+        :param frames: (frames, atoms, 3) array, or a PDBReader to decode the frames one at a time.
+        :return: Tuple of (totals, per-linkage scores, clash counts) arrays with one row per frame.
+        :raises ValueError: If a frame does not hold the atoms of the molecule.
+        """
+        totals = np.zeros(len(frames))
+        per_linkage = np.zeros((len(frames), len(self.linkages)))
+        counts = np.zeros(len(frames), dtype=np.intp)
+        for frame, coordinates in enumerate(frames):
+            if len(coordinates) != len(self.names):
+                raise ValueError(f"Frame {frame + 1} holds {len(coordinates)} atoms instead of {len(self.names)}")
+            totals[frame], per_linkage[frame], counts[frame] = self.score(coordinates)
+        return totals, per_linkage, counts
+
+
+def residue_labels(sequence, residue_count):
+    """
+    Maps PDB residue numbers to CASPER residue names, assuming residues are numbered from 1 in
+    the order of the sequence.
+
+    :return: Dict mapping residue number to name, or None if the sequence does not match the count.
+    """
+    try:
+        residues = parse_casper(sequence.strip()).residues
+    except ValueError:
+        return None
+    if len(residues) != residue_count:
+        return None
+    return {index + 1: name for index, name in enumerate(residues)}
+
+
+def analyse_pdb(path, sequence=None):
+    """
+    Screens every frame of a PDB file for clashes.
+
+    :param path: PDB file, optionally with several MODELs such as CarbBuilder -all output.
+    :param sequence: CASPER sequence the structure was built from, used to name the linkages.
+    :return: Tuple of (ClashAnalysis, totals, per-linkage scores, clash counts), see ClashAnalysis.screen.
+    """
+    with PDBReader(path) as reader:
+        atoms = reader.atoms()
+        if not len(atoms["name"]):
+            raise ValueError(f"No atoms in {path}")
+        residues = atoms["residue"]
+        labels = residue_labels(sequence, len(set(residues.tolist()))) if sequence else None
+        analysis = ClashAnalysis(atoms["name"].tolist(), atoms["element"].tolist(), residues, reader[0], labels)
+        return (analysis,) + analysis.screen(reader)
+
+
+def clash_summary(path, sequence=None):
+    """
+    Describes the clashes of a built structure for the angles display.
+
+    :return: Text listing the clash score of each linkage, empty if the file cannot be read.
+    """
+    try:
+        analysis, totals, per_linkage, counts = analyse_pdb(path, sequence)
+    except (OSError, ValueError) as e:
+        print(f"Error screening {path} for clashes: {e}")
+        return ""
+    summary = f"\n\nClashes: {counts[0]}, total overlap {totals[0]:.2f} A"
+    if not analysis.labels:
+        return summary
+    lines = [f"{label}: {score:.2f} A" for label, score in zip(analysis.labels, per_linkage[0])]
+    return "\n\nClash scores (overlap beyond van der Waals contact):\n" + "\n".join(lines) + summary
+
+
+def write_frames(path, frames, output_path):
+    """
+    Copies the given MODELs of a PDB file to a new file, in the order given.
+
+    :param frames: Frame indices to keep.
+    """
+    with PDBReader(path) as reader, open(output_path, "w") as file:
+        for number, frame in enumerate(frames, start=1):
+            file.write(f"MODEL     {number:4d}\n")
+            file.writelines(line for line in reader.text(frame).splitlines(keepends=True)
+                            if line.startswith(("ATOM", "HETATM", "TER")))
+            file.write("ENDMDL\n")
+        file.write("END\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Screen built structures for steric clashes and rank their frames.")
+    parser.add_argument('pdb', help="PDB file, optionally with several MODELs")
+    parser.add_argument('-s', '--sequence', help="CASPER sequence the structure was built from, to name linkages")
+    parser.add_argument('--max-score', type=float, help="discard frames whose total overlap exceeds this (A)")
+    parser.add_argument('-n', '--top', type=int, default=10, help="number of ranked frames to list (default: 10)")
+    parser.add_argument('-o', '--output', help="write the kept frames, best first, to this PDB file")
+    args = parser.parse_args()
+
+    start_time = time.perf_counter()
+    try:
+        analysis, totals, per_linkage, counts = analyse_pdb(args.pdb, args.sequence)
+    except (OSError, ValueError) as e:
+        print(f"Cannot screen {args.pdb}: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    order = np.argsort(totals, kind='stable')
+    if args.max_score is not None:
+        order = order[totals[order] <= args.max_score]
+    print(f"Screened {len(totals)} frames in {time.perf_counter() - start_time:.2f} s, "
+          f"{len(order)} kept, {int(np.sum(totals == 0))} without clashes")
+    for frame in order[:args.top]:
+        worst = int(np.argmax(per_linkage[frame])) if len(analysis.labels) else None
+        detail = f", worst linkage {analysis.labels[worst]}" if worst is not None and per_linkage[frame, worst] else ""
+        print(f"frame {frame + 1}: {counts[frame]} clashes, overlap {totals[frame]:.2f} A{detail}")
+
+    if args.output:
+        write_frames(args.pdb, order, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,33 @@
-from PyQt6.QtCore import pyqtSignal, Qt
-from PyQt6.QtGui import QMouseEvent, QPen, QBrush
+from PyQt6.QtCore import pyqtSignal, Qt, QPointF, QRectF
+from PyQt6.QtGui import QMouseEvent, QPen, QBrush, QColor, QFont, QPainterPath, QPolygonF
 from PyQt6.QtWidgets import QGraphicsView, QGraphicsScene, QGraphicsPixmapItem
 
+from ContourRenderer import label_position
+
+# Size of the square plot area in scene coordinates, matching a plot image scaled to 300 px
+PLOT_SIZE = 300
+
+
+def contour_paths(contours):
+    """
+    Converts contour lines into painter paths, one per level. Paths are not tied to a scene,
+    so this can run in a worker thread.
+
+    :param contours: List of (level, color, lines) tuples, see ContourRenderer.contour_lines.
+    :return: List of (level, color, QPainterPath, label positions) tuples.
+    """
+    paths = []
+    for level, color, lines in contours:
+        path = QPainterPath()
+        labels = []
+        for line in lines:
+            path.addPolygon(QPolygonF([QPointF(x, y) for x, y in line.tolist()]))
+            position = label_position(line)
+            if position is not None:
+                labels.append(tuple(position.tolist()))
+        paths.append((level, color, path, labels))
+    return paths
+
 
 class ClickableGraphicsView(QGraphicsView):
     """
@@ -9,25 +35,56 @@ class ClickableGraphicsView(QGraphicsView):
     """
 
     clicked = pyqtSignal(int, int)
+    hovered = pyqtSignal(float, float)
+    dots_changed = pyqtSignal()
 
-    def __init__(self, pixmap, molecule_id, parent=None):
+    def __init__(self, pixmap, molecule_id, parent=None, contours=None):
         """
         Initializes the ClickableGraphicsView with a pixmap and molecule ID.
 
-        :param pixmap: QPixmap to be displayed in the view.
+        :param pixmap: QPixmap to be displayed in the view, or None to draw contours instead.
         :param molecule_id: Identifier for the molecule related to this view.
         :param parent: parent widget.
+        :param contours: Contour paths drawn when no pixmap is given, see contour_paths.
         """
         super().__init__(parent)
         self.scene = QGraphicsScene(self)
         self.setScene(self.scene)
-        self.pixmap_item = QGraphicsPixmapItem(pixmap)
-        self.scene.addItem(self.pixmap_item)
+        self.pixmap_item = None
+        if pixmap is not None:
+            self.pixmap_item = QGraphicsPixmapItem(pixmap)
+            self.scene.addItem(self.pixmap_item)
+        else:
+            self.scene.setSceneRect(QRectF(0, 0, PLOT_SIZE, PLOT_SIZE))
+            self.scene.setBackgroundBrush(QBrush(Qt.GlobalColor.white))
+            self.draw_contours(contours or [])
         self.setFixedHeight(306)
 
         self.dots = []
         self.molecule_id = molecule_id
 
+        # Report the position under the mouse even when no button is pressed
+        self.setMouseTracking(True)
+
+    def draw_contours(self, contours):
+        """
+        Draws contour paths and their level labels.
+
+        :param contours: List of (level, color, QPainterPath, label positions) tuples, see contour_paths.
+        """
+        font = QFont()
+        font.setPixelSize(7)
+        for level, color, path, labels in contours:
+            pen = QPen(QColor(color))
+            pen.setCosmetic(True)  # Keep lines one pixel wide when the view is zoomed
+            self.scene.addPath(path, pen)
+
+            for x, y in labels:
+                label = self.scene.addSimpleText(f"{level:g}", font)
+                label.setBrush(QBrush(QColor(color)))
+                bounds = label.boundingRect()
+                label.setPos(x - bounds.width() / 2, y - bounds.height() / 2)
+
     def mousePressEvent(self, event: QMouseEvent):
         """
         Handles mouse press events. Emits a signal with the click coordinates and adds or removes dots.
@@ -40,8 +97,19 @@ class ClickableGraphicsView(QGraphicsView):
             dot_clicked = self.handle_dot_click(click_pos)
             if not dot_clicked:
                 self.add_dot(click_pos)
+            self.dots_changed.emit()
         super().mousePressEvent(event)
 
+    def mouseMoveEvent(self, event: QMouseEvent):
+        """
+        Handles mouse move events. Emits a signal with the scene coordinates under the mouse.
+
+        :param event: The QMouseEvent representing the mouse move event.
+        """
+        pos = self.mapToScene(event.pos())
+        self.hovered.emit(pos.x(), pos.y())
+        super().mouseMoveEvent(event)
+
     def add_dot(self, pos):
         """
         Adds a dot to the scene at the specified position.
@@ -72,8 +140,26 @@ class ClickableGraphicsView(QGraphicsView):
 
         return dot_clicked
 
+    def set_molecule_id(self, molecule_id):
+        """
+        Changes the molecule ID of the view and of the dots already placed on it.
+
+        :param molecule_id: New identifier, the position of the linkage in the connections list.
+        """
+        self.molecule_id = molecule_id
+        for dot in self.dots:
+            dot.setData(0, molecule_id)
+
     def clear_dots(self):
         """Clear all existing dots from the view."""
         for dot in self.dots:
             self.scene.removeItem(dot)
-        self.dots.clear()
\ No newline at end of file
+        self.dots.clear()
+
+    def dot_positions(self):
+        """Returns the centres of the dots as [x, y] scene coordinates."""
+        positions = []
+        for dot in self.dots:
+            center = dot.boundingRect().center()
+            positions.append([center.x(), center.y()])
+        return positions
@@ -0,0 +1,70 @@
+import threading
+from collections import OrderedDict
+
+import contourpy
+import numpy as np
+import scipy.ndimage
+
+from CarbBuilder import angle_position
+
+# Settings every plot depends on, shared with the matplotlib renderer of PlotPMF
+SMOOTHING_SIGMA = 1
+CONTOUR_LEVELS = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
+# matplotlib's coolwarm colormap sampled at each level, as the PNG plots draw them
+CONTOUR_COLORS = ['#3b4cc0', '#5d7ce6', '#82a6fb', '#aac7fd', '#cdd9ec',
+                  '#ead4c8', '#f7b89c', '#f18d6f', '#d95847', '#b40426']
+# Lines need at least this many vertices to get a level label
+LABEL_MIN_VERTICES = 12
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_CACHE_SIZE = 256
+
+
+def contour_lines(grid, levels=CONTOUR_LEVELS, sigma=SMOOTHING_SIGMA):
+    """
+    Computes the contour lines of a smoothed PMF in plot tile coordinates, where phi runs
+    from -180 at x=3 to 180 at x=297 and psi from 180 at y=3 to -180 at y=297, the same
+    mapping dots are read back with. Results are cached by the digest of the grid.
+
+    :param grid: PMFGrid to contour.
+    :param levels: Energies to draw contour lines at.
+    :param sigma: Gaussian smoothing applied before contouring.
+    :return: List of (level, color, lines) tuples, lines being (N, 2) arrays of x, y positions.
+    """
+    key = (grid.digest(), tuple(levels), sigma)
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None:
+            _cache.move_to_end(key)
+            return cached
+
+    # Rows of the energy grid have constant phi
+    x, y = angle_position(*np.meshgrid(grid.phi, grid.psi, indexing='ij'))
+    z = scipy.ndimage.gaussian_filter(np.asarray(grid.energy, dtype=np.float64), sigma=sigma)
+    generator = contourpy.contour_generator(x, y, z, line_type=contourpy.LineType.Separate)
+
+    colors = _level_colors(len(levels))
+    result = [(level, color, [line for line in generator.lines(level) if len(line) > 1])
+              for level, color in zip(levels, colors)]
+
+    with _cache_lock:
+        _cache[key] = result
+        if len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+    return result
+
+
+def label_position(line):
+    """Returns the vertex halfway along a contour line where its level is labelled, or None if it is too short."""
+    if len(line) < LABEL_MIN_VERTICES:
+        return None
+    return line[len(line) // 2]
+
+
+def _level_colors(count):
+    """Spreads the coolwarm samples over count levels, as matplotlib normalises them."""
+    if count == len(CONTOUR_COLORS):
+        return CONTOUR_COLORS
+    positions = np.linspace(0, len(CONTOUR_COLORS) - 1, count) if count > 1 else [0]
+    return [CONTOUR_COLORS[int(round(position))] for position in positions]
@@ -1,25 +1,129 @@
 import sqlite3
 import os
 import json
+import hashlib
+import atexit
+import threading
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from PMFGrid import PMFGrid
+from PMFMinima import find_minima
+
+
+def load_pmf_source(file_path):
+    """
+    Read a .pmf file once, hashing its contents and parsing it into a grid.
+    Module level so it can run in a process pool.
+
+    :param file_path: Path to the .pmf file.
+    :return: Tuple of (sha256 hex digest, PMFGrid).
+    """
+    with open(file_path, 'rb') as file:
+        contents = file.read()
+    sha256 = hashlib.sha256(contents).hexdigest()
+    return sha256, PMFGrid.from_points(PMFGrid.parse_points(contents.decode('utf-8')))
+
+
+class _ThreadConnections:
+    """The database connections opened by one thread, closed when that thread exits."""
+
+    def __init__(self):
+        self.connections = {}
+
+    def close(self):
+        for conn in self.connections.values():
+            conn.close()
+        self.connections.clear()
+
+    def __del__(self):
+        self.close()
+
 
 class DatabaseManager:
-    _instance = None
+    """
+    Access to the PMF and configuration database.
+
+    Each thread gets one connection per database, opened on first use and reused
+    by every DatabaseManager created on that thread for the life of the process.
+    Connections use WAL journaling so a render worker can read while the UI
+    thread saves configurations.
+    """
+    _local = threading.local()
+    _thread_connections = weakref.WeakSet()
+    _schema_checked = set()
+    _lock = threading.Lock()
 
     def __init__(self, db_name='carbFF3.db'):
-        """Initialize the database connection and create the table if it doesn't exist."""
-        self.conn = sqlite3.connect(db_name)
+        """Attach to this thread's connection to the database, creating the tables on first use."""
+        self.db_name = os.path.abspath(db_name)
+        self.conn = self._connection(self.db_name)
         self.cursor = self.conn.cursor()
-        self._create_table()
+
+        with DatabaseManager._lock:
+            if self.db_name not in DatabaseManager._schema_checked:
+                self._create_table()
+                DatabaseManager._schema_checked.add(self.db_name)
+
+    @classmethod
+    def _connection(cls, db_name):
+        """Return the calling thread's connection to db_name, opening it if needed."""
+        thread_connections = getattr(cls._local, 'connections', None)
+        if thread_connections is None:
+            thread_connections = _ThreadConnections()
+            cls._local.connections = thread_connections
+            with cls._lock:
+                cls._thread_connections.add(thread_connections)
+
+        conn = thread_connections.connections.get(db_name)
+        if conn is None:
+            # check_same_thread is off only so shutdown() can close every thread's connection
+            conn = sqlite3.connect(db_name, timeout=10, check_same_thread=False, cached_statements=256)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            thread_connections.connections[db_name] = conn
+        return conn
+
+    @classmethod
+    def shutdown(cls):
+        """Close every open connection, e.g. when the application exits."""
+        with cls._lock:
+            for thread_connections in list(cls._thread_connections):
+                thread_connections.close()
+            cls._schema_checked.clear()
 
     def _create_table(self):
         """Create the pmfs and configurations tables if they don't already exist."""
+        self.cursor.execute("SELECT name FROM pragma_table_info('pmfs')")
+        columns = {row[0] for row in self.cursor.fetchall()}
+        if 'data' in columns:
+            # Tables written by older versions hold JSON text, convert them first
+            self._migrate_json_pmfs()
+        self._create_pmfs_table()
+
         self.cursor.execute('''
-        CREATE TABLE IF NOT EXISTS pmfs (
+        CREATE TABLE IF NOT EXISTS pmf_sources (
             file_id TEXT PRIMARY KEY,
-            data TEXT
+            mtime REAL,
+            size INTEGER,
+            sha256 TEXT
         )
         ''')
 
+        # Local minima of each smoothed PMF, ranked from the lowest energy, for automatic angle selection
+        self.cursor.execute('''
+        CREATE TABLE IF NOT EXISTS pmf_minima (
+            file_id TEXT,
+            rank INTEGER,
+            phi REAL,
+            psi REAL,
+            energy REAL,
+            PRIMARY KEY (file_id, rank)
+        ) WITHOUT ROWID
+        ''')
+
         self.cursor.execute('''
                 CREATE TABLE IF NOT EXISTS configurations (
                     config_id TEXT PRIMARY KEY,
@@ -29,6 +133,33 @@ class DatabaseManager:
                 ''')
         self.conn.commit()
 
+    def _create_pmfs_table(self):
+        """Create the pmfs table holding one float32 energy grid per linkage."""
+        self.cursor.execute('''
+        CREATE TABLE IF NOT EXISTS pmfs (
+            file_id TEXT PRIMARY KEY,
+            phi_origin REAL,
+            phi_step REAL,
+            phi_count INTEGER,
+            psi_origin REAL,
+            psi_step REAL,
+            psi_count INTEGER,
+            energy BLOB
+        )
+        ''')
+
+    def _migrate_json_pmfs(self):
+        """Convert a pmfs table storing JSON point lists into the binary grid format."""
+        self.cursor.execute('SELECT file_id, data FROM pmfs')
+        rows = [(file_id, self.convert_json_to_data(json_data)) for file_id, json_data in self.cursor.fetchall()]
+
+        self.cursor.execute('DROP TABLE pmfs')
+        self.cursor.execute('DROP TABLE IF EXISTS pmf_minima')
+        self._create_pmfs_table()
+        for file_id, data in rows:
+            self.insert_data_into_db(file_id, data, commit=False)
+        self.conn.commit()
+
     def save_configuration(self, config_id, molecule_name, config_data):
         """Save a configuration to the database, including the molecule name."""
         json_data = self.convert_data_to_json(config_data)
@@ -52,24 +183,16 @@ class DatabaseManager:
 
     def load_configuration(self, config_id):
         """Load a configuration from the database by config_id."""
-        self.cursor.execute('SELECT config_data FROM configurations WHERE config_id = ?', (config_id,))
+        self.cursor.execute('SELECT data FROM configurations WHERE config_id = ?', (config_id,))
         result = self.cursor.fetchone()
         if result:
             return json.loads(result[0])
         return None
 
     def read_file_data(self, file_path):
-        """Read coordinate data from a file and return it as a list of tuples."""
+        """Read coordinate data from a file and return it as an (N, 3) array of (x, y, z) rows."""
         with open(file_path, 'r') as file:
-            lines = file.readlines()
-            data = []
-            for line in lines:
-                if "#" in line or line == "\n":
-                    continue
-                parts = line.split()
-                x, y, z = map(float, parts)
-                data.append((x, y, z))
-            return data
+            return PMFGrid.parse_points(file.read())
 
     def convert_data_to_json(self, data):
         """Convert a list of coordinate tuples to a JSON string."""
@@ -79,54 +202,179 @@ class DatabaseManager:
         """Convert a JSON string to a list of coordinate tuples."""
         return json.loads(json_data)
 
-    def insert_data_into_db(self, file_id, data):
-        """Insert a list of coordinate tuples into the database as a JSON string if not already present."""
-        json_data = self.convert_data_to_json(data)
-
+    def insert_data_into_db(self, file_id, data, commit=True):
+        """Insert a PMFGrid or a list of coordinate tuples into the database as a float32 grid if not already present."""
         # Check if the file_id already exists in the table
         self.cursor.execute('SELECT COUNT(*) FROM pmfs WHERE file_id = ?', (file_id,))
         exists = self.cursor.fetchone()[0]
 
         # Insert the data only if the file_id does not exist
         if exists == 0:
-            self.cursor.execute('INSERT INTO pmfs (file_id, data) VALUES (?, ?)', (file_id, json_data))
-            self.conn.commit()
-
-    def process_files(self, file_directory):
-        """Process all files in a directory and insert their data into the database."""
-        for file_name in os.listdir(file_directory):
-            if file_name.endswith('.pmf'):
-                file_path = os.path.join(file_directory, file_name)
-                file_id = os.path.splitext(file_name)[0]  # Extract file name
-                data = self.read_file_data(file_path)
-                self.insert_data_into_db(file_id, data)
+            grid = data if isinstance(data, PMFGrid) else PMFGrid.from_points(data)
+            self.cursor.execute(
+                'INSERT INTO pmfs (file_id, phi_origin, phi_step, phi_count, psi_origin, psi_step, psi_count, energy) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (file_id, *grid.metadata(), grid.energy.astype('<f4').tobytes())
+            )
+            if commit:
+                self.conn.commit()
+
+    def process_files(self, file_directory, workers=None):
+        """
+        Import the .pmf files in a directory that are new or have changed since the last import.
+
+        Files whose modification time and size match the previous import are skipped without
+        being read. The remaining files are hashed and parsed in parallel, and every changed
+        grid is written in a single transaction.
+
+        :param file_directory: Directory containing .pmf files.
+        :param workers: Number of parsing processes, one per core if None.
+        :return: Number of PMFs inserted or updated.
+        """
+        self.cursor.execute('SELECT file_id, mtime, size, sha256 FROM pmf_sources')
+        sources = {file_id: (mtime, size, sha256) for file_id, mtime, size, sha256 in self.cursor.fetchall()}
+        stored = set(self.list_file_ids())
+
+        candidates = []
+        with os.scandir(file_directory) as scan:
+            for entry in scan:
+                if not entry.name.endswith('.pmf'):
+                    continue
+                file_id = os.path.splitext(entry.name)[0]  # Extract file name
+                stat = entry.stat()
+                known = sources.get(file_id)
+                if file_id in stored and known and known[:2] == (stat.st_mtime, stat.st_size):
+                    continue
+                candidates.append((file_id, entry.path, stat.st_mtime, stat.st_size))
+
+        if not candidates:
+            return 0
+
+        paths = [path for _, path, _, _ in candidates]
+        if len(candidates) == 1:
+            results = [self._load_source(paths[0])]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(self._load_source, paths))
+
+        grid_rows = []
+        minima_rows = []
+        source_rows = []
+        for (file_id, path, mtime, size), (sha256, grid, error) in zip(candidates, results):
+            if error is not None:
+                print(f"Skipping {path}: {error}")
+                continue
+            source_rows.append((file_id, mtime, size, sha256))
+            known = sources.get(file_id)
+            if file_id in stored and known and known[2] == sha256:
+                continue  # Touched but unchanged
+            grid_rows.append((file_id, *grid.metadata(), grid.energy.astype('<f4').tobytes()))
+            minima_rows.extend(self._minima_rows(file_id, grid))
+
+        with self.conn:
+            self.cursor.executemany(
+                'INSERT INTO pmfs (file_id, phi_origin, phi_step, phi_count, psi_origin, psi_step, psi_count, energy) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT(file_id) DO UPDATE SET phi_origin = excluded.phi_origin, phi_step = excluded.phi_step, '
+                'phi_count = excluded.phi_count, psi_origin = excluded.psi_origin, psi_step = excluded.psi_step, '
+                'psi_count = excluded.psi_count, energy = excluded.energy',
+                grid_rows
+            )
+            self.cursor.executemany('DELETE FROM pmf_minima WHERE file_id = ?', [row[:1] for row in grid_rows])
+            self.cursor.executemany('INSERT INTO pmf_minima (file_id, rank, phi, psi, energy) VALUES (?, ?, ?, ?, ?)',
+                                    minima_rows)
+            self.cursor.executemany(
+                'INSERT INTO pmf_sources (file_id, mtime, size, sha256) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT(file_id) DO UPDATE SET mtime = excluded.mtime, size = excluded.size, '
+                'sha256 = excluded.sha256',
+                source_rows
+            )
+        return len(grid_rows)
+
+    @staticmethod
+    def _load_source(file_path):
+        """Load a .pmf file, returning (sha256, grid, error) so one bad file does not stop an import."""
+        try:
+            return (*load_pmf_source(file_path), None)
+        except (OSError, ValueError) as e:
+            return None, None, e
+
+    def list_file_ids(self):
+        """Return the file_id of every PMF stored in the database."""
+        self.cursor.execute('SELECT file_id FROM pmfs ORDER BY file_id')
+        return [row[0] for row in self.cursor.fetchall()]
 
     def query_data_by_file(self, file_id):
-        """Query and return all coordinate data associated with a specific file_id."""
-        self.cursor.execute('SELECT data FROM pmfs WHERE file_id = ?', (file_id,))
+        """Query and return the 2D energy grid (rows of constant phi) for a specific file_id."""
+        grid = self.query_grid_by_file(file_id)
+        if grid is not None:
+            return grid.energy
+        return None
+
+    def query_grid_by_file(self, file_id):
+        """
+        Query the grid stored for a specific file_id.
+
+        :param file_id: Name of the linkage, e.g. 'aDFuc13bDMan'.
+        :return: PMFGrid instance, or None if not found.
+        """
+        self.cursor.execute(
+            'SELECT phi_origin, phi_step, phi_count, psi_origin, psi_step, psi_count, energy '
+            'FROM pmfs WHERE file_id = ?', (file_id,))
         result = self.cursor.fetchone()
         if result:
-            json_data = result[0]
-            return self.convert_json_to_data(json_data)
+            *metadata, blob = result
+            return PMFGrid.from_metadata(*metadata, np.frombuffer(blob, dtype='<f4'))
         return None
 
+    def query_minima_by_file(self, file_id):
+        """
+        Query the local minima of the smoothed PMF of a specific file_id, computing and
+        storing them first if the PMF was imported without them.
+
+        :param file_id: Name of the linkage, e.g. 'aDFuc13bDMan'.
+        :return: List of (phi, psi, energy) tuples from the lowest energy up, empty if the PMF is not found.
+        """
+        self.cursor.execute('SELECT phi, psi, energy FROM pmf_minima WHERE file_id = ? ORDER BY rank', (file_id,))
+        minima = self.cursor.fetchall()
+        if minima:
+            return minima
+
+        grid = self.query_grid_by_file(file_id)
+        if grid is None:
+            return []
+        rows = self._minima_rows(file_id, grid)
+        with self.conn:
+            self.cursor.executemany('INSERT OR REPLACE INTO pmf_minima (file_id, rank, phi, psi, energy) '
+                                    'VALUES (?, ?, ?, ?, ?)', rows)
+        return [row[2:] for row in rows]
+
+    @staticmethod
+    def _minima_rows(file_id, grid):
+        """Ranked pmf_minima rows of a grid."""
+        return [(file_id, rank, phi, psi, energy) for rank, (phi, psi, energy) in enumerate(find_minima(grid))]
+
     def close(self):
-        """Close the database connection."""
-        self.conn.close()
+        """Release this manager. The thread's connection stays open for reuse until shutdown()."""
+        self.cursor.close()
+
+
+atexit.register(DatabaseManager.shutdown)
 
 
 # Example Usage
 if __name__ == "__main__":
     db_manager = DatabaseManager()
 
-    # Process all files in a directory
-    db_manager.process_files('PMF')  # Update with your directory path
+    # Import new or changed files in a directory
+    imported = db_manager.process_files('PMF')  # Update with your directory path
+    print(f"Imported {imported} PMF files")
 
     # Query data for a specific file
     data = db_manager.query_data_by_file('aDFuc13bDMan')
-    if data:
-        for row in data:
-            print(row)
+    if data is not None:
+        print(data.shape)
+        print(data)
 
     # Close the database connection
     db_manager.close()
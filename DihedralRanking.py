@@ -0,0 +1,199 @@
+import argparse
+import os
+import sys
+import time
+from collections import Counter
+
+import numpy as np
+
+from BatchBuilder import build_batch
+from BuildCache import BuildCache
+from CarbBuilder import dot_angles
+from CarbUtils import CarbUtils
+from DatabaseManager import DatabaseManager
+from EnergyLookup import EnergyLookup
+from MakeDehidrils import DihedralTable, make_dehidrals, split_connection
+
+DEFAULT_TOP_K = 10
+
+
+def linkage_alternatives(connections, dots=None):
+    """
+    Collects the angle sets each linkage can be built with: the default and alternates of
+    the dihedral file followed by any angles picked on the plots.
+
+    :param connections: List of distinct connections.
+    :param dots: Saved configuration data mapping a connection to the [x, y] dot positions on its plot.
+    :return: List with one list of angle tuples, (phi, psi) or (phi, psi, omega), per connection.
+    """
+    table = DihedralTable.load()
+    alternatives = []
+    for connection in connections:
+        _, angle_sets = table.lookup(*split_connection(connection))
+        angle_sets = list(angle_sets) + [dot_angles(x, y) for x, y in (dots or {}).get(connection, [])]
+        # The same angles listed twice would only produce duplicate combinations
+        alternatives.append(list(dict.fromkeys(tuple(angles) for angles in angle_sets)))
+    return alternatives
+
+
+def alternative_energies(connections, alternatives, lookup, weights=None):
+    """
+    Scores every angle set of every linkage on its PMF.
+
+    :param connections: List of distinct connections.
+    :param alternatives: Angle sets per connection, see linkage_alternatives.
+    :param lookup: EnergyLookup the energies are read from.
+    :param weights: Number of times each connection occurs in the molecule, 1 each if None.
+    :return: List with one array of energies per connection. Linkages without a PMF score 0.
+    """
+    energies = []
+    for index, (connection, angle_sets) in enumerate(zip(connections, alternatives)):
+        if not angle_sets:
+            energies.append(np.zeros(0))
+            continue
+        phi, psi = np.array([angles[:2] for angles in angle_sets], dtype=np.float64).T
+        try:
+            energy = lookup.energy(connection, phi, psi)
+        except KeyError:
+            energy = np.zeros(len(angle_sets))
+        energies.append(energy * (weights[index] if weights else 1))
+    return energies
+
+
+def rank_combinations(energies, top_k=DEFAULT_TOP_K):
+    """
+    Finds the combinations of one alternative per linkage with the lowest summed energy.
+
+    Linkages are added one at a time by broadcasting the partial sums against the energies of
+    the next linkage. Only the top_k best partial combinations are kept after each step: the
+    remaining linkages add the same energies to every partial combination, so one outside the
+    top_k can never finish inside it. The work is bounded by top_k times the number of
+    alternatives instead of their product.
+
+    :param energies: List with one array of alternative energies per linkage.
+    :param top_k: Number of combinations to return.
+    :return: Tuple of (choices, totals): choices is a (k, linkages) array of alternative indices
+             and totals the summed energies in ascending order, k <= top_k.
+    """
+    totals = np.zeros(1)
+    choices = np.zeros((1, 0), dtype=np.intp)
+    for energy in energies:
+        if len(energy) == 0:
+            # A linkage without alternatives is built with CarbBuilder's own defaults
+            choices = np.column_stack([choices, np.full(len(choices), -1, dtype=np.intp)])
+            continue
+        candidates = (totals[:, None] + np.asarray(energy)[None, :]).ravel()
+        keep = candidates.size if candidates.size <= top_k else top_k
+        best = np.argpartition(candidates, keep - 1)[:keep] if keep < candidates.size else np.arange(keep)
+        best = best[np.argsort(candidates[best], kind='stable')]
+        parent, alternative = np.divmod(best, len(energy))
+        totals = candidates[best]
+        choices = np.column_stack([choices[parent], alternative])
+    return choices, totals
+
+
+def combination_dihedrals(connections, alternatives, choice):
+    """
+    Formats the dihedral file that builds a single combination.
+
+    :param connections: List of distinct connections.
+    :param alternatives: Angle sets per connection, see linkage_alternatives.
+    :param choice: Index of the chosen angle set per connection, -1 for none.
+    :return: Text of the dihedral file.
+    """
+    lines = []
+    for row, angle_sets, index in zip(make_dehidrals(connections), alternatives, choice):
+        if index >= 0:
+            row.append(" ".join(f"{angle:.1f}" for angle in angle_sets[index]))
+        lines.append(",".join(row) + "\n")
+    return "".join(lines)
+
+
+def rank_sequence(sequence, top_k=DEFAULT_TOP_K, dots=None, lookup=None):
+    """
+    Ranks the dihedral combinations of a sequence by summed PMF energy.
+
+    :param sequence: CASPER sequence.
+    :param top_k: Number of combinations to keep.
+    :param dots: Saved configuration data adding plot angles to the alternatives.
+    :param lookup: EnergyLookup to reuse, a new one on carbFF3.db if None.
+    :return: Tuple of (connections, alternatives, choices, totals), see rank_combinations.
+    """
+    carb_builder = CarbUtils(sequence)
+    carb_builder.parse_sequence()
+    occurrences = Counter(carb_builder.get_connections())
+    # CarbBuilder's dihedral file holds one entry per connection type, shared by its repeats
+    connections = list(occurrences)
+
+    lookup = lookup or EnergyLookup()
+    alternatives = linkage_alternatives(connections, dots)
+    energies = alternative_energies(connections, alternatives, lookup,
+                                    [occurrences[connection] for connection in connections])
+    choices, totals = rank_combinations(energies, top_k)
+    return connections, alternatives, choices, totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rank dihedral alternative combinations by summed PMF energy "
+                                                 "and build only the best ones.")
+    parser.add_argument('sequence', help="CASPER sequence")
+    parser.add_argument('-k', '--top', type=int, default=DEFAULT_TOP_K,
+                        help=f"number of combinations to keep (default: {DEFAULT_TOP_K})")
+    parser.add_argument('-c', '--config', help="saved configuration whose plot angles are added as alternatives")
+    parser.add_argument('-o', '--output-dir', default='ranking', help="output directory (default: ranking)")
+    parser.add_argument('--db', default='carbFF3.db', help="PMF database (default: carbFF3.db)")
+    parser.add_argument('--build', action='store_true', help="build the ranked combinations with CarbBuilder")
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count(),
+                        help="number of builds to run at once (default: one per core)")
+    parser.add_argument('--timeout', type=float, help="seconds before a single build is killed")
+    parser.add_argument('--native', action='store_true',
+                        help="build in process where possible instead of always running CarbBuilder")
+    args = parser.parse_args()
+
+    start_time = time.perf_counter()
+    dots = None
+    if args.config:
+        db_manager = DatabaseManager(args.db)
+        dots = db_manager.load_configuration(args.config)
+        db_manager.close()
+        if dots is None:
+            print(f"Configuration '{args.config}' not found", file=sys.stderr)
+            sys.exit(1)
+
+    try:
+        connections, alternatives, choices, totals = rank_sequence(args.sequence, args.top, dots,
+                                                                   EnergyLookup(args.db))
+    except ValueError as e:
+        print(f"Cannot rank {args.sequence}: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    combinations = 1
+    for angle_sets in alternatives:
+        combinations *= max(len(angle_sets), 1)
+    print(f"Ranked {combinations} combinations over {len(connections)} linkages in "
+          f"{time.perf_counter() - start_time:.2f} s")
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    dihedral_texts = []
+    for rank, (choice, total) in enumerate(zip(choices, totals)):
+        text = combination_dihedrals(connections, alternatives, choice)
+        with open(os.path.join(args.output_dir, f"dihedrals_{rank:04d}.txt"), 'w') as file:
+            file.write(text)
+        dihedral_texts.append(text)
+        print(f"{rank}: {total:.2f} kcal/mol  " + "  ".join(
+            f"{connection} {'default' if index < 0 else alternatives[column][index]}"
+            for column, (connection, index) in enumerate(zip(connections, choice))))
+
+    if args.build:
+        jobs = [(args.sequence, args.config)] * len(dihedral_texts)
+        results = build_batch(jobs, os.path.join(args.output_dir, "structures"), args.workers, timeout=args.timeout,
+                              db_name=args.db, build_cache=BuildCache(), dihedral_texts=dihedral_texts,
+                              native=args.native)
+        failed = sum(1 for result in results if not result["pdb_path"])
+        print(f"Built {len(results) - failed} of {len(results)} structures in "
+              f"{time.perf_counter() - start_time:.2f} s")
+        sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
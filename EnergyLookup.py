@@ -0,0 +1,103 @@
+from collections import OrderedDict
+
+import numpy as np
+import scipy.ndimage
+
+from DatabaseManager import DatabaseManager
+
+# Smoothing of the surfaces energies are read from, the same as the contour plots
+LOOKUP_SIGMA = 1
+
+
+class EnergyLookup:
+    """
+    Reads PMF energies at arbitrary phi/psi angles by interpolating the smoothed grid of
+    each linkage, wrapping around at +-180 degrees.
+
+    Smoothed surfaces are kept for the most recently used linkages, so repeated lookups,
+    e.g. while the mouse moves over a plot, only pay for the interpolation.
+    """
+
+    def __init__(self, db_name='carbFF3.db', sigma=LOOKUP_SIGMA, order=1, max_surfaces=64):
+        """
+        Initializes the lookup.
+
+        :param db_name: Database holding the PMF grids.
+        :param sigma: Gaussian smoothing applied to each grid, 0 to interpolate the raw energies.
+        :param order: Interpolation order, 1 for bilinear or 3 for bicubic spline interpolation.
+        :param max_surfaces: Number of smoothed surfaces kept in memory.
+        """
+        self.db_name = db_name
+        self.sigma = sigma
+        self.order = order
+        self.max_surfaces = max_surfaces
+        self._surfaces = OrderedDict()
+
+    def energy(self, connection, phi, psi):
+        """
+        Interpolates the energy of a linkage at the given angles.
+
+        :param connection: Linkage name, e.g. 'aDFuc13bDMan'.
+        :param phi: Scalar or array of phi angles (degrees).
+        :param psi: Scalar or array of psi angles (degrees), broadcast against phi.
+        :return: Energy as a float for scalar angles, otherwise an array shaped like the broadcast angles.
+        :raises KeyError: If the database has no PMF for the linkage.
+        """
+        origin, step, values, mode = self._surface(connection)
+        phi, psi = np.broadcast_arrays(np.asarray(phi, dtype=np.float64), np.asarray(psi, dtype=np.float64))
+        coordinates = np.stack([(phi - origin[0]) / step[0], (psi - origin[1]) / step[1]]).reshape(2, -1)
+        if mode == 'grid-wrap':
+            coordinates %= np.array(values.shape, dtype=np.float64)[:, None]
+
+        energy = scipy.ndimage.map_coordinates(values, coordinates, order=self.order, mode=mode, prefilter=False)
+        return float(energy[0]) if phi.ndim == 0 else energy.reshape(phi.shape)
+
+    def total_energy(self, angles):
+        """
+        Sums the energies of several linkages.
+
+        :param angles: Iterable of (connection, phi, psi) tuples.
+        :return: Tuple of (total energy, list of per-linkage energies with None for linkages without a PMF).
+        """
+        energies = []
+        for connection, phi, psi in angles:
+            try:
+                energies.append(self.energy(connection, phi, psi))
+            except KeyError:
+                energies.append(None)
+        return sum(energy for energy in energies if energy is not None), energies
+
+    def clear(self):
+        """Forgets the cached surfaces, e.g. after the PMFs were re-imported."""
+        self._surfaces.clear()
+
+    def _surface(self, connection):
+        """Returns (origin, step, interpolation values, boundary mode) of a linkage, smoothing its grid on first use."""
+        surface = self._surfaces.get(connection)
+        if surface is not None:
+            self._surfaces.move_to_end(connection)
+            return surface
+
+        db_manager = DatabaseManager(self.db_name)
+        grid = db_manager.query_grid_by_file(connection)
+        db_manager.close()
+        if grid is None:
+            raise KeyError(f"No PMF data for {connection}")
+
+        phi, psi, energy = grid.periodic()
+        steps = (grid.step(grid.phi), grid.step(grid.psi))
+        # Grids covering the full circle wrap around, others are extended with their edge values
+        periodic = all(step and np.isclose(count * step, 360.0) for count, step in zip(energy.shape, steps))
+        mode = 'grid-wrap' if periodic else 'nearest'
+
+        values = np.asarray(energy, dtype=np.float64)
+        if self.sigma:
+            values = scipy.ndimage.gaussian_filter(values, sigma=self.sigma, mode='wrap' if periodic else 'nearest')
+        if self.order > 1:
+            values = scipy.ndimage.spline_filter(values, order=self.order, mode=mode)
+
+        surface = ((phi[0], psi[0]), tuple(step or 1.0 for step in steps), values, mode)
+        self._surfaces[connection] = surface
+        if len(self._surfaces) > self.max_surfaces:
+            self._surfaces.popitem(last=False)
+        return surface
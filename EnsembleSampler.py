@@ -0,0 +1,184 @@
+import argparse
+import csv
+import os
+import sys
+import time
+from collections import Counter
+
+import numpy as np
+
+from BatchBuilder import build_batch
+from BuildCache import BuildCache
+from CarbUtils import CarbUtils
+from DatabaseManager import DatabaseManager
+from EnergyLookup import EnergyLookup
+from MakeDehidrils import make_dehidrals
+
+# Gas constant in kcal/(mol K), the unit of the PMF energies
+GAS_CONSTANT = 0.0019872041
+
+
+def boltzmann_probabilities(grid, temperature=300.0):
+    """
+    Turns a PMF into the probability of each of its grid cells.
+
+    :param grid: PMFGrid with energies in kcal/mol.
+    :param temperature: Temperature in K.
+    :return: Tuple of (phi, psi, probabilities) for one period of the grid, probabilities shaped (len(phi), len(psi)).
+    """
+    phi, psi, energy = grid.periodic()
+    energy = np.asarray(energy, dtype=np.float64)
+    # Shifting by the minimum keeps exp() in range without changing the distribution
+    weights = np.exp(-(energy - energy.min()) / (GAS_CONSTANT * temperature))
+    return phi, psi, weights / weights.sum()
+
+
+def sample_angles(grid, count, temperature=300.0, rng=None, jitter=True):
+    """
+    Draws phi/psi pairs from the Boltzmann distribution of a PMF.
+
+    :param grid: PMFGrid to sample.
+    :param count: Number of pairs to draw.
+    :param temperature: Temperature in K.
+    :param rng: numpy Generator, a new unseeded one if None.
+    :param jitter: Spread each sample uniformly over its grid cell instead of using the cell centre.
+    :return: Tuple of (phi, psi) arrays of length count, in degrees within [-180, 180).
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    phi, psi, probabilities = boltzmann_probabilities(grid, temperature)
+    cells = rng.choice(probabilities.size, size=count, p=probabilities.ravel())
+    i, j = np.divmod(cells, len(psi))
+
+    phi_samples = phi[i]
+    psi_samples = psi[j]
+    if jitter:
+        phi_samples = phi_samples + rng.uniform(-0.5, 0.5, count) * grid.step(grid.phi)
+        psi_samples = psi_samples + rng.uniform(-0.5, 0.5, count) * grid.step(grid.psi)
+    return _wrap(phi_samples), _wrap(psi_samples)
+
+
+def sample_ensemble(sequence, count, temperature=300.0, seed=None, db_name='carbFF3.db', lookup=None):
+    """
+    Draws joint dihedral assignments for every linkage of a molecule.
+
+    Each distinct connection is sampled independently from its own PMF. CarbBuilder's dihedral
+    file holds one entry per connection type, so repeated connections share their angles.
+
+    :param sequence: CASPER sequence.
+    :param count: Number of structures to sample.
+    :param temperature: Temperature in K.
+    :param seed: Seed of the random generator, for reproducible ensembles.
+    :param db_name: Database holding the PMF grids.
+    :param lookup: EnergyLookup the sample energies are read from, a new one on db_name if None.
+    :return: Tuple of (connections, phi, psi, energy): phi and psi are (count, len(connections))
+             arrays and energy holds the summed PMF energy of each sample, counting every
+             linkage of the molecule as the energy summary of the GUI does.
+    :raises KeyError: If a connection has no PMF in the database.
+    """
+    carb_builder = CarbUtils(sequence)
+    carb_builder.parse_sequence()
+    counts = Counter(carb_builder.get_connections())
+    connections = list(counts)
+    lookup = lookup or EnergyLookup(db_name)
+
+    rng = np.random.default_rng(seed)
+    db_manager = DatabaseManager(db_name)
+    phi = np.empty((count, len(connections)))
+    psi = np.empty((count, len(connections)))
+    energy = np.zeros(count)
+    try:
+        for column, connection in enumerate(connections):
+            grid = db_manager.query_grid_by_file(connection)
+            if grid is None:
+                raise KeyError(f"No PMF data for {connection}")
+            phi[:, column], psi[:, column] = sample_angles(grid, count, temperature, rng)
+            energy += counts[connection] * lookup.energy(connection, phi[:, column], psi[:, column])
+    finally:
+        db_manager.close()
+    return connections, phi, psi, energy
+
+
+def ensemble_dihedrals(connections, phi, psi):
+    """
+    Formats one CarbBuilder dihedral file per sample, in the format print_dot_positions writes.
+
+    :param connections: Connections of the molecule.
+    :param phi: (samples, len(connections)) array of phi angles.
+    :param psi: (samples, len(connections)) array of psi angles.
+    :return: List of dihedral file texts.
+    """
+    prefixes = [",".join(row) for row in make_dehidrals(connections)]
+    return ["".join(f"{prefix},{a:.1f} {b:.1f}\n" for prefix, a, b in zip(prefixes, phi_row, psi_row))
+            for phi_row, psi_row in zip(phi.tolist(), psi.tolist())]
+
+
+def write_ensemble(output_dir, connections, phi, psi, energy, dihedral_texts):
+    """
+    Writes the dihedral file of each sample and a samples.csv table of all angles and energies.
+
+    :return: List of the dihedral file paths.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for index, text in enumerate(dihedral_texts):
+        path = os.path.join(output_dir, f"dihedrals_{index:04d}.txt")
+        with open(path, 'w') as file:
+            file.write(text)
+        paths.append(path)
+
+    with open(os.path.join(output_dir, "samples.csv"), 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(["sample", "energy"] + [f"{connection} {angle}" for connection in connections
+                                                for angle in ("phi", "psi")])
+        for index in range(len(energy)):
+            angles = np.column_stack([phi[index], psi[index]]).ravel()
+            writer.writerow([index, f"{energy[index]:.3f}"] + [f"{angle:.1f}" for angle in angles])
+    return paths
+
+
+def _wrap(angles):
+    """Wraps angles into [-180, 180)."""
+    return np.mod(angles + 180.0, 360.0) - 180.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sample a Boltzmann ensemble of conformers from the linkage PMFs.")
+    parser.add_argument('sequence', help="CASPER sequence")
+    parser.add_argument('-n', '--count', type=int, default=1000, help="number of structures (default: 1000)")
+    parser.add_argument('-T', '--temperature', type=float, default=300.0, help="temperature in K (default: 300)")
+    parser.add_argument('-o', '--output-dir', default='ensemble', help="output directory (default: ensemble)")
+    parser.add_argument('--seed', type=int, help="random seed for a reproducible ensemble")
+    parser.add_argument('--db', default='carbFF3.db', help="PMF database (default: carbFF3.db)")
+    parser.add_argument('--build', action='store_true', help="build every sample with CarbBuilder")
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count(),
+                        help="number of builds to run at once (default: one per core)")
+    parser.add_argument('--timeout', type=float, help="seconds before a single build is killed")
+    parser.add_argument('--native', action='store_true',
+                        help="build in process where possible instead of always running CarbBuilder")
+    args = parser.parse_args()
+
+    start_time = time.perf_counter()
+    try:
+        connections, phi, psi, energy = sample_ensemble(args.sequence, args.count, args.temperature, args.seed,
+                                                        args.db)
+    except (KeyError, ValueError) as e:
+        print(f"Cannot sample {args.sequence}: {e}", file=sys.stderr)
+        sys.exit(1)
+    dihedral_texts = ensemble_dihedrals(connections, phi, psi)
+    write_ensemble(args.output_dir, connections, phi, psi, energy, dihedral_texts)
+    print(f"Sampled {args.count} structures over {len(connections)} linkages in "
+          f"{time.perf_counter() - start_time:.2f} s, written to {args.output_dir}")
+
+    if args.build:
+        jobs = [(args.sequence, None)] * args.count
+        results = build_batch(jobs, os.path.join(args.output_dir, "structures"), args.workers, timeout=args.timeout,
+                              db_name=args.db, build_cache=BuildCache(), dihedral_texts=dihedral_texts,
+                              native=args.native)
+        failed = sum(1 for result in results if not result["pdb_path"])
+        print(f"Built {len(results) - failed} of {len(results)} structures in "
+              f"{time.perf_counter() - start_time:.2f} s")
+        sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
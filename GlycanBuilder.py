@@ -0,0 +1,211 @@
+import os
+import time
+
+import numpy as np
+
+from CarbBuilder import run_carbbuilder
+from CarbUtils import parse_casper
+from MakeDehidrils import DihedralTable, parse_angles, split_connection
+from TemplateLibrary import TemplateLibrary
+
+# C1-O-Cx angle of the glycosidic linkage
+GLYCOSIDIC_ANGLE = 117.0
+
+
+class UnsupportedSequence(ValueError):
+    """Raised for a valid sequence that cannot be built from the residue templates alone."""
+
+
+def place_atom(a, b, c, bond, angle, torsion):
+    """
+    Places atom d from three reference atoms (natural extension reference frame).
+
+    :param bond: Length of the c-d bond.
+    :param angle: b-c-d angle in degrees.
+    :param torsion: a-b-c-d dihedral in degrees.
+    :return: Position of d.
+    """
+    angle, torsion = np.radians(angle), np.radians(torsion)
+    bc = (c - b) / np.linalg.norm(c - b)
+    normal = np.cross(b - a, bc)
+    normal /= np.linalg.norm(normal)
+    return c + bond * (-np.cos(angle) * bc
+                       + np.sin(angle) * np.cos(torsion) * np.cross(normal, bc)
+                       + np.sin(angle) * np.sin(torsion) * normal)
+
+
+def superpose(mobile, target):
+    """
+    Finds the rigid-body transform that best maps points onto a target (Kabsch algorithm).
+
+    :param mobile: (n, 3) array of points to move.
+    :param target: (n, 3) array of their target positions.
+    :return: Tuple of (rotation, translation) such that mobile @ rotation.T + translation ~ target.
+    """
+    mobile_centre = mobile.mean(axis=0)
+    target_centre = target.mean(axis=0)
+    u, _, vt = np.linalg.svd((mobile - mobile_centre).T @ (target - target_centre))
+    # Flip the last axis if needed so the result is a rotation rather than a reflection
+    sign = np.sign(np.linalg.det(vt.T @ u.T))
+    rotation = vt.T @ np.diag([1.0, 1.0, sign]) @ u.T
+    return rotation, target_centre - mobile_centre @ rotation.T
+
+
+def dihedral(a, b, c, d):
+    """Returns the a-b-c-d dihedral in degrees."""
+    b0, b1, b2 = a - b, c - b, d - c
+    b1 = b1 / np.linalg.norm(b1)
+    v = b0 - np.dot(b0, b1) * b1
+    w = b2 - np.dot(b2, b1) * b1
+    return float(np.degrees(np.arctan2(np.dot(np.cross(b1, v), w), np.dot(v, w))))
+
+
+def read_dihedral_angles(dihedral_text):
+    """
+    Reads the angles a CarbBuilder dihedral file sets.
+
+    :param dihedral_text: Rows such as 'aDFuc 1 3 bDMan,2,-70.0 100.0,...'.
+    :return: Dict mapping a connection, e.g. 'aDFuc13bDMan', to its count and first angle set.
+             Rows without angles are left out.
+    """
+    angles = {}
+    for line in dihedral_text.splitlines():
+        fields = line.split(",")
+        key = fields[0].split()
+        if len(fields) < 3 or len(key) != 4:
+            continue
+        angle_sets = parse_angles(fields[2:])
+        if angle_sets:
+            angles.setdefault("".join(key), (fields[1].strip(), angle_sets[0]))
+    return angles
+
+
+def build_glycan(sequence, angles=None, library=None):
+    """
+    Builds a linear or branched glycan in process from the CarbBuilder residue templates.
+
+    The residue at the reducing end keeps its template coordinates and every other residue is
+    placed on its parent by a rigid-body transform. Phi and psi use the hydrogen convention,
+    H1-C1-O-Cx and C1-O-Cx-Hx, the same as the PMFs and the CarbBuilder dihedral files.
+    Unlike CarbBuilder, the angles are used as given, without adjusting them to relieve clashes.
+
+    :param sequence: CASPER sequence.
+    :param angles: Dict mapping a connection to its (count, angle set), see read_dihedral_angles.
+                   Connections missing from it use the default of Dihedrals/dihedrals.txt.
+    :param library: TemplateLibrary to read the templates from, the shared one if None.
+    :return: Tuple of (PDB text, final linkages formatted like extract_final_linkages).
+    :raises ValueError: If the sequence is not valid CASPER.
+    :raises UnsupportedSequence: If the sequence needs anything the templates alone cannot
+                                 provide, e.g. ketoses, 1->6 linkages, substituents or repeating units.
+    """
+    tree = parse_casper(sequence.strip())
+    if tree.repeating:
+        raise UnsupportedSequence("Repeating units are built by CarbBuilder")
+    library = library or TemplateLibrary.load()
+    angles = angles or {}
+    table = DihedralTable.load()
+
+    templates = []
+    for residue in tree.residues:
+        if residue not in library:
+            raise UnsupportedSequence(f"No template for residue {residue}")
+        templates.append(library.template(residue))
+
+    children = {}
+    for linkage in tree.linkages:
+        children.setdefault(linkage[3], []).append(linkage)
+    child_indices = {linkage[0] for linkage in tree.linkages}
+    roots = [index for index in range(len(tree.residues)) if index not in child_indices]
+    if len(roots) != 1:
+        raise UnsupportedSequence("Only a single tree of residues can be built")
+
+    coordinates = {roots[0]: templates[roots[0]].coordinates}
+    removed = {index: set() for index in range(len(templates))}
+    final_linkages = []
+    pending = [roots[0]]
+    while pending:
+        parent = pending.pop()
+        for child, carbon1, carbon2, _ in children.get(parent, []):
+            connection = f"{tree.residues[child]}{carbon1}{carbon2}{tree.residues[parent]}"
+            if connection in angles:
+                count, angle_set = angles[connection]
+            else:
+                count, angle_sets = table.lookup(*split_connection(connection))
+                angle_set = angle_sets[0] if angle_sets else None
+            if carbon2 == "6" or count != "2" or not angle_set:
+                raise UnsupportedSequence(f"Linkage {connection} needs an omega angle or has no default angles")
+            phi, psi = angle_set[:2]
+
+            coordinates[child] = _place_residue(templates[child], carbon1, templates[parent],
+                                                coordinates[parent], carbon2, phi, psi)
+            removed[child].update((f"O{carbon1}", f"HO{carbon1}"))
+            removed[parent].add(f"HO{carbon2}")
+            final_linkages.append(f"Linkage:  {tree.residues[child]} ({carbon1}->{carbon2})  {tree.residues[parent]}, "
+                                  f"Angles: {phi:.1f}, {psi:.1f}")
+            pending.append(child)
+
+    lines = []
+    serial = 1
+    for index, template in enumerate(templates):
+        for name, (label, tail), (x, y, z) in zip(template.names, template.records, coordinates[index].tolist()):
+            if name in removed[index]:
+                continue
+            lines.append(f"ATOM  {serial:5d} {label[:4]} {label[5:9]:<4}{index + 1:5d}    "
+                         f"{x:8.3f}{y:8.3f}{z:8.3f}{tail}\n")
+            serial += 1
+    lines.append("END\n")
+    return "".join(lines), final_linkages
+
+
+def _place_residue(child, carbon1, parent, parent_coordinates, carbon2, phi, psi):
+    """
+    Moves a child residue template onto the Ox oxygen of its parent.
+
+    :return: (atoms, 3) array of child coordinates.
+    :raises UnsupportedSequence: If either template lacks an atom the linkage is defined by.
+    """
+    try:
+        parent_atoms = [parent.names.index(name) for name in (f"C{carbon2}", f"O{carbon2}", f"H{carbon2}")]
+        child_atoms = [child.names.index(name) for name in (f"O{carbon1}", f"C{carbon1}", f"H{carbon1}")]
+    except ValueError:
+        raise UnsupportedSequence(f"Templates lack the atoms of the {carbon1}->{carbon2} linkage")
+
+    carbon, oxygen, hydrogen = parent_coordinates[parent_atoms]
+    child_oxygen, child_carbon, child_hydrogen = child.coordinates[child_atoms]
+    bond = np.linalg.norm(child_carbon - child_oxygen)
+    anomeric = place_atom(hydrogen, carbon, oxygen, bond, GLYCOSIDIC_ANGLE, psi)
+
+    h_bond = np.linalg.norm(child_hydrogen - child_carbon)
+    h_angle = np.degrees(np.arccos(np.dot(child_oxygen - child_carbon, child_hydrogen - child_carbon)
+                                   / (bond * h_bond)))
+    anomeric_hydrogen = place_atom(carbon, oxygen, anomeric, h_bond, h_angle, phi)
+
+    rotation, translation = superpose(child.coordinates[child_atoms],
+                                      np.array([oxygen, anomeric, anomeric_hydrogen]))
+    return child.coordinates @ rotation.T + translation
+
+
+def build_structure(sequence, work_dir, dihedral_text, repeats=None, timeout=None):
+    """
+    Builds a structure in process, falling back to CarbBuilder for sequences build_glycan raises
+    UnsupportedSequence for.
+
+    Takes the same arguments and returns the same dict as run_carbbuilder, with 'native' set
+    when the structure was built in process.
+    """
+    start_time = time.perf_counter()
+    if not repeats:
+        try:
+            pdb_text, final_linkages = build_glycan(sequence, read_dihedral_angles(dihedral_text))
+        except UnsupportedSequence:
+            pass
+        else:
+            pdb_path = os.path.join(os.path.abspath(work_dir), "output.pdb")
+            with open(pdb_path, "w") as file:
+                file.write(pdb_text)
+            return {"sequence": sequence, "pdb_path": pdb_path, "final_linkages": final_linkages, "returncode": 0,
+                    "stdout": "", "stderr": "", "wall_time": time.perf_counter() - start_time, "native": True}
+
+    result = run_carbbuilder(sequence, work_dir, dihedral_text, repeats, timeout)
+    result["native"] = False
+    return result
@@ -1,35 +1,34 @@
 import json
 import os
-import re
-import subprocess
 import sys
-import time
 import shutil
-from PyQt6.QtCore import Qt, QPointF, QTimer
+from collections import OrderedDict
+from PyQt6.QtCore import Qt, QTimer
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QVBoxLayout, QWidget,
-                             QLineEdit, QGridLayout, QHBoxLayout, QScrollArea,
+                             QLineEdit, QHBoxLayout, QScrollArea,
                              QStatusBar, QFileDialog, QMessageBox, QTabWidget, QLabel, QSizePolicy, QInputDialog,QFileDialog,QTextEdit)
 from PyQt6.QtGui import QAction
 
+from BuildCache import BuildCache
+from BuildRunner import BuildRunner
+from CarbBuilder import (DIHEDRALS_PATH, OUTPUT_PDB, angle_position, dihedral_rows, dot_angles, format_dihedrals,
+                         parse_final_linkage, scale_coordinate)
 from CarbUtils import CarbUtils
+from ClashAnalysis import clash_summary
 from DatabaseManager import DatabaseManager
-from MakeDehidrils import make_dehidrals
+from EnergyLookup import EnergyLookup
+from PMFMinima import DEFAULT_ALTERNATES, ENERGY_CUTOFF, select_minima
 
 from ShapeView import ShapeView
-from ClickableGraphicsView import ClickableGraphicsView
 from PDBViewer import PDBViewer
-from Worker import Worker
+from PlotGrid import PlotGrid
+from TemplateLibrary import TemplateLibrary
+from Worker import Worker, shutdown_render_pool
 
 start_time = 0
 end_time = 0
 
 
-def scale_coordinate(x):
-    if 3 <= x <= 297:
-        return -60 / 49 * (x - 3) + 180
-    return None
-
-
 class MainWindow(QMainWindow):
     """
     Main window that Handles UI setup and interactions.
@@ -38,11 +37,23 @@ class MainWindow(QMainWindow):
         super().__init__()
         self.output_viewer_layout = None
         self.angles_display = None
-        self.linkage_views = {}
-        self.current_highlighted = None  # Track the currently highlighted view
+        self.pending_linkages = set()  # Linkages whose plots are still being rendered
+        self.failed_linkages = set()  # Linkages whose plots could not be rendered for the current molecule
+        self.prefetched_plots = OrderedDict()  # Linkage -> plot rendered while the sequence was being typed
+        self.prefetch_limit = 32  # Prefetched plots kept before the oldest are dropped
+        self.known_linkages = None  # file_ids of the database, loaded on first prefetch
+        self.auto_select_alternates = DEFAULT_ALTERNATES  # Alternate angles placed besides the global minimum
+        self.auto_select_cutoff = ENERGY_CUTOFF  # kcal/mol above the global minimum an alternate may lie
 
         self.cursor = None
-        self.worker = None
+        self.workers = []
+        self.build_runner = None
+        self.build_cache = BuildCache()
+        self.build_key = None
+        self.build_timeout = 600  # Seconds before a CarbBuilder run is killed
+        self.energy_lookup = EnergyLookup()
+        self.template_library = TemplateLibrary.load()
+        self.vector_plots = True  # Draw plots as Qt contour paths rather than matplotlib images
         self.pdb_viewer_widget = None
         self.connections = []
         self.prev_molecule = None
@@ -64,6 +75,13 @@ class MainWindow(QMainWindow):
         self.input_field = QLineEdit()
         self.input_field.setPlaceholderText("Enter molecule sequence")
         self.input_field.returnPressed.connect(self.update_view)
+
+        # Start rendering the plots of complete linkages shortly after the user stops typing
+        self.prefetch_timer = QTimer(self)
+        self.prefetch_timer.setSingleShot(True)
+        self.prefetch_timer.setInterval(300)
+        self.prefetch_timer.timeout.connect(self.prefetch_plots)
+        self.input_field.textChanged.connect(self.prefetch_timer.start)
         self.top_layout.addWidget(self.input_field)
 
         self.horizontal_layout = QHBoxLayout()
@@ -71,17 +89,20 @@ class MainWindow(QMainWindow):
         self.left_layout = QVBoxLayout()
         self.view = ShapeView([])
         self.view.setFixedWidth(300)
+        self.view.linkage_clicked.connect(self.highlight_linkage_plot)
         self.left_layout.addWidget(self.view)
         self.horizontal_layout.addLayout(self.left_layout)
 
         self.scroll_area = QScrollArea()
-        self.image_widget = QWidget()
-        self.image_layout = QGridLayout(self.image_widget)
-        self.image_layout.setAlignment(Qt.AlignmentFlag.AlignTop | Qt.AlignmentFlag.AlignLeft)
-        self.image_widget.setStyleSheet("background-color: white;")
+        # Only the plots in or near the visible part of the grid are kept
+        self.plot_grid = PlotGrid()
+        self.plot_grid.setStyleSheet("background-color: white;")
+        self.plot_grid.plots_needed.connect(self.request_plots)
+        self.plot_grid.plot_clicked.connect(self.handle_image_click)
+        self.plot_grid.plot_hovered.connect(self.show_plot_energy)
 
         self.scroll_area.setWidgetResizable(True)
-        self.scroll_area.setWidget(self.image_widget)
+        self.scroll_area.setWidget(self.plot_grid)
         self.horizontal_layout.addWidget(self.scroll_area)
 
         self.creation_layout.addLayout(self.top_layout)
@@ -119,6 +140,17 @@ class MainWindow(QMainWindow):
         generate_action.triggered.connect(self.print_dot_positions)
         file_menu.addAction(generate_action)
 
+        cancel_action = QAction("Cancel Generate", self)
+        cancel_action.setShortcut("Ctrl+Shift+G")
+        cancel_action.triggered.connect(self.cancel_generation)
+        file_menu.addAction(cancel_action)
+
+        self.auto_select_action = QAction("Auto-select Angles", self)
+        self.auto_select_action.setShortcut("Ctrl+Shift+A")
+        self.auto_select_action.setCheckable(True)
+        self.auto_select_action.toggled.connect(self.toggle_auto_select)
+        file_menu.addAction(self.auto_select_action)
+
         save_action = QAction("Save Configuration", self)
         save_action.setShortcut("Ctrl+P")
         save_action.triggered.connect(self.save_angle_configuration)
@@ -129,6 +161,11 @@ class MainWindow(QMainWindow):
         load_action.triggered.connect(self.load_configuration)
         file_menu.addAction(load_action)
 
+        open_pdb_action = QAction("Open PDB", self)
+        open_pdb_action.setShortcut("Ctrl+Shift+O")
+        open_pdb_action.triggered.connect(self.open_pdb_file)
+        file_menu.addAction(open_pdb_action)
+
         save_pdb_action = QAction("Save PDB", self)
         save_pdb_action.setShortcut("Ctrl+S")
         save_pdb_action.triggered.connect(self.save_pdb_file)
@@ -144,154 +181,179 @@ class MainWindow(QMainWindow):
         """
         Generates and saves dihedral angles for the current connections, and  a process to build the structure.
         """
-        output = make_dehidrals(self.connections)
-        for i in range(self.image_layout.count()):
-            widget = self.image_layout.itemAt(i).widget().children()[2]
-            if isinstance(widget, ClickableGraphicsView):
-                for dot in widget.dots:
-                    pos = dot.boundingRect().center()
-                    x = pos.x()
-                    y = pos.y()
-                    scaled_x = scale_coordinate(x) * -1
-                    scaled_y = scale_coordinate(y)
-                    molecule_id = dot.data(0)
-                    output[molecule_id].append(f"{scaled_x:.1f} {scaled_y:.1f}")
-
-        file_output = ""
-        for i in output:
-            file_output += ",".join(i) + "\n"
-
-        with open("CBv2.1.45/structureFile/dihedrals.txt", "w") as file:
-            file.write(file_output)
-
-            # Run CarbBuilder and capture the output using subprocess
+        # Replace any build still running, before its dihedral file is overwritten
+        self.cancel_generation()
+        self.release_pdb()
+
+        angles = {}
+        for index, linkage in enumerate(self.connections):
+            for x, y in self.plot_grid.dot_positions(linkage):
+                angles.setdefault(index, []).append(dot_angles(x, y))
+
+        dihedral_text = format_dihedrals(dihedral_rows(self.connections, angles))
+        with open(DIHEDRALS_PATH, "w") as file:
+            file.write(dihedral_text)
+
+        # Identical builds are served from the cache without starting CarbBuilder
+        sequence = self.input_field.text()
+        self.build_key = BuildCache.make_key(sequence, None, dihedral_text)
+        cached = self.build_cache.get(self.build_key)
+        if cached:
+            pdb_path, final_linkages = cached
+            shutil.copyfile(pdb_path, OUTPUT_PDB)
+            self.build_finished(OUTPUT_PDB, final_linkages)
+            return
+
+        # Run CarbBuilder in the background so the window stays responsive
+        self.build_runner = BuildRunner(sequence, 'output', timeout=self.build_timeout, parent=self)
+        self.build_runner.output_line.connect(self.status_bar.showMessage)
+        self.build_runner.finished.connect(self.store_build)
+        self.build_runner.finished.connect(self.build_finished)
+        self.build_runner.failed.connect(self.build_failed)
+        self.build_runner.start()
+        self.status_bar.showMessage("Generating structure...")
+
+    def toggle_auto_select(self, checked):
+        """Places energy minimum dots on every plot when auto-select is switched on."""
+        if checked:
+            placed = sum(self.auto_select_dots(linkage) for linkage in self.connections)
+            self.status_bar.showMessage(f"Placed {placed} dots at PMF minima", 5000)
+
+    def auto_select_dots(self, linkage):
+        """
+        Replaces the dots of a linkage with its global PMF minimum and the alternates
+        within the energy cutoff, whether or not its plot is loaded.
+
+        :param linkage: Connection whose plot is updated.
+        :return: Number of dots placed.
+        """
+        db_manager = DatabaseManager()
+        minima = db_manager.query_minima_by_file(linkage)
+        db_manager.close()
+
+        selected = select_minima(minima, self.auto_select_alternates, self.auto_select_cutoff)
+        self.plot_grid.set_dots(linkage, [angle_position(phi, psi) for phi, psi, _ in selected])
+        return len(selected)
+
+    def cancel_generation(self):
+        """Stops the CarbBuilder run in progress, if any, and disposes of the last runner."""
+        runner, self.build_runner = self.build_runner, None
+        if runner is None:
+            return
+        if runner.is_running():
+            runner.finished.disconnect()
+            runner.failed.disconnect()
+            # Delete the runner once its process has been killed, failed is emitted then
+            runner.failed.connect(runner.deleteLater)
+            runner.cancel()
+            self.status_bar.showMessage("Generation cancelled", 5000)
+        else:
+            runner.deleteLater()
+
+    def store_build(self, pdb_path, final_linkages):
+        """Adds a finished build to the build cache."""
         try:
-            process = subprocess.Popen(
-                ['CBv2.1.45/CarbBuilder2.exe', '-i', self.input_field.text(), '-o', 'output'],
-                cwd="CBv2.1.45",
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                universal_newlines=True
-            )
-            output, error = process.communicate()
-
-            if error:
-                self.show_error_message("CarbBuilder Error", error)
-                return
-
-            if "PDB file Built" in output:
-                self.status_bar.showMessage("Generation completed successfully", 5000)
-                final_linkages = self.extract_final_linkages(output)
-                if final_linkages:
-                    angle_info = "\n".join(final_linkages)
-                else:
-                    self.show_error_message("No Angles Found", "No angles were found in the CarbBuilder output.")
-                self.visualize_pdb(angle_info)
-            else:
-                self.show_error_message("Build Failed", "The build was unsuccessful. Try different angles.")
-                self.show_error_message("CarbBuilder Output", output)
-
-        except Exception as e:
-            self.show_error_message("Error", str(e))
-
-    def extract_final_linkages(self,output):
-        linkages = []
-
-        # Ensure output is a string
-        output = str(output)
-
-        # Split the output by new lines
-        lines = output.split('\n')
-
-        for line in lines:
-            # Look for lines that start with "FINAL linkage:"
-            if "FINAL linkage:" in line:
-                parts = line.strip().split("FINAL linkage:")[1].strip()
-
-                if ":" in parts:
-                    linkage_info, angles_info = parts.split(":", 1)
-                    linkage_info = linkage_info.strip()
-                    angles_info = angles_info.strip()
-
-                    # Format the output
-                    linkage = f"Linkage: {linkage_info}, Angles: {angles_info}"
-                    pattern = re.compile(r"#\d+")
-                    linkage = pattern.sub("", linkage)
-                    linkages.append(linkage)
-
-        return linkages
-
-    def visualize_pdb(self,angle_info):
-        """Visualizes the generated PDB file in the output tab."""
-        pdb_file_path = 'CBv2.1.45/output.pdb'
+            self.build_cache.put(self.build_key, pdb_path, final_linkages)
+        except OSError as e:
+            print(f"Error caching build: {e}")
+
+    def build_finished(self, pdb_path, final_linkages):
+        """Shows the structure built by CarbBuilder along with the angles it used."""
+        self.status_bar.showMessage("Generation completed successfully", 5000)
+        if not final_linkages:
+            self.show_error_message("No Angles Found", "No angles were found in the CarbBuilder output.")
+        self.visualize_pdb("\n".join(final_linkages) + self.energy_summary(final_linkages)
+                           + clash_summary(pdb_path, self.input_field.text()))
+
+    def energy_summary(self, final_linkages):
+        """
+        Describes the PMF energy of the angles CarbBuilder used.
+
+        :param final_linkages: Lines returned by extract_final_linkages.
+        :return: Text to append to the angles display, empty if no angles could be read.
+        """
+        angles = [parsed for parsed in map(parse_final_linkage, final_linkages) if parsed]
+        if not angles:
+            return ""
+        total, energies = self.energy_lookup.total_energy(angles)
+        lines = [f"{connection}: {energy:.2f} kcal/mol" if energy is not None else f"{connection}: no PMF data"
+                 for (connection, _, _), energy in zip(angles, energies)]
+        return "\n\nPMF energies:\n" + "\n".join(lines) + f"\n\nTotal PMF energy: {total:.2f} kcal/mol"
+
+    def build_failed(self, message):
+        self.status_bar.showMessage("Generation failed", 5000)
+        self.show_error_message("Build Failed", message)
+
+    def visualize_pdb(self, angle_info, pdb_file_path=OUTPUT_PDB):
+        """
+        Visualizes a PDB file in the output tab. The viewer is created on first use and kept,
+        so later structures are sent to its page rather than reloading it.
 
+        :param angle_info: Text shown next to the structure.
+        :param pdb_file_path: PDB file to show, the generated output.pdb by default.
+        """
         # Check if output.pdb exists
         if not os.path.exists(pdb_file_path):
             self.show_error_message("Error", "Could not generate PDB file. Please check the input or try again.")
             return
 
-        # Clear the output layout
-        for i in reversed(range(self.output_layout.count())):
-            widget = self.output_layout.itemAt(i).widget()
-            if widget:
-                widget.setParent(None)
+        if self.pdb_viewer_widget is None:
+            self.pdb_viewer_widget = PDBViewer()
+            self.pdb_viewer_widget.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Expanding)
 
-        # Switch to the Output tab
-        self.tabs.setCurrentWidget(self.output_tab)
-        self.pdb_viewer_widget = PDBViewer(pdb_file_path)
-        self.pdb_viewer_widget.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Expanding)
+            self.angles_display = QTextEdit()
+            self.angles_display.setReadOnly(True)
+            self.angles_display.setFixedWidth(320)
+            self.angles_display.setStyleSheet("background-color: lightgray;")
 
-        self.angles_display = QTextEdit()
-        self.angles_display.setReadOnly(True)
-        self.angles_display.setFixedWidth(320)
-        self.angles_display.setStyleSheet("background-color: lightgray;")
-        self.angles_display.setText(angle_info)
+            self.angles_label = QLabel("Dihedral Angles Used")
+            self.angles_label.setStyleSheet("font-weight: bold; font-size: 14px; color: black;background-color: lightgray;")
+            self.angles_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
 
+            self.angles_layout = QVBoxLayout()
+            self.angles_layout.addWidget(self.angles_label)  # Add the label on top
+            self.angles_layout.addWidget(self.angles_display)
 
-        self.angles_label = QLabel("Dihedral Angles Used")
-        self.angles_label.setStyleSheet("font-weight: bold; font-size: 14px; color: black;background-color: lightgray;")
-        self.angles_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+            # Create a horizontal layout to place both the PDB viewer and angles display side by side
+            self.output_viewer_layout = QHBoxLayout()
+            self.output_viewer_layout.addWidget(self.pdb_viewer_widget)
+            self.output_viewer_layout.addLayout(self.angles_layout)
 
-        self.angles_layout = QVBoxLayout()
-        self.angles_layout.addWidget(self.angles_label)  # Add the label on top
-        self.angles_layout.addWidget(self.angles_display)
+            # Create a QWidget to hold the horizontal layout and add it to the output tab layout
+            self.output_viewer_widget = QWidget()
+            self.output_viewer_widget.setLayout(self.output_viewer_layout)
+            self.output_layout.addWidget(self.output_viewer_widget)
 
-        # Create a horizontal layout to place both the PDB viewer and angles display side by side
-        self.output_viewer_layout = QHBoxLayout()
-        self.output_viewer_layout.addWidget(self.pdb_viewer_widget)
-        self.output_viewer_layout.addLayout(self.angles_layout)
-
-        # Create a QWidget to hold the horizontal layout and add it to the output tab layout
-        self.output_viewer_widget = QWidget()
-        self.output_viewer_widget.setLayout(self.output_viewer_layout)
+        try:
+            self.pdb_viewer_widget.load_pdb_file(pdb_file_path)
+        except (OSError, ValueError) as e:
+            self.show_error_message("Error", f"Could not read {pdb_file_path}: {e}")
+            return
+        self.angles_display.setText(angle_info)
 
-        # Clear the output layout if necessary (remove previous widgets)
-        while self.output_layout.count():
-            widget = self.output_layout.takeAt(0).widget()
-            if widget is not None:
-                widget.deleteLater()
+        # Switch to the Output tab
+        self.tabs.setCurrentWidget(self.output_tab)
 
-        # Add the widget containing the PDB viewer and angles display to the output tab layout
-        self.output_layout.addWidget(self.output_viewer_widget)
+    def release_pdb(self):
+        """Closes the file open in the viewer, so it can be overwritten or deleted."""
+        if self.pdb_viewer_widget is not None:
+            self.pdb_viewer_widget.release()
 
-    def resizeEvent(self, event):
+    def open_pdb_file(self):
         """
-        Override the resize event to adjust the size of the 3Dmol viewer dynamically.
+        Prompts the user for a PDB file to view, e.g. a CarbBuilder -all ensemble. Files with
+        several models can be stepped through or played in the output tab.
         """
-        super().resizeEvent(event)
-        if self.pdb_viewer_widget is not None:
-            new_width = self.pdb_viewer_widget.width()  # Get the new width of the parent widget
-            new_height = self.pdb_viewer_widget.height()  # Get the new height of the parent widget
-
-            # Update the viewer's size based on the new dimensions
-            self.pdb_viewer_widget.viewer.setSize(width=new_width, height=new_height)
+        path, _ = QFileDialog.getOpenFileName(self, "Open PDB File", "", "PDB Files (*.pdb);;All Files (*)")
+        if path:
+            self.visualize_pdb(os.path.basename(path), path)
 
     def save_pdb_file(self):
         """
         Prompts the user to save the output.pdb file to a location of their choice.
         """
         # Check if the PDB file exists before attempting to save
-        pdb_file_path = 'CBv2.1.45/output.pdb'
+        pdb_file_path = OUTPUT_PDB
         if not os.path.exists(pdb_file_path):
             self.show_error_message("Save Error", "PDB file not found. Please generate it first.")
             return
@@ -310,10 +372,15 @@ class MainWindow(QMainWindow):
                 self.show_error_message("Save Error", f"Failed to save PDB file: {str(e)}")
 
     def update_view(self):
-        """Updates the view based on the input molecule sequence. Creates shapes and displays images."""
+        """
+        Updates the view based on the input molecule sequence. Creates shapes and displays images.
+
+        :return: True if the view shows the sequence, False if it was rejected and an error shown.
+        """
 
         # Delete output.pdb if it exists
-        pdb_file_path = 'CBv2.1.45/output.pdb'
+        pdb_file_path = OUTPUT_PDB
+        self.release_pdb()
         if os.path.exists(pdb_file_path):
             try:
                 os.remove(pdb_file_path)
@@ -323,7 +390,7 @@ class MainWindow(QMainWindow):
         self.prev_molecule = self.input_field.text().strip()
         if not self.prev_molecule:
             self.show_error_message("Error", "Molecule sequence is empty. Please enter a valid sequence.")
-            return
+            return False
 
 
 
@@ -339,147 +406,168 @@ class MainWindow(QMainWindow):
         #     )
         #     return
 
-        self.clear_previous_views()
-
         carb_builder = CarbUtils(self.prev_molecule)
-        carb_builder.parse_sequence()
+        try:
+            carb_builder.parse_sequence()
+        except ValueError as e:
+            self.show_error_message("Invalid Input", f"The molecule sequence is not in the correct CASPER format: {e}")
+            return False
         residues = carb_builder.get_residues()
-        self.connections = carb_builder.get_connections()
-        self.view.create_shapes(residues, self.connections)
-        seen = set()
-        result = []
-        for item in self.connections:
-            if item not in seen:
-                result.append(item)
-                seen.add(item)
-
-        self.connections =result
-        self.display_images(self.connections)
-
-        # Use a QTimer to periodically check if the layout is updated
-        self.check_layout_timer = QTimer(self)
-        self.check_layout_timer.timeout.connect(lambda: self.check_layout_and_place_dots(start_time))
-        self.check_layout_timer.start(100)
-        self.view.linkage_clicked.connect(self.highlight_linkage_plot)
+        # Reject residues CarbBuilder has no template for before any plotting or build work
+        self.template_library.refresh()
+        unknown = self.template_library.unknown_residues(residues)
+        if unknown:
+            self.show_error_message("Unknown Residue", f"No CarbBuilder template for: {', '.join(unknown)}")
+            return False
+        connections = carb_builder.get_connections()
+        self.view.create_shapes(residues, connections)
+        self.connections = list(dict.fromkeys(connections))
+
+        # Keep the plots and dots of linkages that are still in the sequence, the grid asks for the missing plots
+        self.prefetch_timer.stop()
+        self.failed_linkages.clear()
+        new_connections = [linkage for linkage in self.connections if linkage not in self.plot_grid.tiles]
+        self.plot_grid.set_linkages(self.connections)
+        if self.auto_select_action.isChecked():
+            for linkage in new_connections:
+                self.auto_select_dots(linkage)
+        return True
 
     def highlight_linkage_plot(self, linkage):
         """
         Highlights the grid plot corresponding to the clicked linkage.
         :param linkage: The name of the clicked linkage.
         """
-        if self.current_highlighted:
-            # Reset the border style of the previously highlighted view
-            self.current_highlighted.setStyleSheet("""
-                        border: none;
-                        box-sizing: border-box;
-                    """)
-
-        # Find the corresponding graphics view for the clicked linkage
-        if linkage in self.linkage_views:
-            self.current_highlighted = self.linkage_views[linkage]
-            # Set the border style to highlight
-            self.current_highlighted.setStyleSheet("border: 2px solid blue;")
+        tile = self.plot_grid.highlight(linkage)
+        if tile is not None:
+            self.scroll_area.ensureWidgetVisible(tile)
 
-    def clear_previous_views(self):
-        """Clears old images, linkage views, and resets state for the new molecule."""
-        # Remove all items from the grid layout
-        for i in reversed(range(self.image_layout.count())):
-            widget = self.image_layout.itemAt(i).widget()
-            if widget:
-                widget.setParent(None)
-
-        # Clear linkage views and any currently highlighted linkage
-        self.linkage_views = {}
-        self.current_highlighted = None
-
-    def check_layout_and_place_dots(self,start_time):
+    def prefetch_plots(self):
         """
-        Checks if the layout has been updated with images and places saved dots if a configuration is loaded.
+        Parses the sequence being typed and renders the plots of the linkages it already contains,
+        so they are ready by the time update_view is called.
         """
-        if self.image_layout.count() == len(set(self.connections)):
-
-            self.check_layout_timer.stop()
-
-            # Place saved dots if loading a configuration
-            if hasattr(self, 'saved_dots'):
-                for index, linkage in enumerate(self.connections):
-                    if linkage in self.saved_dots:
-                        graphics_view = self.image_layout.itemAt(index).widget().children()[2]
-                        if isinstance(graphics_view, ClickableGraphicsView):
-                            for x, y in self.saved_dots[linkage]:
-                                graphics_view.add_dot(graphics_view.mapToScene(x, y))
-                del self.saved_dots  # Clean up after loading the dots
-
-        # Else, the timer continues to check
-
-    def display_images(self, connections):
-        """Displays images for the given connections by starting a worker thread."""
-        for i in reversed(range(self.image_layout.count())):
-            self.image_layout.itemAt(i).widget().setParent(None)
-
-        self.worker = Worker(connections)
-        self.worker.image_ready.connect(self.add_image_to_grid)
-        self.worker.error_occurred.connect(lambda message: self.show_error_message("Plot generation failed", message))
-        self.worker.start()
-
+        sequence = self.input_field.text().strip()
+        # Only residues followed by a linkage are complete, the last one may still be being typed
+        sequence = sequence[:sequence.rfind('(')]
+        if not sequence:
+            return
 
-    def add_image_to_grid(self, index, pixmap):
+        try:
+            carb_builder = CarbUtils(sequence)
+            carb_builder.parse_sequence()
+            connections = list(dict.fromkeys(carb_builder.get_connections()))
+        except Exception:
+            return  # Not parseable yet
+
+        if self.known_linkages is None:
+            db_manager = DatabaseManager()
+            self.known_linkages = set(db_manager.list_file_ids())
+            db_manager.close()
+
+        connections = [linkage for linkage in connections
+                       if linkage in self.known_linkages and self.plot_grid.view(linkage) is None
+                       and linkage not in self.pending_linkages and linkage not in self.prefetched_plots]
+        if connections:
+            self.display_images(connections, prefetch=True)
+
+    def request_plots(self, linkages):
         """
-        Adds an image to the grid layout with a title and a ClickableGraphicsView widget.
+        Renders the plots the grid asks for, using prefetched plots where available.
 
-        :param index: The index of the image in the connections list.
-        :param pixmap: The QPixmap image to be added.
+        :param linkages: Connections near the viewport without a plot, nearest first.
+        """
+        missing = []
+        for linkage in linkages:
+            if linkage in self.prefetched_plots:
+                self.plot_grid.set_plot(linkage, self.prefetched_plots.pop(linkage))
+            elif linkage not in self.pending_linkages and linkage not in self.failed_linkages:
+                missing.append(linkage)
+        if missing:
+            self.display_images(missing)
+
+    def display_images(self, connections, prefetch=False):
         """
-        linkage = self.connections[index]
-        linkage_name = f"Linkage: {linkage}"
+        Displays images for the given connections by starting a worker thread.
 
-        # Create a QLabel for the title
-        title_label = QLabel(linkage_name)
-        title_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-        title_label.setStyleSheet("background-color: white; color: black; border: 1px solid black;")
-        title_label.setFixedHeight(20)
-        title_label.setFixedWidth(300)
-        # title_label.setMa
+        :param connections: Connections to render.
+        :param prefetch: The connections are not displayed yet, report errors on the console instead of a dialog.
+        """
+        self.pending_linkages.update(connections)
 
-        # ensure the label and image have the same width
-        size_policy = QSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Fixed)
-        title_label.setSizePolicy(size_policy)
+        delivered = set()
 
-        # Create a ClickableGraphicsView for the image
-        scaled_pixmap = pixmap.scaledToHeight(300)
-        graphics_view = ClickableGraphicsView(scaled_pixmap, index)
-        graphics_view.clicked.connect(self.handle_image_click)
-        graphics_view.setFixedWidth(306)
-        graphics_view.setFixedHeight(306)
-        graphics_view.setViewportMargins(0,0,0,0)
+        def deliver(index, plot):
+            delivered.add(connections[index])
+            self.add_image_to_grid(connections[index], plot)
 
-        graphics_view.setStyleSheet("""
-                border: none;
-                box-sizing: border-box;
-            """)
+        worker = Worker(connections, contours=self.vector_plots)
+        worker.image_ready.connect(deliver)
+        worker.contours_ready.connect(deliver)
+        if prefetch:
+            worker.error_occurred.connect(print)
+        else:
+            worker.error_occurred.connect(lambda message: self.show_error_message("Plot generation failed", message))
+        worker.finished.connect(lambda: self.worker_finished(
+            worker, [linkage for linkage in connections if linkage not in delivered], prefetch))
+        # Workers of earlier updates may still be running, keep them alive until they finish
+        self.workers.append(worker)
+        worker.start()
+
+    def worker_finished(self, worker, failed, prefetch=False):
+        """
+        Forgets a finished worker and the plots it failed to render.
 
-        self.linkage_views[linkage] = graphics_view
+        :param worker: The finished Worker.
+        :param failed: Connections the worker emitted no plot for.
+        :param prefetch: The worker was started by prefetch_plots.
+        """
+        self.workers.remove(worker)
+        self.pending_linkages.difference_update(worker.connections)
 
-        # Create a vertical layout to stack the label and image
-        vertical_layout = QVBoxLayout()
-        vertical_layout.addWidget(title_label)
-        vertical_layout.addWidget(graphics_view)
-        vertical_layout.setContentsMargins(0, 0, 0, 0)  # Optional: Remove margins
+        if prefetch:
+            # A failed prefetch is retried if the grid still needs it, so the error reaches the user
+            if failed:
+                self.plot_grid.update_visible()
+        else:
+            # Not asked for again until the next update_view, so a missing PMF is only reported once
+            self.failed_linkages.update(failed)
 
+    def add_image_to_grid(self, linkage, pixmap):
+        """
+        Loads a rendered plot into the tile of its linkage.
 
+        :param linkage: The connection the image was rendered for.
+        :param pixmap: The QPixmap image to be added, or the contour paths to draw.
+        """
+        self.pending_linkages.discard(linkage)
+        if not self.plot_grid.set_plot(linkage, pixmap):
+            # Prefetched, or the molecule changed while the plot was rendering, keep it for a later update_view
+            self.prefetched_plots[linkage] = pixmap
+            while len(self.prefetched_plots) > self.prefetch_limit:
+                self.prefetched_plots.popitem(last=False)
 
-        # Create a widget to hold the vertical layout
-        container_widget = QWidget()
-        container_widget.setLayout(vertical_layout)
-        container_widget.setFixedHeight(332)
+    def handle_image_click(self, linkage, x, y):
+        self.show_plot_energy(linkage, x, y, 2000)
 
-        # Add the container widget to the grid layout
-        row = index // 3
-        col = index % 3
-        self.image_layout.addWidget(container_widget, row, col)
+    def show_plot_energy(self, linkage, x, y, timeout=0):
+        """
+        Shows the angles and interpolated PMF energy at a position on a linkage's plot.
 
-    def handle_image_click(self, x, y):
-        self.status_bar.showMessage(f"Image clicked at: ({x}, {y})", 2000)
+        :param linkage: Connection the plot belongs to.
+        :param x: Scene x coordinate on the plot.
+        :param y: Scene y coordinate on the plot.
+        :param timeout: Milliseconds the message stays in the status bar, 0 until replaced.
+        """
+        if scale_coordinate(x) is None or scale_coordinate(y) is None:
+            self.status_bar.clearMessage()
+            return
+        phi, psi = dot_angles(x, y)
+        try:
+            energy = f"{self.energy_lookup.energy(linkage, phi, psi):.2f} kcal/mol"
+        except KeyError:
+            energy = "no PMF data"
+        self.status_bar.showMessage(f"{linkage}  phi {phi:.1f}  psi {psi:.1f}  energy {energy}", timeout)
 
     def save_file(self):
         """
@@ -506,8 +594,8 @@ class MainWindow(QMainWindow):
                 with open(file_name, 'r') as file:
                     content = file.read()
                 self.input_field.setText(content)
-                self.update_view()
-                self.status_bar.showMessage("File loaded successfully", 5000)
+                if self.update_view():
+                    self.status_bar.showMessage("File loaded successfully", 5000)
             except Exception as e:
                 self.show_error_message("Load Error", str(e))
 
@@ -535,19 +623,10 @@ class MainWindow(QMainWindow):
 
         # Prepare the configuration data
         config_data = {}
-        for i in range(self.image_layout.count()):
-            container_widget = self.image_layout.itemAt(i).widget()
-            title_label = container_widget.layout().itemAt(0).widget()
-            connection_name = title_label.text().replace("Linkage: ", "")
-            graphics_view = container_widget.layout().itemAt(1).widget()
-
-            points = []
-            for dot in graphics_view.dots:
-                pos = dot.boundingRect().center()
-                points.append([int(pos.x()), int(pos.y())])
-
+        for linkage in self.connections:
+            points = [[int(x), int(y)] for x, y in self.plot_grid.dot_positions(linkage)]
             if points:
-                config_data[connection_name] = points
+                config_data[linkage] = points
 
         # Save configuration data to the database
         db_manager = DatabaseManager()
@@ -582,9 +661,13 @@ class MainWindow(QMainWindow):
         if result:
             molecule_name, dots_json = result
             self.input_field.setText(molecule_name)
-            self.saved_dots = json.loads(dots_json) if dots_json else {}  # Load dots as a dictionary
-            self.update_view()  # Call update_view with the molecule name
-            self.status_bar.showMessage(f"Configuration '{config_id}' loaded successfully", 5000)
+            saved_dots = json.loads(dots_json) if dots_json else {}  # Load dots as a dictionary
+            # The dots of the previous molecule stay untouched if the saved one cannot be shown
+            if self.update_view():
+                # Dots live in the grid's model, so they are placed even on plots that are not loaded yet
+                for linkage in self.connections:
+                    self.plot_grid.set_dots(linkage, saved_dots.get(linkage, []))
+                self.status_bar.showMessage(f"Configuration '{config_id}' loaded successfully", 5000)
         else:
             self.show_error_message("Load Error", "Failed to load configuration.")
 
@@ -592,7 +675,8 @@ class MainWindow(QMainWindow):
 
     def closeEvent(self, event):
         """This method is called when the application is closed to It delete the output.pdb file if it exists."""
-        pdb_file_path = 'CBv2.1.45/output.pdb'
+        pdb_file_path = OUTPUT_PDB
+        self.release_pdb()
 
         # Check if the file exists and delete it
         if os.path.exists(pdb_file_path):
@@ -601,6 +685,10 @@ class MainWindow(QMainWindow):
             except Exception as e:
                 print(f"Error deleting {pdb_file_path}: {e}")
 
+        self.cancel_generation()
+        shutdown_render_pool()
+        DatabaseManager.shutdown()
+
         # Accept the close event to allow the window to close
         event.accept()
 
@@ -1,27 +1,126 @@
+import os
 import re
-def make_dehidrals(molecules):
-    """Generate a list of dihedral angles based on selected angles."""
-    connections = []
-    for molecule in molecules:
-        monosaccharide = (re.split(r'\d\d', molecule))
-        linkage = (re.findall(r'\d\d', molecule))[0]
-        connections.append(f"{monosaccharide[0]} {linkage[0]} {linkage[1]} {monosaccharide[1]}")
 
+DIHEDRALS_FILE = "Dihedrals/dihedrals.txt"
+DEFAULTS_FILE = "CBv2.1.45/structureFile/dihedral_defaults.txt"
+
+# Carbons of a linkage, followed by the anomeric prefix of the second residue. Phosphate linkages start at 'O'
+_LINKAGE = re.compile(r'([\dO])(\d)(?=[ab][DL])')
+
+
+def split_connection(connection):
+    """
+    Splits a connection name such as 'aDFuc13bDMan' into its parts.
+
+    :param connection: Connection formatted as "residue1linkageresidue2", e.g. 'aDMan1PO6aDMan'.
+    :return: Tuple of (residue1, carbon1, carbon2, residue2).
+    """
+    match = _LINKAGE.search(connection) or re.search(r'(\d)(\d)', connection)
+    return connection[:match.start()], match.group(1), match.group(2), connection[match.end():]
+
+
+def parse_angles(fields):
+    """Parses 'phi psi [omega]' fields into tuples of floats, skipping empty ones."""
+    return [tuple(float(value) for value in field.split()) for field in fields if field.strip()]
+
+
+class DihedralTable:
+    """
+    The dihedral angles of Dihedrals/dihedrals.txt, indexed by (residue1, carbon1, carbon2, residue2).
 
-    with open("Dihedrals/dihedrals.txt","r") as file:
-        dihedrals = file.readlines()
+    Each entry holds the number of dihedrals for the linkage and its angle sets, the
+    first being the default and the rest alternates. Linkages missing from the file
+    fall back to 'All' wildcard entries and then to the anomeric defaults of
+    dihedral_defaults.txt.
+    """
+    _cache = {}
 
-    output =[]
+    def __init__(self, entries, defaults):
+        """
+        Initializes the table from parsed entries.
 
-    for connection in connections:
-        for dihedral in dihedrals:
-            if dihedral.count(",")<2 or dihedral[0] == "#":
-                continue
+        :param entries: Dict mapping (residue1, carbon1, carbon2, residue2) to (count, angle sets).
+        :param defaults: Dict mapping an anomeric prefix ('aD', 'bL', 'others', ...) to angle sets.
+        """
+        self.entries = entries
+        self.defaults = defaults
 
-            if connection == dihedral[:dihedral.index(",")]:
-                output.append(dihedral.split(",")[:2])
+    @classmethod
+    def load(cls, path=DIHEDRALS_FILE, defaults_path=DEFAULTS_FILE):
+        """
+        Returns the parsed table for a dihedral file, re-reading it only when either file has changed.
 
+        :param path: Path of the dihedral file.
+        :param defaults_path: Path of the anomeric defaults file.
+        :return: DihedralTable instance.
+        """
+        stamp = (os.path.getmtime(path), os.path.getmtime(defaults_path) if os.path.exists(defaults_path) else None)
+        cached = cls._cache.get((path, defaults_path))
+        if cached and cached[0] == stamp:
+            return cached[1]
 
+        table = cls(cls.read_entries(path), cls.read_defaults(defaults_path))
+        cls._cache[(path, defaults_path)] = (stamp, table)
+        return table
+
+    @staticmethod
+    def read_entries(path):
+        """Reads 'res1 c1 c2 res2,count,phi psi,...' lines, keeping the first entry for each linkage."""
+        entries = {}
+        with open(path, "r") as file:
+            for line in file:
+                if line.count(",") < 2 or line[0] == "#":
+                    continue
+                fields = line.rstrip("\n").split(",")
+                key = tuple(fields[0].split())
+                if len(key) != 4 or key in entries:
+                    continue
+                try:
+                    entries[key] = (fields[1].strip(), parse_angles(fields[2:]))
+                except ValueError:
+                    continue
+        return entries
+
+    @staticmethod
+    def read_defaults(path):
+        """Reads 'prefix,phi psi,...' lines of the CarbBuilder defaults file."""
+        defaults = {}
+        if not os.path.exists(path):
+            return defaults
+        with open(path, "r") as file:
+            for line in file:
+                fields = line.strip().split(",")
+                if len(fields) < 2 or not fields[0]:
+                    continue
+                defaults[fields[0].strip()] = parse_angles(fields[1:])
+        return defaults
+
+    def lookup(self, residue1, carbon1, carbon2, residue2):
+        """
+        Finds the dihedrals for a linkage, resolving wildcards and defaults.
+
+        :return: Tuple of (count, angle sets), e.g. ('2', [(-40.0, 0.0), (0.0, 180.0)]).
+        """
+        for key in ((residue1, carbon1, carbon2, residue2),
+                    ("All", carbon1, carbon2, residue2),
+                    (residue1, carbon1, carbon2, "All"),
+                    ("All", carbon1, carbon2, "All")):
+            if key in self.entries:
+                return self.entries[key]
+
+        prefix = residue1[:2]
+        angles = self.defaults.get(prefix, self.defaults.get("others", []))
+        return "2", angles
+
+
+def make_dehidrals(molecules):
+    """Generate a list of dihedral angles based on selected angles."""
+    table = DihedralTable.load()
+
+    output = []
+    for molecule in molecules:
+        residue1, carbon1, carbon2, residue2 = split_connection(molecule)
+        count, _ = table.lookup(residue1, carbon1, carbon2, residue2)
+        output.append([f"{residue1} {carbon1} {carbon2} {residue2}", count])
 
-    print(output)
-    return output
\ No newline at end of file
+    return output
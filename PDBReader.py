@@ -0,0 +1,154 @@
+import mmap
+import re
+
+import numpy as np
+
+# Fixed width of a PDB record, columns past it are not read
+RECORD_WIDTH = 80
+
+# Searching from the newline is an order of magnitude faster than a multiline '^' anchor
+_MODEL = re.compile(rb"\n(MODEL|ENDMDL)[^\n]*")
+_ATOM = re.compile(rb"^(?:ATOM  |HETATM)[^\n]*", re.MULTILINE)
+
+# Two letter elements read from the element column, e.g. for ions. Any other element is the first
+# letter of the atom name, as CarbBuilder templates keep CHARMM atom types in the element column.
+_TWO_LETTER_ELEMENTS = {"Br", "Ca", "Cl", "Cu", "Fe", "Mg", "Mn", "Na", "Zn"}
+
+
+class PDBReader:
+    """
+    Random access to the frames of a PDB file, such as CarbBuilder -all output with thousands of MODELs.
+
+    The file is memory-mapped and only the MODEL/ENDMDL positions are indexed when it is
+    opened. The ATOM records of a frame are decoded into numpy arrays by fixed-column slicing
+    when that frame is asked for, so memory follows the frames actually read. A file without
+    MODEL records is a single frame.
+    """
+
+    def __init__(self, path):
+        """
+        Opens and indexes a PDB file.
+
+        :param path: Path of the PDB file.
+        :raises ValueError: If the file is empty.
+        """
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f"{path} is empty")
+        self.frames = self._index()
+        self._topology = None
+
+    def _index(self):
+        """Returns the (start, end) byte offsets of the records of each frame."""
+        frames = []
+        start = None
+        if self._map[:5] == b"MODEL":
+            start = self._map.find(b"\n") + 1 or len(self._map)
+        for match in _MODEL.finditer(self._map):
+            if match.group(1) == b"MODEL":
+                start = min(match.end() + 1, len(self._map))
+            elif start is not None:
+                frames.append((start, match.start() + 1))
+                start = None
+        if start is not None:
+            # A last MODEL cut off before its ENDMDL, e.g. while CarbBuilder is still writing
+            frames.append((start, len(self._map)))
+        return frames or [(0, len(self._map))]
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __getitem__(self, index):
+        return self.coordinates(index)
+
+    def __iter__(self):
+        for index in range(len(self.frames)):
+            yield self.coordinates(index)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Unmaps and closes the file."""
+        self._map.close()
+        self._file.close()
+
+    def text(self, index):
+        """
+        Returns the records of one frame as text, without its MODEL and ENDMDL lines.
+
+        :raises IndexError: If there is no such frame.
+        """
+        start, end = self.frames[index]
+        return self._map[start:end].decode("ascii", errors="replace")
+
+    def records(self, index):
+        """
+        Returns the ATOM and HETATM records of one frame.
+
+        :return: (atoms, RECORD_WIDTH) array of single characters, padded with empty bytes.
+        :raises IndexError: If there is no such frame.
+        """
+        start, end = self.frames[index]
+        lines = [line.rstrip(b"\r") for line in _ATOM.findall(self._map, start, end)]
+        return np.array(lines, dtype=f"S{RECORD_WIDTH}").view("S1").reshape(len(lines), RECORD_WIDTH)
+
+    def coordinates(self, index):
+        """
+        Decodes the atom coordinates of one frame.
+
+        :return: (atoms, 3) float64 array.
+        :raises IndexError: If there is no such frame.
+        :raises ValueError: If a record has no readable coordinates.
+        """
+        return self._columns(self.records(index), 30, 54, 8).astype(np.float64)
+
+    def atoms(self, index=0):
+        """
+        Decodes the atom descriptions of one frame. Those of the first frame are kept, as the
+        frames of an ensemble share them.
+
+        :return: Dict of 'name', 'residue_name', 'residue' (number) and 'element' arrays.
+        """
+        if index == 0 and self._topology is not None:
+            return self._topology
+
+        records = self.records(index)
+        names = np.char.strip(np.char.decode(self._columns(records, 12, 16, 4).ravel(), "ascii"))
+        columns = np.char.strip(np.char.decode(self._columns(records, 76, 78, 2).ravel(), "ascii"))
+        elements = np.array([self._element(name, column) for name, column in zip(names.tolist(), columns.tolist())],
+                            dtype="U2")
+        atoms = {
+            "name": names,
+            "residue_name": np.char.strip(np.char.decode(self._columns(records, 17, 21, 4).ravel(), "ascii")),
+            "residue": self._columns(records, 22, 26, 4).ravel().astype(np.int64),
+            "element": elements,
+        }
+        if index == 0:
+            self._topology = atoms
+        return atoms
+
+    @staticmethod
+    def _element(name, column):
+        """
+        Takes the element from the atom name, using the element column only when it agrees with
+        the name, e.g. HO1 is hydrogen even if the column reads 'HO', but CL1 with 'CL' is chlorine.
+        """
+        letters = name.lstrip("0123456789")
+        element = letters[:1].upper()
+        column = column.capitalize()
+        if column in _TWO_LETTER_ELEMENTS and letters[:2].capitalize() == column:
+            return column
+        return element
+
+    @staticmethod
+    def _columns(records, start, end, width):
+        """Slices fixed columns out of records, split into fields of the given width."""
+        return np.ascontiguousarray(records[:, start:end]).view(f"S{width}")
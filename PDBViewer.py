@@ -1,37 +1,187 @@
+import json
+
 import py3Dmol
+from PyQt6.QtCore import Qt, QTimer
 from PyQt6.QtWebEngineWidgets import QWebEngineView
-from PyQt6.QtWidgets import QWidget, QVBoxLayout, QMainWindow
+from PyQt6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QSlider, QPushButton, QLabel
+
+from PDBReader import PDBReader
+
+# Milliseconds between frames while an ensemble is playing
+FRAME_INTERVAL = 100
+
+# Functions added to the viewer page. Calls wait for 3Dmol.js and the viewer it creates, and
+# the page follows the size of the widget instead of the size it was created with.
+PAGE_SCRIPT = """
+<style>html, body {margin: 0; overflow: hidden;}</style>
+<script>
+function withViewer(action) {
+    $3Dmolpromise.then(function() { action(VIEWER); });
+}
+function showModel(pdb, zoom) {
+    withViewer(function(viewer) {
+        viewer.removeAllModels();
+        viewer.addModel(pdb, 'pdb');
+        viewer.setStyle({}, {stick: {}});
+        if (zoom) {
+            viewer.zoomTo();
+        }
+        viewer.render();
+    });
+    return true;
+}
+window.addEventListener('resize', function() {
+    withViewer(function(viewer) { viewer.resize(); });
+});
+</script>
+"""
 
 
 class PDBViewer(QWidget):
-    def __init__(self, pdb_file_path):
+    """
+    Shows built structures with 3Dmol.js. The page is loaded once and each structure, or each
+    frame of a multi-model file, is sent to it on its own, so a new build or a step through an
+    ensemble never reloads the page or copies the whole file into it.
+    """
+
+    def __init__(self, pdb_file_path=None):
         super().__init__()
         # Initialize the QWidget and set up the layout
         self.viewer = None
+        self.reader = None
+        self.frame = 0
+        self.page_ready = False
+        self.pending_frame = None  # (PDB text, zoom) of the latest model to show once the page has loaded
+        self.frame_in_flight = False
         layout = QVBoxLayout(self)
         self.setLayout(layout)
 
         # Create a QWebEngineView widget for displaying the 3D visualisation
         self.web_view = QWebEngineView()
+        self.web_view.loadFinished.connect(self._page_loaded)
         layout.addWidget(self.web_view)
 
-        # Load the PDB file
-        self.load_pdb_file(pdb_file_path)
+        # Frame controls, shown for files with several models
+        self.play_button = QPushButton("Play")
+        self.play_button.setCheckable(True)
+        self.play_button.toggled.connect(self.toggle_playback)
+        self.frame_slider = QSlider(Qt.Orientation.Horizontal)
+        self.frame_slider.setMinimum(0)
+        self.frame_slider.valueChanged.connect(self.show_frame)
+        self.frame_label = QLabel()
+        self.frame_controls = QWidget()
+        controls_layout = QHBoxLayout(self.frame_controls)
+        controls_layout.setContentsMargins(0, 0, 0, 0)
+        controls_layout.addWidget(self.play_button)
+        controls_layout.addWidget(self.frame_slider)
+        controls_layout.addWidget(self.frame_label)
+        self.frame_controls.hide()
+        layout.addWidget(self.frame_controls)
 
-    def load_pdb_file(self, pdb_file_path):
-        """Load the PDB file and display it using py3Dmol in the QWebEngineView."""
-        with open(pdb_file_path, 'r') as file:
-            pdb_data = file.read()
+        self.play_timer = QTimer(self)
+        self.play_timer.setInterval(FRAME_INTERVAL)
+        self.play_timer.timeout.connect(self.next_frame)
 
-        # Create a py3Dmol viewer instance
-        self.viewer = py3Dmol.view(width=800, height=560)
-        self.viewer.addModel(pdb_data, 'pdb')
-        self.viewer.setStyle({'stick': {}})
-        self.viewer.zoomTo()
+        self.load_page()
+        if pdb_file_path:
+            self.load_pdb_file(pdb_file_path)
 
-        # Get the HTML representation of the viewer
+    def load_page(self):
+        """Loads the empty viewer page that models are later sent to."""
+        self.viewer = py3Dmol.view(width='100%', height='100vh')
+        self.viewer.setStyle({'stick': {}})
         html = self.viewer._make_html()
+        self.web_view.setHtml(html + PAGE_SCRIPT.replace("VIEWER", f"viewer_{self.viewer.uniqueid}"))
+
+    def load_pdb_file(self, pdb_file_path):
+        """
+        Shows a PDB file, starting with its first frame. Files with several models keep the
+        file open so further frames can be read as they are asked for.
+
+        :param pdb_file_path: Path of the PDB file.
+        :raises ValueError: If the file is empty.
+        """
+        self.release()
+        reader = PDBReader(pdb_file_path)
+        self.frame = 0
+        self._send_frame(reader.text(0), zoom=True)
+
+        if len(reader) > 1:
+            self.reader = reader
+            self.frame_slider.blockSignals(True)
+            self.frame_slider.setMaximum(len(reader) - 1)
+            self.frame_slider.setValue(0)
+            self.frame_slider.blockSignals(False)
+            self.frame_slider.setEnabled(True)
+            self.play_button.setEnabled(True)
+            self._update_frame_label()
+            self.frame_controls.show()
+        else:
+            reader.close()
+            self.frame_controls.hide()
+
+    def release(self):
+        """
+        Closes the file being shown, e.g. before a new build overwrites it. The frame on
+        screen stays, but no other frame can be selected.
+        """
+        self.play_button.setChecked(False)
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+            self.frame_slider.setEnabled(False)
+            self.play_button.setEnabled(False)
+
+    def show_frame(self, frame):
+        """
+        Sends one frame of the open file to the page.
+
+        :param frame: Frame index.
+        """
+        if self.reader is None or not 0 <= frame < len(self.reader):
+            return
+        self.frame = frame
+        self._send_frame(self.reader.text(frame), zoom=False)
+        self._update_frame_label()
+
+    def next_frame(self):
+        """Advances playback by one frame, wrapping around at the end."""
+        if self.reader is None:
+            self.play_button.setChecked(False)
+            return
+        # Skip a tick rather than queue frames faster than the page draws them
+        if self.frame_in_flight:
+            return
+        self.frame_slider.setValue((self.frame + 1) % len(self.reader))
+
+    def toggle_playback(self, playing):
+        """Starts or stops stepping through the frames."""
+        self.play_button.setText("Pause" if playing else "Play")
+        if playing and self.reader is not None:
+            self.play_timer.start()
+        else:
+            self.play_timer.stop()
+
+    def _send_frame(self, pdb_data, zoom):
+        """Shows a model on the page, or keeps it until the page has loaded."""
+        if not self.page_ready:
+            # Only the latest model is kept, zoomed if any model it replaces was to be
+            self.pending_frame = (pdb_data, zoom or (self.pending_frame is not None and self.pending_frame[1]))
+            return
+        self.frame_in_flight = True
+        self.web_view.page().runJavaScript(f"showModel({json.dumps(pdb_data)}, {json.dumps(zoom)});",
+                                           self._frame_shown)
+
+    def _frame_shown(self, result):
+        self.frame_in_flight = False
 
-        # Set the HTML to the QWebEngineView
-        self.web_view.setHtml(html)
+    def _page_loaded(self, ok):
+        """Sends the model waiting for the page once it has loaded."""
+        self.page_ready = ok
+        if ok and self.pending_frame is not None:
+            pdb_data, zoom = self.pending_frame
+            self.pending_frame = None
+            self._send_frame(pdb_data, zoom)
 
+    def _update_frame_label(self):
+        self.frame_label.setText(f"Frame {self.frame + 1} / {len(self.reader)}")
@@ -0,0 +1,183 @@
+import hashlib
+import io
+import re
+
+import numpy as np
+
+# Lines of a .pmf file containing '#' are comments
+_COMMENT_LINES = re.compile(r'^.*#.*$', re.MULTILINE)
+
+
+class PMFGrid:
+    """
+    A potential of mean force sampled on a regular phi/psi grid.
+
+    The energy array has one row per phi value and one column per psi value,
+    matching the row order of the .pmf files.
+    """
+
+    def __init__(self, phi, psi, energy):
+        """
+        Initializes the grid from its axes and energy values.
+
+        :param phi: 1D array of phi angles (degrees), increasing.
+        :param psi: 1D array of psi angles (degrees), increasing.
+        :param energy: 2D array of shape (len(phi), len(psi)).
+        """
+        self.phi = np.asarray(phi, dtype=np.float64)
+        self.psi = np.asarray(psi, dtype=np.float64)
+        self.energy = np.asarray(energy)
+        if self.energy.shape != (len(self.phi), len(self.psi)):
+            raise ValueError(f"Energy grid of shape {self.energy.shape} does not match "
+                             f"{len(self.phi)} phi by {len(self.psi)} psi values")
+
+    @classmethod
+    def from_points(cls, points):
+        """
+        Assembles a grid from a flat list of (phi, psi, energy) points in any order.
+
+        :param points: (N, 3) array or sequence of (phi, psi, energy) tuples.
+        :return: PMFGrid instance.
+        :raises ValueError: If the points are not a complete, regular grid.
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        if len(points) == 0:
+            raise ValueError("No grid points given")
+
+        phi, phi_index = np.unique(points[:, 0], return_inverse=True)
+        psi, psi_index = np.unique(points[:, 1], return_inverse=True)
+        cls._check_regular(phi, "phi")
+        cls._check_regular(psi, "psi")
+
+        flat_index = phi_index * len(psi) + psi_index
+        counts = np.bincount(flat_index, minlength=len(phi) * len(psi))
+
+        duplicated = np.flatnonzero(counts > 1)
+        if duplicated.size:
+            examples = cls._describe(phi, psi, duplicated)
+            raise ValueError(f"{duplicated.size} grid points appear more than once, e.g. {examples}")
+
+        missing = np.flatnonzero(counts == 0)
+        if missing.size:
+            examples = cls._describe(phi, psi, missing)
+            raise ValueError(f"{missing.size} of {counts.size} grid points are missing, e.g. {examples}")
+
+        energy = np.empty(counts.size, dtype=np.float64)
+        energy[flat_index] = points[:, 2]
+        return cls(phi, psi, energy.reshape(len(phi), len(psi)))
+
+    @classmethod
+    def from_file(cls, file_path):
+        """
+        Reads a grid straight from a .pmf file of 'phi psi energy' lines.
+
+        :param file_path: Path to the .pmf file.
+        :return: PMFGrid instance.
+        """
+        with open(file_path, 'r') as file:
+            return cls.from_points(cls.parse_points(file.read()))
+
+    @staticmethod
+    def parse_points(text):
+        """
+        Parses the text of a .pmf file into an (N, 3) array in a single pass,
+        skipping comment and blank lines.
+
+        :param text: Contents of a .pmf file.
+        :return: (N, 3) float64 array of (phi, psi, energy) points.
+        :raises ValueError: If a line does not hold exactly three numbers.
+        """
+        body = _COMMENT_LINES.sub('', text)
+        if not body.strip():
+            return np.empty((0, 3))
+        try:
+            # loadtxt reads in C like fromstring but keeps the lines apart, so every row is checked
+            values = np.loadtxt(io.StringIO(body), dtype=np.float64, ndmin=2)
+        except ValueError as e:
+            raise ValueError(f"Unreadable PMF data: {e}") from None
+        if values.shape[1] != 3:
+            raise ValueError(f"PMF data has {values.shape[1]} values per line, expected three")
+        return values
+
+    @classmethod
+    def from_metadata(cls, phi_origin, phi_step, phi_count, psi_origin, psi_step, psi_count, energy):
+        """Rebuilds a grid from the origin/step/count description stored in the database."""
+        phi = phi_origin + phi_step * np.arange(phi_count)
+        psi = psi_origin + psi_step * np.arange(psi_count)
+        return cls(phi, psi, np.asarray(energy).reshape(phi_count, psi_count))
+
+    def metadata(self):
+        """
+        Describes the axes of the grid.
+
+        :return: Tuple of (phi_origin, phi_step, phi_count, psi_origin, psi_step, psi_count).
+        """
+        return (float(self.phi[0]), self.step(self.phi), len(self.phi),
+                float(self.psi[0]), self.step(self.psi), len(self.psi))
+
+    def digest(self):
+        """Returns a hex digest of the axes and energies, identifying the data a plot is drawn from."""
+        sha = hashlib.sha1(repr(self.metadata()).encode('utf-8'))
+        sha.update(np.ascontiguousarray(self.energy, dtype='<f4').tobytes())
+        return sha.hexdigest()
+
+    def nearest_index(self, phi, psi):
+        """
+        Finds the grid cells closest to the given angles, wrapping around at +-180 degrees.
+
+        :param phi: Scalar or array of phi angles (degrees).
+        :param psi: Scalar or array of psi angles (degrees).
+        :return: Tuple of (phi index, psi index) integer arrays.
+        """
+        return self._axis_index(self.phi, phi), self._axis_index(self.psi, psi)
+
+    def energy_at(self, phi, psi):
+        """Returns the energy of the grid point nearest to each (phi, psi) pair."""
+        i, j = self.nearest_index(phi, psi)
+        return self.energy[i, j]
+
+    def periodic(self):
+        """
+        Returns the grid with one sample per period, dropping the last row or column of an
+        axis that repeats its first angle 360 degrees later (e.g. -180 and 180).
+
+        :return: Tuple of (phi, psi, energy) arrays.
+        """
+        phi_count = len(self.phi) - self._repeats_origin(self.phi)
+        psi_count = len(self.psi) - self._repeats_origin(self.psi)
+        return self.phi[:phi_count], self.psi[:psi_count], self.energy[:phi_count, :psi_count]
+
+    @staticmethod
+    def _repeats_origin(axis):
+        return int(len(axis) > 1 and np.isclose(axis[-1] - axis[0], 360.0))
+
+    @staticmethod
+    def step(axis):
+        """Returns the spacing of a regular axis, or 0 for a single value."""
+        return float(axis[1] - axis[0]) if len(axis) > 1 else 0.0
+
+    @classmethod
+    def _axis_index(cls, axis, angles):
+        step = cls.step(axis)
+        if step == 0:
+            return np.zeros(np.shape(angles), dtype=np.intp)
+        index = np.rint(np.mod(np.asarray(angles, dtype=np.float64) - axis[0], 360.0) / step).astype(np.intp)
+        # Angles past the last column wrap back to the start of the period
+        index = np.where(index >= len(axis), index - int(round(360.0 / step)), index)
+        return np.clip(index, 0, len(axis) - 1)
+
+    @classmethod
+    def _check_regular(cls, axis, name):
+        if len(axis) < 2:
+            return
+        steps = np.diff(axis)
+        expected = steps.min()
+        irregular = np.flatnonzero(~np.isclose(steps, expected))
+        if irregular.size:
+            values = ", ".join(f"{axis[i]:g}->{axis[i + 1]:g}" for i in irregular[:3])
+            raise ValueError(f"Irregular {name} spacing: expected steps of {expected:g}, found {values}")
+
+    @staticmethod
+    def _describe(phi, psi, flat_indices, limit=3):
+        i, j = np.divmod(flat_indices[:limit], len(psi))
+        return ", ".join(f"({phi[a]:g}, {psi[b]:g})" for a, b in zip(i, j))
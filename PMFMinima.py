@@ -0,0 +1,51 @@
+import numpy as np
+import scipy.ndimage
+
+# Smoothing applied before searching for minima, the same as the contour plots
+MINIMA_SIGMA = 1
+# Alternates suggested besides the global minimum, and how far above it they may lie (kcal/mol)
+DEFAULT_ALTERNATES = 2
+ENERGY_CUTOFF = 2.0
+
+
+def find_minima(grid, sigma=MINIMA_SIGMA):
+    """
+    Finds the local minima of a smoothed PMF surface, treating both axes as periodic.
+
+    A grid point is a minimum when no point of its 3x3 neighbourhood, wrapping around
+    at +-180 degrees, has a lower energy and the neighbourhood is not flat.
+
+    :param grid: PMFGrid to search.
+    :param sigma: Gaussian smoothing applied before the search, 0 to search the raw energies.
+    :return: List of (phi, psi, energy) tuples ordered from lowest to highest energy.
+    """
+    phi, psi, energy = grid.periodic()
+    energy = np.asarray(energy, dtype=np.float64)
+    if sigma:
+        energy = scipy.ndimage.gaussian_filter(energy, sigma=sigma, mode='wrap')
+
+    lowest = scipy.ndimage.minimum_filter(energy, size=3, mode='wrap')
+    highest = scipy.ndimage.maximum_filter(energy, size=3, mode='wrap')
+    i, j = np.nonzero((energy == lowest) & (energy < highest))
+    if i.size == 0:
+        # A flat surface has no distinct minimum, fall back to its first point
+        i, j = np.array([0]), np.array([0])
+
+    order = np.argsort(energy[i, j], kind='stable')
+    i, j = i[order], j[order]
+    return list(zip(phi[i].tolist(), psi[j].tolist(), energy[i, j].tolist()))
+
+
+def select_minima(minima, alternates=DEFAULT_ALTERNATES, cutoff=ENERGY_CUTOFF):
+    """
+    Picks the global minimum and the lowest alternates within an energy cutoff of it.
+
+    :param minima: Minima ordered by energy, as returned by find_minima.
+    :param alternates: Maximum number of alternates besides the global minimum.
+    :param cutoff: Maximum energy above the global minimum of an alternate.
+    :return: List of (phi, psi, energy) tuples, the global minimum first.
+    """
+    if not minima:
+        return []
+    limit = minima[0][2] + cutoff
+    return [minima[0]] + [minimum for minimum in minima[1:alternates + 1] if minimum[2] <= limit]
@@ -0,0 +1,97 @@
+import hashlib
+import os
+
+
+class PlotCache:
+    """
+    An on-disk cache of rendered plot images, evicting the least recently used
+    entries once the cache grows past a size limit.
+    """
+
+    def __init__(self, cache_dir='plot_cache', max_bytes=256 * 1024 * 1024):
+        """
+        Initializes the cache and creates its directory if needed.
+
+        :param cache_dir: Directory holding one PNG file per cached plot.
+        :param max_bytes: Total size the cache may reach before old entries are removed.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(connection, data_hash, sigma, levels, figsize):
+        """
+        Builds the cache key for a plot from everything that affects how it looks.
+
+        :param connection: Linkage name, e.g. 'aDFuc13bDMan'.
+        :param data_hash: Digest of the PMF data the plot is drawn from.
+        :param sigma: Gaussian smoothing applied before contouring.
+        :param levels: Contour levels drawn.
+        :param figsize: Figure size in inches.
+        :return: Hex digest identifying the rendered image.
+        """
+        description = repr((connection, data_hash, float(sigma), [float(level) for level in levels],
+                            tuple(float(size) for size in figsize)))
+        return hashlib.sha256(description.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + '.png')
+
+    def __contains__(self, key):
+        return os.path.exists(self._path(key))
+
+    def get(self, key):
+        """
+        Returns the cached PNG bytes for a key, or None if the plot has not been cached.
+        Reading an entry marks it as recently used.
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as file:
+                data = file.read()
+            os.utime(path)
+        except OSError:
+            return None
+        return data
+
+    def put(self, key, data):
+        """Stores PNG bytes under a key, then evicts old entries if over the size limit."""
+        path = self._path(key)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as file:
+            file.write(data)
+        # Replace atomically so concurrent readers never see a partial image
+        os.replace(temp_path, path)
+        self.evict()
+
+    def evict(self):
+        """Removes least recently used entries until the cache fits within max_bytes."""
+        entries = []
+        total = 0
+        with os.scandir(self.cache_dir) as scan:
+            for entry in scan:
+                if entry.name.endswith('.png'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+
+        if total <= self.max_bytes:
+            return
+
+        entries.sort()
+        for _, size, path in entries:
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def clear(self):
+        """Removes every cached plot."""
+        with os.scandir(self.cache_dir) as scan:
+            for entry in scan:
+                if entry.name.endswith('.png'):
+                    os.remove(entry.path)
@@ -0,0 +1,287 @@
+from functools import partial
+
+from PyQt6.QtCore import Qt, QPointF, QRect, QTimer, pyqtSignal
+from PyQt6.QtGui import QColor, QPainter, QPixmap
+from PyQt6.QtWidgets import QGridLayout, QWidget
+
+from ClickableGraphicsView import ClickableGraphicsView
+
+TILE_WIDTH = 306
+TILE_HEIGHT = 332
+TITLE_HEIGHT = 20
+VIEW_SIZE = 306
+# Rough memory held by a plot view besides its image, used to bound the number of live views
+VIEW_COST = 256 * 1024
+# Bytes per element of a contour path
+PATH_ELEMENT_COST = 24
+
+
+class PlotTile(QWidget):
+    """
+    A grid cell for one linkage. It paints its title and a placeholder itself, and only
+    holds a ClickableGraphicsView while its plot is loaded.
+    """
+
+    def __init__(self, linkage, parent=None):
+        """
+        Initializes an empty tile.
+
+        :param linkage: The connection shown in the tile.
+        :param parent: parent widget.
+        """
+        super().__init__(parent)
+        self.linkage = linkage
+        self.view = None
+        self.cost = 0
+        self.setFixedSize(TILE_WIDTH, TILE_HEIGHT)
+
+    def paintEvent(self, event):
+        """Paints the title and, while no plot is loaded, a placeholder."""
+        painter = QPainter(self)
+        title = QRect(0, 0, 300, TITLE_HEIGHT)
+        painter.fillRect(title, Qt.GlobalColor.white)
+        painter.setPen(Qt.GlobalColor.black)
+        painter.drawRect(title.adjusted(0, 0, -1, -1))
+        painter.drawText(title, Qt.AlignmentFlag.AlignCenter, f"Linkage: {self.linkage}")
+        if self.view is None:
+            painter.setPen(QColor('gray'))
+            painter.drawText(QRect(0, TILE_HEIGHT - VIEW_SIZE, VIEW_SIZE, VIEW_SIZE),
+                             Qt.AlignmentFlag.AlignCenter, "Loading...")
+        painter.end()
+
+    def load(self, plot, molecule_id, dots):
+        """
+        Creates the plot view.
+
+        :param plot: QPixmap of the plot, or its contour paths.
+        :param molecule_id: Position of the linkage in the connections list.
+        :param dots: [x, y] scene positions of the dots to place.
+        :return: The new ClickableGraphicsView.
+        """
+        if isinstance(plot, QPixmap):
+            scaled = plot.scaledToHeight(300)
+            self.view = ClickableGraphicsView(scaled, molecule_id, self)
+            self.cost = scaled.width() * scaled.height() * scaled.depth() // 8
+        else:
+            self.view = ClickableGraphicsView(None, molecule_id, self, contours=plot)
+            self.cost = sum(path.elementCount() for _, _, path, _ in plot) * PATH_ELEMENT_COST
+        self.cost += VIEW_COST
+
+        self.view.setFixedWidth(VIEW_SIZE)
+        self.view.setFixedHeight(VIEW_SIZE)
+        self.view.setViewportMargins(0, 0, 0, 0)
+        self.view.setStyleSheet("""
+                border: none;
+                box-sizing: border-box;
+            """)
+        self.view.move(0, TILE_HEIGHT - VIEW_SIZE)
+        for x, y in dots:
+            self.view.add_dot(QPointF(x, y))
+        self.view.show()
+        self.update()
+        return self.view
+
+    def unload(self):
+        """Deletes the plot view, leaving the placeholder."""
+        if self.view is not None:
+            self.view.setParent(None)
+            self.view.deleteLater()
+            self.view = None
+            self.cost = 0
+            self.update()
+
+
+class PlotGrid(QWidget):
+    """
+    A grid of linkage plots that only keeps the plots in or near the viewport of the
+    scroll area it is placed in.
+
+    Every linkage gets a cheap placeholder tile. As the grid is scrolled, plots_needed
+    asks for the plots of tiles close to the viewport, nearest first, and loaded plots
+    far from the viewport are dropped once their estimated memory exceeds the budget.
+    Dots are kept in the dots model, so they survive their plot being dropped.
+    """
+    plots_needed = pyqtSignal(list)
+    plot_clicked = pyqtSignal(str, int, int)
+    plot_hovered = pyqtSignal(str, float, float)
+
+    def __init__(self, columns=3, memory_budget=64 * 1024 * 1024, prefetch_rows=1, parent=None):
+        """
+        Initializes an empty grid.
+
+        :param columns: Number of plots per row.
+        :param memory_budget: Estimated bytes loaded plots may use before off-screen ones are dropped.
+        :param prefetch_rows: Rows above and below the viewport whose plots are loaded ahead of scrolling.
+        :param parent: parent widget.
+        """
+        super().__init__(parent)
+        self.columns = columns
+        self.memory_budget = memory_budget
+        self.prefetch_rows = prefetch_rows
+        self.linkages = []
+        self.tiles = {}
+        self.dots = {}  # Linkage -> [x, y] scene positions of its dots
+        self.highlighted = None
+
+        # Let style sheets paint the background of the grid
+        self.setAttribute(Qt.WidgetAttribute.WA_StyledBackground, True)
+
+        self.grid_layout = QGridLayout(self)
+        self.grid_layout.setAlignment(Qt.AlignmentFlag.AlignTop | Qt.AlignmentFlag.AlignLeft)
+
+        # Scrolling moves the grid many times a second, look at the viewport once it settles
+        self.update_timer = QTimer(self)
+        self.update_timer.setSingleShot(True)
+        self.update_timer.setInterval(30)
+        self.update_timer.timeout.connect(self.update_visible)
+
+    def set_linkages(self, linkages):
+        """
+        Shows the given linkages, keeping the tiles, plots and dots of linkages that were already shown.
+
+        :param linkages: Ordered list of connections.
+        """
+        for linkage in [linkage for linkage in self.tiles if linkage not in linkages]:
+            tile = self.tiles.pop(linkage)
+            tile.setParent(None)
+            tile.deleteLater()
+            self.dots.pop(linkage, None)
+            if self.highlighted == linkage:
+                self.highlighted = None
+
+        for tile in self.tiles.values():
+            self.grid_layout.removeWidget(tile)
+        for index, linkage in enumerate(linkages):
+            tile = self.tiles.get(linkage)
+            if tile is None:
+                tile = self.tiles[linkage] = PlotTile(linkage, self)
+            elif tile.view is not None:
+                tile.view.set_molecule_id(index)
+            self.grid_layout.addWidget(tile, index // self.columns, index % self.columns)
+        self.linkages = list(linkages)
+        self.update_timer.start()
+
+    def set_plot(self, linkage, plot):
+        """
+        Loads the plot of a linkage into its tile.
+
+        :param linkage: The connection the plot was rendered for.
+        :param plot: QPixmap of the plot, or its contour paths.
+        :return: False if the linkage is not shown in the grid.
+        """
+        tile = self.tiles.get(linkage)
+        if tile is None:
+            return False
+        if tile.view is None:
+            view = tile.load(plot, self.linkages.index(linkage), self.dots.get(linkage, []))
+            view.dots_changed.connect(partial(self._store_dots, linkage))
+            view.clicked.connect(partial(self.plot_clicked.emit, linkage))
+            view.hovered.connect(partial(self.plot_hovered.emit, linkage))
+            if linkage == self.highlighted:
+                view.setStyleSheet("border: 2px solid blue;")
+            self.enforce_budget()
+        return True
+
+    def view(self, linkage):
+        """Returns the ClickableGraphicsView of a linkage, or None if its plot is not loaded."""
+        tile = self.tiles.get(linkage)
+        return tile.view if tile is not None else None
+
+    def set_dots(self, linkage, positions):
+        """
+        Replaces the dots of a linkage, whether or not its plot is loaded.
+
+        :param linkage: The connection to place the dots on.
+        :param positions: [x, y] scene positions.
+        """
+        self.dots[linkage] = [list(position) for position in positions]
+        view = self.view(linkage)
+        if view is not None:
+            view.clear_dots()
+            for x, y in self.dots[linkage]:
+                view.add_dot(QPointF(x, y))
+
+    def dot_positions(self, linkage):
+        """Returns the [x, y] scene positions of the dots of a linkage."""
+        return self.dots.get(linkage, [])
+
+    def highlight(self, linkage):
+        """
+        Outlines the plot of a linkage, removing the outline from the previous one.
+
+        :return: The tile of the linkage, or None if it is not shown.
+        """
+        previous = self.view(self.highlighted) if self.highlighted else None
+        if previous is not None:
+            previous.setStyleSheet("""
+                        border: none;
+                        box-sizing: border-box;
+                    """)
+        if linkage not in self.tiles:
+            return None
+        self.highlighted = linkage
+        view = self.view(linkage)
+        if view is not None:
+            view.setStyleSheet("border: 2px solid blue;")
+        return self.tiles[linkage]
+
+    def loaded_bytes(self):
+        """Estimated memory held by the loaded plots."""
+        return sum(tile.cost for tile in self.tiles.values())
+
+    def visible_rows(self):
+        """Returns the first and last grid rows inside the viewport of the enclosing scroll area."""
+        viewport = self.parentWidget()
+        if viewport is None:
+            area = self.rect()
+        else:
+            # The scroll area scrolls by moving the grid inside its viewport
+            area = QRect(-self.x(), -self.y(), viewport.width(), viewport.height())
+        margins = self.grid_layout.contentsMargins()
+        row_height = TILE_HEIGHT + max(self.grid_layout.verticalSpacing(), 0)
+        first = max(0, (area.top() - margins.top()) // row_height)
+        last = max(first, (area.bottom() - margins.top()) // row_height)
+        return first, last
+
+    def row_distance(self, index, rows):
+        """Number of rows between the tile at index and the visible rows, 0 if it is visible."""
+        row = index // self.columns
+        first, last = rows
+        return first - row if row < first else max(0, row - last)
+
+    def update_visible(self):
+        """Asks for the plots near the viewport, nearest first, and drops distant ones over the budget."""
+        rows = self.visible_rows()
+        wanted = [(self.row_distance(index, rows), index, linkage) for index, linkage in enumerate(self.linkages)
+                  if self.tiles[linkage].view is None and self.row_distance(index, rows) <= self.prefetch_rows]
+        if wanted:
+            self.plots_needed.emit([linkage for _, _, linkage in sorted(wanted)])
+        self.enforce_budget(rows)
+
+    def enforce_budget(self, rows=None):
+        """Drops the loaded plots furthest from the viewport until the rest fit the memory budget."""
+        rows = rows or self.visible_rows()
+        total = self.loaded_bytes()
+        if total <= self.memory_budget:
+            return
+        loaded = sorted(((self.row_distance(index, rows), linkage) for index, linkage in enumerate(self.linkages)
+                         if self.tiles[linkage].view is not None), reverse=True)
+        for distance, linkage in loaded:
+            if total <= self.memory_budget or distance == 0:
+                break
+            tile = self.tiles[linkage]
+            total -= tile.cost
+            tile.unload()
+
+    def moveEvent(self, event):
+        self.update_timer.start()
+        super().moveEvent(event)
+
+    def resizeEvent(self, event):
+        self.update_timer.start()
+        super().resizeEvent(event)
+
+    def _store_dots(self, linkage):
+        view = self.view(linkage)
+        if view is not None:
+            self.dots[linkage] = view.dot_positions()
@@ -1,51 +1,33 @@
+from io import BytesIO
+
+import matplotlib
 import scipy.ndimage
 import matplotlib.pyplot as plt
 from matplotlib import cm
 import scipy.ndimage
 import numpy as np
 
-def plot_pmf_image(molecule, title, data) -> plt.Figure:
-    """Method to create a Ramachandram plot"""
-    x, y, z = [], [], []
-
-    xline, yline, zline = [], [], []
-
-    for line in data:
-        if len(line) >= 3:
-            nextX = line[0]
-            if xline and (xline[-1] != nextX):  # End of row
-                x.append(xline)
-                y.append(yline)
-                z.append(zline)
-                xline, yline, zline = [], [], []
+from ContourRenderer import SMOOTHING_SIGMA, CONTOUR_LEVELS
+from PlotCache import PlotCache
 
-            nextY = line[1]
-            nextZ = line[2]
+# Settings every rendered plot depends on, also used to key the plot cache
+FIGURE_SIZE = (6, 6)
 
-            xline.append(nextX)
-            yline.append(nextY)
-            zline.append(nextZ)
 
-    # Append the last row
-    if xline:
-        x.append(xline)
-        y.append(yline)
-        z.append(zline)
-
-    # Convert lists to numpy arrays for processing
-    x = np.array(x)
-    y = np.array(y)
-    z = np.array(z)
+def plot_pmf_image(molecule, title, grid) -> plt.Figure:
+    """Method to create a Ramachandram plot from a PMFGrid"""
+    # Rows of the energy grid have constant phi
+    x, y = np.meshgrid(grid.phi, grid.psi, indexing='ij')
+    z = grid.energy
 
     # Smoothing data
-    z = scipy.ndimage.gaussian_filter(z, sigma=1)  # Adjust sigma for more or less smoothing
+    z = scipy.ndimage.gaussian_filter(z, sigma=SMOOTHING_SIGMA)  # Adjust sigma for more or less smoothing
 
     # Create the plot
-    fig = plt.figure(figsize=(6, 6))  # Set figure size to be square
+    fig = plt.figure(figsize=FIGURE_SIZE)  # Set figure size to be square
     a = fig.add_subplot(1, 1, 1)
 
-    levs = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]  # Levels to draw contours at
-    CS = a.contour(x, y, z, levs, cmap=cm.coolwarm)
+    CS = a.contour(x, y, z, CONTOUR_LEVELS, cmap=cm.coolwarm)
 
     # Define a class that formats float representation
     class nf(float):
@@ -60,7 +42,7 @@ def plot_pmf_image(molecule, title, data) -> plt.Figure:
     CS.levels = [nf(val) for val in CS.levels]
 
     # Label levels with specially formatted floats
-    plt.clabel(CS, CS.levels, inline=True, fmt='%r ', fontsize=8)
+    a.clabel(CS, CS.levels, inline=True, fmt='%r ', fontsize=8)
 
     # Remove axis labels and ticks
     a.set_xticks([])
@@ -70,8 +52,28 @@ def plot_pmf_image(molecule, title, data) -> plt.Figure:
 
     # Set aspect ratio to be equal and remove margins
     a.set_aspect('equal', adjustable='box')
-    plt.subplots_adjust(left=0.01, right=0.99, top=0.99, bottom=0.01)
-
+    fig.subplots_adjust(left=0.01, right=0.99, top=0.99, bottom=0.01)
 
     return fig
 
+
+def render_pmf_png(molecule, title, grid) -> bytes:
+    """Renders a Ramachandran plot to PNG bytes, closing the figure afterwards."""
+    fig = plot_pmf_image(molecule, title, grid)
+    try:
+        buf = BytesIO()
+        fig.savefig(buf, format='png')
+        return buf.getvalue()
+    finally:
+        plt.close(fig)
+
+
+def plot_cache_key(connection, grid):
+    """Returns the PlotCache key for a connection's plot rendered with the current settings."""
+    return PlotCache.make_key(connection, grid.digest(), SMOOTHING_SIGMA, CONTOUR_LEVELS, FIGURE_SIZE)
+
+
+def init_render_process():
+    """Selects the non-interactive Agg backend in plot rendering processes."""
+    matplotlib.use('Agg')
+
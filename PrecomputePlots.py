@@ -0,0 +1,81 @@
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from DatabaseManager import DatabaseManager
+from PlotCache import PlotCache
+from PlotPMF import render_pmf_png, init_render_process, plot_cache_key
+
+
+def precompute_plots(db_name='carbFF3.db', cache_dir='plot_cache', max_bytes=256 * 1024 * 1024,
+                     workers=None, force=False):
+    """
+    Renders the contour plot of every PMF in the database into the plot cache, and stores
+    the minima of PMFs that have none yet.
+
+    :param db_name: Path of the PMF database.
+    :param cache_dir: Directory of the plot cache shared with the application.
+    :param max_bytes: Size limit of the plot cache.
+    :param workers: Number of rendering processes, one per core if None.
+    :param force: Re-render plots that are already cached.
+    :return: Tuple of (rendered, skipped, failed) counts.
+    """
+    cache = PlotCache(cache_dir, max_bytes)
+    db_manager = DatabaseManager(db_name)
+    file_ids = db_manager.list_file_ids()
+
+    jobs = []
+    skipped = 0
+    for file_id in file_ids:
+        # Also fills in the minima of PMFs imported before they were stored
+        db_manager.query_minima_by_file(file_id)
+        grid = db_manager.query_grid_by_file(file_id)
+        key = plot_cache_key(file_id, grid)
+        if not force and key in cache:
+            skipped += 1
+            continue
+        jobs.append((file_id, grid, key))
+    db_manager.close()
+
+    print(f"{len(file_ids)} PMFs in {db_name}: {skipped} up to date, {len(jobs)} to render")
+
+    rendered = 0
+    failed = 0
+    start_time = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_render_process) as pool:
+        futures = {pool.submit(render_pmf_png, file_id, file_id, grid): (file_id, key)
+                   for file_id, grid, key in jobs}
+        for count, future in enumerate(as_completed(futures), start=1):
+            file_id, key = futures[future]
+            try:
+                cache.put(key, future.result())
+                rendered += 1
+                print(f"[{count}/{len(jobs)}] {file_id}")
+            except Exception as e:
+                failed += 1
+                print(f"[{count}/{len(jobs)}] {file_id} failed: {e}", file=sys.stderr)
+    elapsed = time.perf_counter() - start_time
+
+    if jobs:
+        print(f"Rendered {rendered} plots in {elapsed:.2f} s ({elapsed / len(jobs) * 1000:.1f} ms per plot)")
+    return rendered, skipped, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-render the PMF contour plots into the plot cache.")
+    parser.add_argument('--db', default='carbFF3.db', help="PMF database (default: carbFF3.db)")
+    parser.add_argument('--cache-dir', default='plot_cache', help="plot cache directory (default: plot_cache)")
+    parser.add_argument('--max-mb', type=int, default=256, help="plot cache size limit in MB (default: 256)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help="number of rendering processes (default: one per core)")
+    parser.add_argument('--force', action='store_true', help="re-render plots that are already cached")
+    args = parser.parse_args()
+
+    _, _, failed = precompute_plots(args.db, args.cache_dir, args.max_mb * 1024 * 1024, args.workers, args.force)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
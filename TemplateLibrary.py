@@ -0,0 +1,305 @@
+import hashlib
+import json
+import os
+import re
+import struct
+import tempfile
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+from CarbBuilder import CARBBUILDER_DIR
+
+STRUCTURE_DIR = os.path.join(CARBBUILDER_DIR, "structureFile")
+MAPPING_FILE = os.path.join(STRUCTURE_DIR, "mapping.txt")
+CACHE_FILE = "template_library.bin"
+
+# Cache layout: magic, header length, JSON header, padding up to DATA_ALIGNMENT, then one record per atom
+MAGIC = b"CBTPL002"
+DATA_ALIGNMENT = 64
+
+# Substituent or phosphate CarbBuilder adds to a residue from its own fragment, e.g. the 3Ac of aDGlc3Ac4Me
+_SUBSTITUENT = re.compile(r"\d+[A-Z][A-Za-z]*$")
+
+Template = namedtuple('Template', ['names', 'records', 'coordinates'])
+Template.__doc__ = """
+Residue template read from a structureFile PDB.
+
+names: Atom names, e.g. ('C1', 'C2', ..., 'HO1').
+records: Text of each ATOM line from the atom name up to the coordinates and after them,
+         so the residue name and the force field columns are written back unchanged.
+coordinates: (atoms, 3) array of template coordinates.
+"""
+
+
+def read_mapping(path=MAPPING_FILE):
+    """
+    Reads the CASPER residue names CarbBuilder maps to template files.
+
+    mapping.txt mixes CR and LF line endings, which universal newlines reads as separate lines.
+    Template names are matched case-insensitively, as on the Windows systems CarbBuilder comes from.
+
+    :return: Dict mapping a residue name, e.g. 'aDGlc', to the path of its template.
+    """
+    directory = os.path.dirname(path)
+    files = {name.lower(): name for name in os.listdir(directory)}
+    mapping = {}
+    with open(path, "r", newline=None, errors="replace") as file:
+        for line in file:
+            fields = line.split()
+            if len(fields) < 2 or fields[1].lower() not in files:
+                continue
+            mapping.setdefault(fields[0], os.path.join(directory, files[fields[1].lower()]))
+    return mapping
+
+
+def read_template(path):
+    """
+    Parses the ATOM lines of a template PDB.
+
+    :return: List of (name, element, label, tail, (x, y, z)) tuples, see Template for label and tail.
+    :raises ValueError: If an atom does not have its coordinates in the fixed PDB columns. A few
+                        templates are hand edited and off by a column, so none of their columns
+                        can be trusted.
+    """
+    atoms = []
+    with open(path, "r") as file:
+        for line in file:
+            if not line.startswith(("ATOM", "HETATM")):
+                continue
+            line = line.rstrip("\r\n")
+            name = line[12:16].strip()
+            # The last column of the templates holds CHARMM atom types, so the element comes from the name
+            element = next((char for char in name if char.isalpha()), "")
+            try:
+                xyz = (float(line[30:38]), float(line[38:46]), float(line[46:54]))
+            except ValueError:
+                raise ValueError(f"Unreadable atom in {path}: {line.strip()}")
+            atoms.append((name, element, line[12:26], line[54:].rstrip(), xyz))
+    return atoms
+
+
+def source_fingerprint(mapping_path=MAPPING_FILE):
+    """
+    Fingerprints mapping.txt and the templates it names from their sizes and modification times.
+
+    :return: Tuple of (hex digest, mapping).
+    """
+    mapping = read_mapping(mapping_path)
+    sha = hashlib.sha256()
+    for path in [mapping_path] + sorted(set(mapping.values())):
+        stat = os.stat(path)
+        sha.update(f"{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns}\n".encode("utf-8"))
+    return sha.hexdigest(), mapping
+
+
+def compile_library(cache_path=CACHE_FILE, mapping_path=MAPPING_FILE):
+    """
+    Compiles every mapped residue template into a single cache file.
+
+    Templates shared by several residue names are stored once. Templates read_template cannot
+    read are left out and their residue names listed as unreadable instead. The file is written
+    next to the old one and swapped in, so readers never see a partial cache.
+
+    :return: The header written, see TemplateLibrary.
+    """
+    fingerprint, mapping = source_fingerprint(mapping_path)
+    templates = {}
+    for path in sorted(set(mapping.values())):
+        try:
+            templates[path] = read_template(path)
+        except ValueError:
+            pass
+    atoms = [atom for template in templates.values() for atom in template]
+
+    # Size the text fields to the longest value so no record is truncated
+    dtype = np.dtype([
+        ("name", f"S{max((len(atom[0]) for atom in atoms), default=1)}"),
+        ("element", "S2"),
+        ("label", f"S{max((len(atom[2]) for atom in atoms), default=1)}"),
+        ("tail", f"S{max((len(atom[3]) for atom in atoms), default=1)}"),
+        ("xyz", "<f4", (3,)),
+    ])
+    records = np.array([(name.encode(), element.encode(), label.encode(), tail.encode(), xyz)
+                        for name, element, label, tail, xyz in atoms], dtype=dtype)
+
+    offsets = {}
+    offset = 0
+    for path, template in templates.items():
+        offsets[path] = (offset, len(template))
+        offset += len(template)
+    header = {
+        "fingerprint": fingerprint,
+        "dtype": [list(field) for field in dtype.descr],
+        "atoms": len(records),
+        "index": {name: offsets[path] for name, path in sorted(mapping.items()) if path in offsets},
+        "unreadable": sorted(name for name, path in mapping.items() if path not in offsets),
+    }
+
+    header_bytes = json.dumps(header).encode("utf-8")
+    data_offset = -(-(len(MAGIC) + 8 + len(header_bytes)) // DATA_ALIGNMENT) * DATA_ALIGNMENT
+    handle, temp_path = tempfile.mkstemp(suffix=".tmp", prefix=os.path.basename(cache_path) + ".",
+                                         dir=os.path.dirname(os.path.abspath(cache_path)))
+    try:
+        with os.fdopen(handle, "wb") as file:
+            file.write(MAGIC + struct.pack("<Q", len(header_bytes)) + header_bytes)
+            file.write(b"\0" * (data_offset - file.tell()))
+            file.write(records.tobytes())
+        # mkstemp creates the file readable by its owner only
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, cache_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return header
+
+
+class TemplateLibrary:
+    """
+    The residue templates of CBv2.1.45/structureFile compiled into one memory-mapped file.
+
+    The file starts with a JSON header holding a fingerprint of the sources and an index from
+    residue name to the (offset, count) of its atoms, followed by a structured array with the
+    name, element, PDB columns and float32 coordinates of every atom. The file is recompiled
+    when mapping.txt or a template it names changes. A library can be shared between threads.
+
+    Residues whose template cannot be read are known but have no atoms, so they are not 'in'
+    the library and are left to CarbBuilder.
+    """
+    _cache = {}
+    # Reentrant, as load() opens a library and opening one refreshes it
+    _lock = threading.RLock()
+
+    def __init__(self, cache_path=CACHE_FILE, mapping_path=MAPPING_FILE):
+        """
+        Opens the library, compiling it first if it is missing or out of date.
+
+        :param cache_path: Path of the compiled cache file.
+        :param mapping_path: Path of CarbBuilder's mapping.txt.
+        """
+        self.cache_path = cache_path
+        self.mapping_path = mapping_path
+        self.index = {}
+        self.unreadable = set()
+        self.atoms = None
+        self.fingerprint = None
+        self._templates = {}
+        self.refresh()
+
+    @classmethod
+    def load(cls, cache_path=CACHE_FILE, mapping_path=MAPPING_FILE):
+        """
+        Returns a library shared between callers, opened on first use. Later calls do not
+        check the sources again, call refresh for that.
+
+        :return: TemplateLibrary instance.
+        """
+        with cls._lock:
+            library = cls._cache.get((cache_path, mapping_path))
+            if library is None:
+                library = cls._cache[(cache_path, mapping_path)] = cls(cache_path, mapping_path)
+            return library
+
+    def refresh(self):
+        """
+        Recompiles the cache file if its sources have changed and maps it.
+
+        :return: True if the cache was recompiled.
+        """
+        with self._lock:
+            return self._refresh()
+
+    def _refresh(self):
+        fingerprint, _ = source_fingerprint(self.mapping_path)
+        if fingerprint == self.fingerprint:
+            return False
+
+        header = self._read_header()
+        compiled = header is None or header["fingerprint"] != fingerprint
+        if compiled:
+            # Drop the old mapping first, Windows cannot replace a file that is mapped
+            self.atoms = None
+            compile_library(self.cache_path, self.mapping_path)
+            header = self._read_header()
+
+        dtype = np.dtype([tuple(field[:2]) if len(field) == 2 else (field[0], field[1], tuple(field[2]))
+                          for field in header["dtype"]])
+        self.atoms = np.memmap(self.cache_path, dtype=dtype, mode="r", offset=header["data_offset"],
+                               shape=(header["atoms"],)) if header["atoms"] else np.zeros(0, dtype=dtype)
+        self.index = {name: tuple(span) for name, span in header["index"].items()}
+        self.unreadable = set(header["unreadable"])
+        self.fingerprint = header["fingerprint"]
+        self._templates.clear()
+        return compiled
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def base_residue(self, name):
+        """
+        Strips the substituents and phosphates CarbBuilder builds from separate fragments off a
+        residue name, e.g. aDGlc3Ac4Me -> aDGlc or aDMan1P -> aDMan. Names with a template of
+        their own, such as aDNeu5Ac, are kept whole.
+
+        :return: The name of the residue the template is looked up for.
+        """
+        while not self._mapped(name):
+            match = _SUBSTITUENT.search(name)
+            if not match or not match.start():
+                break
+            name = name[:match.start()]
+        return name
+
+    def unknown_residues(self, residues):
+        """
+        Lists the residue names that have no template, readable or not, once their
+        substituents are stripped, see base_residue.
+
+        :param residues: Residue names, e.g. from CarbUtils.get_residues().
+        :return: The unknown names in order, without repeats.
+        """
+        return [name for name in dict.fromkeys(residues) if not self._mapped(self.base_residue(name))]
+
+    def _mapped(self, name):
+        """Checks whether mapping.txt names a template for a residue, readable or not."""
+        return name in self.index or name in self.unreadable
+
+    def residue_atoms(self, name):
+        """
+        Returns the atom records of a residue as a read-only view of the mapped file.
+
+        :raises KeyError: If the residue has no template.
+        """
+        offset, count = self.index[name]
+        return self.atoms[offset:offset + count]
+
+    def template(self, name):
+        """
+        Returns a residue template decoded for building.
+
+        :raises KeyError: If the residue has no template.
+        """
+        with self._lock:
+            template = self._templates.get(name)
+            if template is None:
+                atoms = self.residue_atoms(name)
+                template = self._templates[name] = Template(
+                    tuple(atoms["name"].astype(str)),
+                    tuple(zip(atoms["label"].astype(str), atoms["tail"].astype(str))),
+                    np.array(atoms["xyz"], dtype=np.float64))
+            return template
+
+    def _read_header(self):
+        """Reads the header of the cache file, or returns None if it is missing or not a cache file."""
+        try:
+            with open(self.cache_path, "rb") as file:
+                if file.read(len(MAGIC)) != MAGIC:
+                    return None
+                (length,) = struct.unpack("<Q", file.read(8))
+                header = json.loads(file.read(length).decode("utf-8"))
+        except (OSError, ValueError, struct.error):
+            return None
+        header["data_offset"] = -(-(len(MAGIC) + 8 + length) // DATA_ALIGNMENT) * DATA_ALIGNMENT
+        return header
@@ -1,10 +1,42 @@
-from io import BytesIO
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 
 from PyQt6.QtCore import QThread, pyqtSignal
 from PyQt6.QtGui import QPixmap
 
+from ClickableGraphicsView import contour_paths
+from ContourRenderer import contour_lines
 from DatabaseManager import DatabaseManager
-from PlotPMF import plot_pmf_image
+from PlotCache import PlotCache
+
+_render_pool = None
+
+
+def render_pool():
+    """
+    Returns the process pool used to render plots, creating it on first use.
+
+    The pool is shared by all workers so the rendering processes only pay the
+    matplotlib start-up cost once per session.
+    """
+    global _render_pool
+    if _render_pool is None:
+        # matplotlib is only imported once PNG plots are actually rendered
+        from PlotPMF import init_render_process
+        _render_pool = ProcessPoolExecutor(max_workers=os.cpu_count(),
+                                           mp_context=multiprocessing.get_context('spawn'),
+                                           initializer=init_render_process)
+    return _render_pool
+
+
+def shutdown_render_pool():
+    """Stops the rendering processes, dropping any plots that have not started yet."""
+    global _render_pool
+    if _render_pool is not None:
+        _render_pool.shutdown(wait=False, cancel_futures=True)
+        _render_pool = None
 
 
 class Worker(QThread):
@@ -13,41 +45,53 @@ class Worker(QThread):
     when the images are ready.
     """
     image_ready = pyqtSignal(int, QPixmap)
+    contours_ready = pyqtSignal(int, object)
     error_occurred = pyqtSignal(str)
 
-    def __init__(self, connections):
+    def __init__(self, connections, plot_cache=None, contours=False):
         """
         Initializes the Worker with a list of connections.
 
         :param connections: List of connections for which images will be generated.
+        :param plot_cache: PlotCache holding previously rendered images, a default cache is used if None.
+        :param contours: Emit vector contour paths with contours_ready instead of PNG images with image_ready.
         """
         super().__init__()
         self.connections = connections
+        self.contours = contours
+        self.plot_cache = plot_cache if plot_cache is not None or contours else PlotCache()
 
     def run(self):
         """
         Executes the thread's task of generating images for each connection.
+        Cached plots are emitted straight away, the rest are rendered in parallel
+        and emitted in the order they finish.
         """
+        if self.contours:
+            self.run_contours()
+            return
+
+        from PlotPMF import render_pmf_png, plot_cache_key
 
         # Create a new database connection in the worker thread
         db_manager = DatabaseManager()
+        pool = render_pool()
+        futures = {}
 
         for index, connection in enumerate(self.connections):
             try:
                 # get data for the current connection
-                data = db_manager.query_data_by_file(connection)
-                if data is None:
+                grid = db_manager.query_grid_by_file(connection)
+                if grid is None:
                     raise FileNotFoundError(f"No data found in the database for {connection}")
 
-                # Plot the image using the retrieved data
-                fig = plot_pmf_image(connection, connection,data)
-                buf = BytesIO()
-                fig.savefig(buf, format='png')
-                buf.seek(0)
-                pixmap = QPixmap()
-                pixmap.loadFromData(buf.getvalue())
-                buf.close()
-                self.image_ready.emit(index, pixmap)
+                key = plot_cache_key(connection, grid)
+                png = self.plot_cache.get(key)
+                if png is not None:
+                    self.emit_image(index, png)
+                    continue
+
+                futures[pool.submit(render_pmf_png, connection, connection, grid)] = (index, connection, key)
             except Exception as e:
                 error_message = f"Error generating image for {connection}: {e}"
                 self.error_occurred.emit(error_message)
@@ -56,5 +100,35 @@ class Worker(QThread):
         # Close the database connection in the worker thread
         db_manager.close()
 
+        for future in as_completed(futures):
+            index, connection, key = futures[future]
+            try:
+                png = future.result()
+                self.plot_cache.put(key, png)
+                self.emit_image(index, png)
+            except BrokenProcessPool as e:
+                # A rendering process died, start a fresh pool for the next request
+                shutdown_render_pool()
+                self.error_occurred.emit(f"Error generating image for {connection}: {e}")
+            except Exception as e:
+                error_message = f"Error generating image for {connection}: {e}"
+                self.error_occurred.emit(error_message)
 
+    def emit_image(self, index, png):
+        """Converts PNG bytes to a QPixmap and emits it for the connection at index."""
+        pixmap = QPixmap()
+        pixmap.loadFromData(png)
+        self.image_ready.emit(index, pixmap)
 
+    def run_contours(self):
+        """Computes the contour paths of each connection and emits them in order."""
+        db_manager = DatabaseManager()
+        for index, connection in enumerate(self.connections):
+            try:
+                grid = db_manager.query_grid_by_file(connection)
+                if grid is None:
+                    raise FileNotFoundError(f"No data found in the database for {connection}")
+                self.contours_ready.emit(index, contour_paths(contour_lines(grid)))
+            except Exception as e:
+                self.error_occurred.emit(f"Error generating image for {connection}: {e}")
+        db_manager.close()
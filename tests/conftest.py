@@ -0,0 +1,25 @@
+import os
+import re
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The modules live at the top of the repository rather than in a package
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(scope="session")
+def readme_sequences():
+    """The example CASPER sequences of README.txt and the CarbBuilder README."""
+    with open(os.path.join(ROOT, "README.txt")) as file:
+        text = file.read()
+    sequences = re.findall(r"^- (\S+\(\S+)$", text, re.MULTILINE)
+    sequences += re.findall(r'^- python \S+ "([^"]+)"', text, re.MULTILINE)
+
+    with open(os.path.join(ROOT, "CBv2.1.45", "README.md")) as file:
+        text = file.read()
+    sequences += re.findall(r'-i\s+"([^"]+)"', text)
+    sequences += re.findall(r"^\d\. [\w ,-]+?:?[ \t]+(\S*[^:\s])[ \t]*$", text, re.MULTILINE)
+    return list(dict.fromkeys(sequences))
@@ -0,0 +1,42 @@
+import os
+
+import BatchBuilder
+from BuildCache import BuildCache
+
+PDB_TEXT = "ATOM      1  C1  GLC     1       0.000   0.000   0.000  1.00  0.00           C\nEND\n"
+
+
+def fake_carbbuilder(sequence, work_dir, dihedral_text, repeats=None, timeout=None):
+    pdb_path = os.path.join(work_dir, "output.pdb")
+    with open(pdb_path, "w") as file:
+        file.write(PDB_TEXT)
+    return {"sequence": sequence, "pdb_path": pdb_path, "final_linkages": [], "returncode": 0,
+            "stdout": "", "stderr": "", "wall_time": 0.0}
+
+
+class FullCache(BuildCache):
+    def put(self, key, pdb_path, final_linkages):
+        raise OSError(28, "No space left on device")
+
+
+class EvictedCache(BuildCache):
+    def get(self, key):
+        return os.path.join(self.cache_dir, "evicted", "output.pdb"), []
+
+
+def _build(tmp_path, monkeypatch, cache):
+    monkeypatch.setattr(BatchBuilder, "run_carbbuilder", fake_carbbuilder)
+    return BatchBuilder.build_batch([("aDGlc", None)], str(tmp_path / "out"), workers=1,
+                                    db_name=str(tmp_path / "test.db"), build_cache=cache, dihedral_texts=[""])
+
+
+def test_cache_write_failure_keeps_the_build(tmp_path, monkeypatch):
+    result, = _build(tmp_path, monkeypatch, FullCache(str(tmp_path / "cache")))
+    assert result["pdb_path"] and os.path.exists(result["pdb_path"])
+    assert not result["cached"]
+
+
+def test_evicted_cache_entry_is_built_again(tmp_path, monkeypatch):
+    result, = _build(tmp_path, monkeypatch, EvictedCache(str(tmp_path / "cache")))
+    assert result["pdb_path"] and os.path.exists(result["pdb_path"])
+    assert not result["cached"]
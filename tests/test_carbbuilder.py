@@ -0,0 +1,25 @@
+from CarbBuilder import extract_final_linkages, parse_final_linkage
+
+# Lines as CarbBuilder2.exe prints them: FINAL linkage: #{5} {0} ({7}->{4}) #{6} {1}: {2}, {3}
+CARBBUILDER_OUTPUT = """Reading sequence
+FINAL linkage: #2 aDFuc (1->3) #1 bDMan: -70.5, 100.2\r
+FINAL linkage: #3 bDMan (1->2) #2 aDMan: 39.2, -109
+PDB file Built
+"""
+
+
+def test_extract_final_linkages():
+    assert extract_final_linkages(CARBBUILDER_OUTPUT) == [
+        "Linkage:  aDFuc (1->3)  bDMan, Angles: -70.5, 100.2",
+        "Linkage:  bDMan (1->2)  aDMan, Angles: 39.2, -109",
+    ]
+
+
+def test_parse_final_linkage_reads_carbbuilder_lines():
+    parsed = [parse_final_linkage(line) for line in extract_final_linkages(CARBBUILDER_OUTPUT)]
+    assert parsed == [("aDFuc13bDMan", -70.5, 100.2), ("bDMan12aDMan", 39.2, -109.0)]
+
+
+def test_parse_final_linkage_rejects_other_lines():
+    assert parse_final_linkage("Linkage: aDFuc, Angles: unknown") is None
+    assert parse_final_linkage("") is None
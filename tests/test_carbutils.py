@@ -0,0 +1,80 @@
+import re
+
+import pytest
+
+from CarbUtils import CarbUtils, parse_casper
+
+
+def test_linear():
+    tree = parse_casper("aDFuc(1->3)bDMan(1->2)aDMan")
+    assert tree.residues == ("aDFuc", "bDMan", "aDMan")
+    assert tree.linkages == ((0, "1", "3", 1), (1, "1", "2", 2))
+    assert tree.repeating is None
+
+
+def test_branch_links_to_the_residue_after_the_bracket():
+    tree = parse_casper("aDMan(1->4)[aDGal(1->6)]aDGlc")
+    assert tree.residues == ("aDMan", "aDGal", "aDGlc")
+    assert tree.linkages == ((0, "1", "4", 2), (1, "1", "6", 2))
+
+
+def test_nested_branches():
+    tree = parse_casper("aDMan(1->6)[aDMan(1->3)[aDMan(1->6)]aDMan(1->2)]aDMan")
+    assert tree.linkages == ((0, "1", "6", 4), (1, "1", "3", 3), (2, "1", "6", 3), (3, "1", "2", 4))
+
+
+def test_phosphate_linkage():
+    tree = parse_casper("aDMan1P(O->6)aDMan")
+    assert tree.residues == ("aDMan1P", "aDMan")
+    assert tree.linkages == ((0, "O", "6", 1),)
+
+
+def test_substituents_stay_part_of_the_residue():
+    assert parse_casper("aDGlc3Ac4Me").residues == ("aDGlc3Ac4Me",)
+
+
+@pytest.mark.parametrize("sequence", ["->6)aDMan(1->4)aDGlc(1->", "->6)aDMan(1-4)aDGlc(1->"])
+def test_repeating_unit_links_back_to_its_first_residue(sequence):
+    tree = parse_casper(sequence)
+    assert tree.residues == ("aDMan", "aDGlc")
+    assert tree.linkages == ((0, "1", "4", 1), (1, "1", "6", 0))
+    assert tree.repeating == (1, "1", "6", 0)
+
+
+def test_readme_n_mannan(readme_sequences):
+    sequence = next(sequence for sequence in readme_sequences if "aDMan1P(O->6)]" in sequence)
+    tree = parse_casper(sequence)
+    assert list(tree.residues) == re.findall(r"[ab][DL]\w+", sequence)
+    # A tree: every residue but the reducing end is the child of exactly one linkage
+    assert sorted(child for child, _, _, _ in tree.linkages) == list(range(len(tree.residues) - 1))
+    assert all(parent > child for child, _, _, parent in tree.linkages)
+    assert (tree.residues.index("aDMan1P"), "O", "6") in [linkage[:3] for linkage in tree.linkages]
+
+
+def test_readme_examples_parse(readme_sequences):
+    for sequence in readme_sequences:
+        tree = parse_casper(sequence)
+        expected = len(tree.residues) - (tree.repeating is None)
+        assert len(tree.linkages) == expected, sequence
+
+
+def test_connections():
+    carb_utils = CarbUtils("aDMan(1->4)[aDGal(1->6)]aDGlc")
+    carb_utils.parse_sequence()
+    assert carb_utils.get_residues() == ["aDMan", "aDGal", "aDGlc"]
+    assert carb_utils.get_connections() == ["aDMan14aDGlc", "aDGal16aDGlc"]
+
+
+@pytest.mark.parametrize("sequence", [
+    "",
+    "aDGlc(1->4)",
+    "[aDGlc",
+    "aDGlc]",
+    "aDGlc aDGlc",
+    "aDGlc(1->4)[aDGal]aDGlc",
+    "->4)aDGlc",
+    "aDGlc(1->4)aDGlc(1->",
+])
+def test_invalid_sequences(sequence):
+    with pytest.raises(ValueError):
+        parse_casper(sequence)
@@ -0,0 +1,31 @@
+import json
+import sqlite3
+
+import numpy as np
+
+from DatabaseManager import DatabaseManager
+
+
+def test_json_pmfs_are_migrated_to_binary_grids(tmp_path):
+    db_name = str(tmp_path / "old.db")
+    points = [(phi, psi, phi * 0.01 - psi * 0.02) for phi in (-180, -170, -160) for psi in (-180, -170)]
+    conn = sqlite3.connect(db_name)
+    conn.execute("CREATE TABLE pmfs (file_id TEXT PRIMARY KEY, data TEXT)")
+    conn.execute("INSERT INTO pmfs VALUES (?, ?)", ("aDGlc14aDGlc", json.dumps(points)))
+    conn.commit()
+    conn.close()
+
+    db_manager = DatabaseManager(db_name)
+    try:
+        grid = db_manager.query_grid_by_file("aDGlc14aDGlc")
+        db_manager.cursor.execute("SELECT name FROM pragma_table_info('pmfs')")
+        columns = {row[0] for row in db_manager.cursor.fetchall()}
+    finally:
+        db_manager.close()
+
+    assert "data" not in columns and "energy" in columns
+    assert grid.phi.tolist() == [-180, -170, -160]
+    assert grid.psi.tolist() == [-180, -170]
+    expected = np.array([[energy for phi, _, energy in points if phi == row] for row in (-180, -170, -160)])
+    assert np.allclose(grid.energy, expected)
+    assert grid.energy.dtype == np.float32
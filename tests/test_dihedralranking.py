@@ -0,0 +1,44 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from DihedralRanking import combination_dihedrals, rank_combinations
+
+
+def brute_force(energies, top_k):
+    combinations = sorted((sum(energy[i] for energy, i in zip(energies, choice)), choice)
+                          for choice in itertools.product(*(range(len(energy)) for energy in energies)))
+    return combinations[:top_k]
+
+
+@pytest.mark.parametrize("seed", range(20))
+@pytest.mark.parametrize("top_k", [1, 3, 10])
+def test_rank_combinations_matches_brute_force(seed, top_k):
+    rng = np.random.default_rng(seed)
+    energies = [rng.uniform(0.0, 5.0, rng.integers(1, 5)) for _ in range(rng.integers(1, 6))]
+    choices, totals = rank_combinations(energies, top_k)
+
+    expected = brute_force(energies, top_k)
+    assert np.allclose(totals, [total for total, _ in expected])
+    assert len(choices) == len(expected)
+    for choice, total in zip(choices, totals):
+        assert sum(energy[i] for energy, i in zip(energies, choice)) == pytest.approx(total)
+    assert np.all(np.diff(totals) >= 0)
+
+
+def test_rank_combinations_with_ties():
+    choices, totals = rank_combinations([np.array([1.0, 1.0]), np.array([0.0, 0.0])], top_k=3)
+    assert totals.tolist() == [1.0, 1.0, 1.0]
+    assert len({tuple(choice) for choice in choices.tolist()}) == 3
+
+
+def test_linkage_without_alternatives_is_left_to_carbbuilder():
+    choices, totals = rank_combinations([np.array([2.0, 1.0]), np.zeros(0), np.array([0.5])], top_k=5)
+    assert choices.tolist() == [[1, -1, 0], [0, -1, 0]]
+    assert totals.tolist() == [1.5, 2.5]
+
+
+def test_combination_dihedrals():
+    text = combination_dihedrals(["aDFuc13bDMan"], [[(-70.0, 100.0), (60.0, -120.0)]], [1])
+    assert text == "aDFuc 1 3 bDMan,2,60.0 -120.0\n"
@@ -0,0 +1,39 @@
+import os
+
+import numpy as np
+import pytest
+
+from CarbBuilder import parse_final_linkage
+from GlycanBuilder import dihedral, place_atom, superpose
+from TemplateLibrary import MAPPING_FILE
+
+
+def test_place_atom_sets_bond_angle_and_torsion():
+    a, b, c = np.array([0.0, 1.0, 0.0]), np.array([0.0, 0.0, 0.0]), np.array([1.5, 0.0, 0.0])
+    d = place_atom(a, b, c, 1.4, 110.0, -60.0)
+    assert np.linalg.norm(d - c) == pytest.approx(1.4)
+    cos_angle = np.dot(b - c, d - c) / (np.linalg.norm(b - c) * np.linalg.norm(d - c))
+    assert np.degrees(np.arccos(cos_angle)) == pytest.approx(110.0)
+    assert dihedral(a, b, c, d) == pytest.approx(-60.0)
+
+
+def test_superpose_recovers_rotation():
+    rng = np.random.default_rng(0)
+    points = rng.normal(size=(5, 3))
+    angle = np.radians(40.0)
+    rotation = np.array([[np.cos(angle), -np.sin(angle), 0.0], [np.sin(angle), np.cos(angle), 0.0], [0.0, 0.0, 1.0]])
+    found, translation = superpose(points, points @ rotation.T + [1.0, 2.0, 3.0])
+    assert np.allclose(found, rotation)
+    assert np.allclose(translation, [1.0, 2.0, 3.0])
+
+
+@pytest.mark.skipif(not os.path.exists(MAPPING_FILE), reason="CarbBuilder templates not available")
+def test_native_linkages_read_like_carbbuilder(tmp_path):
+    from GlycanBuilder import build_glycan, read_dihedral_angles
+    from TemplateLibrary import TemplateLibrary
+
+    library = TemplateLibrary(str(tmp_path / "library.bin"))
+    angles = read_dihedral_angles("bDGlc 1 4 bDGlc,2,-70.0 100.0\n")
+    _, final_linkages = build_glycan("bDGlc(1->4)bDGlc", angles, library)
+    assert final_linkages == ["Linkage:  bDGlc (1->4)  bDGlc, Angles: -70.0, 100.0"]
+    assert parse_final_linkage(final_linkages[0]) == ("bDGlc14bDGlc", -70.0, 100.0)
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from PDBReader import PDBReader
+
+ATOMS = [
+    ("C1", "C"),
+    ("HO1", "HO"),  # CHARMM atom type in the element column of a CarbBuilder template
+    ("P1", " H"),
+    ("CL1", "CL"),
+]
+
+
+def _record(serial, name, element, x):
+    return f"ATOM  {serial:5d} {name:<4} GLC     1    {x:8.3f}{0.0:8.3f}{0.0:8.3f}  1.00  0.00          {element:>2}\n"
+
+
+@pytest.fixture
+def ensemble(tmp_path):
+    path = tmp_path / "ensemble.pdb"
+    frames = []
+    for frame in range(3):
+        records = "".join(_record(serial + 1, name, element, frame + serial)
+                          for serial, (name, element) in enumerate(ATOMS))
+        frames.append(f"MODEL     {frame + 1:4d}\n{records}ENDMDL\n")
+    path.write_text("".join(frames) + "END\n")
+    return str(path)
+
+
+def test_frames_are_indexed(ensemble):
+    with PDBReader(ensemble) as reader:
+        assert len(reader) == 3
+        assert np.allclose(reader.coordinates(2)[:, 0], [2.0, 3.0, 4.0, 5.0])
+        assert "MODEL" not in reader.text(1)
+
+
+def test_elements_come_from_atom_names(ensemble):
+    with PDBReader(ensemble) as reader:
+        atoms = reader.atoms()
+    assert atoms["name"].tolist() == ["C1", "HO1", "P1", "CL1"]
+    assert atoms["element"].tolist() == ["C", "H", "P", "Cl"]
+
+
+def test_file_without_models_is_one_frame(tmp_path):
+    path = tmp_path / "single.pdb"
+    path.write_text(_record(1, "O5", "O", 1.5) + "END\n")
+    with PDBReader(str(path)) as reader:
+        assert len(reader) == 1
+        assert reader.atoms()["element"].tolist() == ["O"]
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from PMFGrid import PMFGrid
+
+
+def test_parse_points_skips_comments_and_blank_lines():
+    points = PMFGrid.parse_points("# phi psi energy\n-180 -180 1.5\n\n-180 -170 2.0 # note\n-170 -180 0.5\r\n")
+    assert points.tolist() == [[-180.0, -180.0, 1.5], [-170.0, -180.0, 0.5]]
+
+
+def test_parse_points_empty():
+    assert PMFGrid.parse_points("# only a comment\n").shape == (0, 3)
+
+
+@pytest.mark.parametrize("text", [
+    "-180 -180\n1.0 -180 -170 2.0\n",
+    "-180 -180 1.0 2.0\n",
+    "-180 -180\n",
+    "-180 -180 high\n",
+])
+def test_parse_points_rejects_lines_without_three_numbers(text):
+    with pytest.raises(ValueError):
+        PMFGrid.parse_points(text)
+
+
+def _points(phi, psi):
+    return [(a, b, a * 0.01 + b * 0.001) for a in phi for b in psi]
+
+
+def test_from_points_in_any_order():
+    points = _points([-180, -170, -160], [-180, -170])
+    grid = PMFGrid.from_points(points[::-1])
+    assert grid.phi.tolist() == [-180, -170, -160]
+    assert grid.psi.tolist() == [-180, -170]
+    assert grid.energy.shape == (3, 2)
+    assert grid.energy[1, 0] == pytest.approx(-170 * 0.01 - 180 * 0.001)
+
+
+def test_from_points_rejects_missing_points():
+    with pytest.raises(ValueError, match="missing"):
+        PMFGrid.from_points(_points([-180, -170], [-180, -170])[1:])
+
+
+def test_from_points_rejects_duplicates():
+    points = _points([-180, -170], [-180, -170])
+    with pytest.raises(ValueError, match="more than once"):
+        PMFGrid.from_points(points + points[:1])
+
+
+def test_from_points_rejects_no_points():
+    with pytest.raises(ValueError):
+        PMFGrid.from_points([])
+
+
+def test_metadata_round_trip():
+    grid = PMFGrid.from_points(_points([-180, -170, -160], [-180, -170, -160, -150]))
+    rebuilt = PMFGrid.from_metadata(*grid.metadata(), grid.energy.ravel())
+    assert np.allclose(rebuilt.phi, grid.phi)
+    assert np.allclose(rebuilt.psi, grid.psi)
+    assert np.array_equal(rebuilt.energy, grid.energy)
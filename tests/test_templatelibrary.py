@@ -0,0 +1,38 @@
+import os
+
+import pytest
+
+from CarbUtils import parse_casper
+from TemplateLibrary import MAPPING_FILE, TemplateLibrary
+
+pytestmark = pytest.mark.skipif(not os.path.exists(MAPPING_FILE), reason="CarbBuilder templates not available")
+
+
+@pytest.fixture(scope="module")
+def library(tmp_path_factory):
+    return TemplateLibrary(str(tmp_path_factory.mktemp("library") / "library.bin"))
+
+
+def test_readme_examples_have_templates(library, readme_sequences):
+    assert len(readme_sequences) >= 10
+    for sequence in readme_sequences:
+        assert library.unknown_residues(parse_casper(sequence).residues) == [], sequence
+
+
+@pytest.mark.parametrize("name, base", [
+    ("aDGlc3Ac4Me", "aDGlc"),
+    ("aDMan1P", "aDMan"),
+    ("aDNeu5Ac", "aDNeu5Ac"),
+    ("aDGlc6A", "aDGlc6A"),
+])
+def test_base_residue_strips_substituents(library, name, base):
+    assert library.base_residue(name) == base
+
+
+def test_unknown_residues(library):
+    assert library.unknown_residues(["aDGlc", "xDFoo", "aDGlc3Ac", "xDFoo"]) == ["xDFoo"]
+
+
+def test_substituted_residues_are_not_built_natively(library):
+    assert "aDGlc" in library
+    assert "aDMan1P" not in library